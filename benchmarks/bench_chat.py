@@ -0,0 +1,262 @@
+"""
+Benchmark: end-to-end /chat throughput and latency, fully offline.
+
+Every dependency is replaced by a deterministic in-process stand-in:
+
+- LLM: `FakeLLM`, canned answers per prompt template after a fixed latency, behind the real `CachedLLM`.
+- Redis: fakeredis, behind the real connection pool, history, checkpointer and ticket outbox.
+- SAP / ServiceNow: the mock FastAPI apps over `httpx.ASGITransport`, through the real clients.
+- Guardrails: the stub guard from `bench_guardrails`.
+- Long-term memory: the real write-behind buffer over a temporary SQLite file.
+
+Scripted sessions (greeting -> PO -> satisfied, and Non-PO with 50 invoices -> not satisfied
+-> ticket) are driven through the FastAPI app concurrently. The report has turns/s, p50/p95/p99
+turn latency, LLM and SAP calls per turn and the peak traced allocation per turn (a separate,
+sequential tracemalloc pass).
+
+`--check` only gates on the work done per turn (LLM calls, SAP calls, allocations), which does
+not depend on the machine. Throughput and latency are printed next to the baseline for
+information; wall-clock numbers from another machine or a busy one are not comparable.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_chat                      # print the report
+    python -m benchmarks.bench_chat --save-baseline      # write benchmarks/baselines/bench_chat.json
+    python -m benchmarks.bench_chat --check              # exit 1 if a turn does more work than the baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List
+
+os.environ.setdefault("LLM_PROVIDER", "openai")
+os.environ.setdefault("LLM_API_KEY", "benchmark")
+os.environ.setdefault("LLM_MODEL_NAME", "fake-model")
+
+import fakeredis
+import httpx
+from fakeredis.aioredis import FakeAsyncRedisConnection
+from langchain_core.messages import AIMessage
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from benchmarks.bench_guardrails import StubGuard
+from src import main
+from src.agents import nodes, prompts
+from src.agents.tools import ticket_outbox
+from src.agents.tools.mock_sap import create_mock_sap_app
+from src.agents.tools.mock_servicenow import create_mock_servicenow_app
+from src.core import http
+from src.core.config import settings
+from src.core.llm_cache import CachedLLM
+from src.memory import long_term, short_term
+from src.utils import guardrails
+
+BASELINE_PATH = Path(__file__).parent / "baselines" / "bench_chat.json"
+
+# Each canned answer is chosen by the static opening text of its prompt template.
+CANNED_RESPONSES = [
+    (prompts.intent_identification_prompt, "GREETING"),
+    (prompts.po_details_extraction_prompt, '{"po_number": "4500012345", "invoice_number": "9000123", "check_all_for_po": false}'),
+    (prompts.non_po_details_extraction_prompt, '{"invoices": []}'),
+]
+
+NON_PO_ROWS = "\n".join(f"ACR{i:05d}, 2024-03-{i % 28 + 1:02d}" for i in range(50))
+
+CONVERSATIONS = {
+    "po_satisfied": [
+        "can you help me out with {i}",  # unique per session and not resolved by the fast path: one LLM call
+        "I want the status of my PO invoice",
+        "4500012345, 9000123",
+        "yes",
+    ],
+    "non_po_ticket": [
+        "I need the status of my non-PO invoices",
+        NON_PO_ROWS,
+        "no",
+    ],
+}
+
+class FakeLLM:
+    """Answers each prompt template with a canned response after `latency` seconds."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    async def ainvoke(self, prompt, prompt_type: str = "default", **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        content = "GREETING"
+        for template, response in CANNED_RESPONSES:
+            if prompt.strip().startswith(template.template.split("{")[0].strip()):
+                content = response
+        return AIMessage(content=content, usage_metadata={"input_tokens": len(prompt) // 4, "output_tokens": 8, "total_tokens": len(prompt) // 4 + 8})
+
+async def set_up(db_path: str, llm, sap_transport: httpx.AsyncBaseTransport, servicenow_transport: httpx.AsyncBaseTransport):
+    """Points every dependency of the app at its in-process stand-in."""
+    settings.sap_api_url = "http://sap.test"
+    settings.servicenow_instance_url = "http://servicenow.test"
+    short_term.init_redis_pool(
+        connection_class=FakeAsyncRedisConnection,
+        server=fakeredis.FakeServer(),
+        max_connections=settings.redis_max_connections,
+    )
+    http.init_http_clients(transports={"sap": sap_transport, "servicenow": servicenow_transport})
+    nodes.llm = llm
+    guardrails._guard = StubGuard()
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(long_term.Base.metadata.create_all)
+    long_term._record_buffer = long_term.ConversationRecordBuffer(async_sessionmaker(bind=engine, expire_on_commit=False))
+    long_term._record_buffer.start()
+    ticket_outbox.start_ticket_workers()
+    return engine
+
+async def tear_down(engine) -> None:
+    await ticket_outbox.stop_ticket_workers()
+    await long_term.stop_record_buffer()
+    await http.close_http_clients()
+    await short_term.close_redis_pool()
+    await engine.dispose()
+
+async def run_conversation(client: httpx.AsyncClient, session_id: str, script: List[str], latencies: List[float]) -> None:
+    for message in script:
+        message = message.replace("{i}", session_id)
+        started = time.perf_counter()
+        response = await client.post("/chat", json={"session_id": session_id, "message": message})
+        latencies.append(time.perf_counter() - started)
+        response.raise_for_status()
+
+def percentile(samples: List[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+async def measure(args) -> Dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        fake_llm = FakeLLM(latency=args.llm_latency_ms / 1000)
+        mock_sap = create_mock_sap_app(latency_seconds=args.sap_latency_ms / 1000)
+        engine = await set_up(
+            os.path.join(tmp, "records.db"),
+            CachedLLM(fake_llm, model_name="fake-model"),
+            httpx.ASGITransport(app=mock_sap),
+            httpx.ASGITransport(app=create_mock_servicenow_app(latency_seconds=args.servicenow_latency_ms / 1000)),
+        )
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://chat.test")
+        try:
+            # Warm-up: imports, compiled regexes, first connections.
+            for name, script in CONVERSATIONS.items():
+                await run_conversation(client, f"warmup-{name}", script, [])
+
+            latencies: List[float] = []
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def session(i: int):
+                name = list(CONVERSATIONS)[i % len(CONVERSATIONS)]
+                async with semaphore:
+                    await run_conversation(client, f"bench-{i}", CONVERSATIONS[name], latencies)
+
+            # Counted at the provider, so calls served by CachedLLM are not included.
+            fake_llm.calls = 0
+            mock_sap.state.requests = 0
+            started = time.perf_counter()
+            await asyncio.gather(*[session(i) for i in range(args.sessions)])
+            elapsed = time.perf_counter() - started
+            llm_calls, sap_calls = fake_llm.calls, mock_sap.state.requests
+
+            # Allocation pass: sequential, so each turn's peak is its own.
+            peaks: List[int] = []
+            tracemalloc.start()
+            for name, script in CONVERSATIONS.items():
+                for message in script:
+                    tracemalloc.reset_peak()
+                    baseline, _ = tracemalloc.get_traced_memory()
+                    session_id = f"alloc-{name}"
+                    response = await client.post("/chat", json={"session_id": session_id, "message": message.replace("{i}", session_id)})
+                    response.raise_for_status()
+                    peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+            tracemalloc.stop()
+        finally:
+            await client.aclose()
+            await tear_down(engine)
+
+    return {
+        "turns": len(latencies),
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "llm_latency_ms": args.llm_latency_ms,
+        "sap_latency_ms": args.sap_latency_ms,
+        "turns_per_second": round(len(latencies) / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "mean": round(statistics.fmean(latencies) * 1000, 2),
+        },
+        "llm_calls_per_turn": round(llm_calls / len(latencies), 3),
+        "sap_calls_per_turn": round(sap_calls / len(latencies), 3),
+        "alloc_peak_kib_per_turn": round(statistics.fmean(peaks) / 1024, 1),
+    }
+
+# Work per turn, gated by --check: (report key, unit, absolute slack). The slack absorbs the odd
+# hedged SAP request or cache race that a timing difference can add.
+GATED_METRICS = (
+    ("llm_calls_per_turn", "LLM calls/turn", 0.01),
+    ("sap_calls_per_turn", "SAP calls/turn", 0.01),
+    ("alloc_peak_kib_per_turn", "KiB allocation peak/turn", 0.0),
+)
+
+def check(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Regressions of the work per turn beyond `tolerance` (a fraction) against the baseline."""
+    problems = []
+    for key, unit, slack in GATED_METRICS:
+        if key in baseline and report[key] > baseline[key] * (1 + tolerance) + slack:
+            problems.append(f"{report[key]} {unit} > baseline {baseline[key]}")
+    return problems
+
+def timing_notes(report: Dict, baseline: Dict) -> List[str]:
+    """Wall-clock numbers next to the baseline's; machine-dependent, so never a failure."""
+    notes = [f"throughput {report['turns_per_second']} turns/s (baseline {baseline['turns_per_second']})"]
+    for p in ("p50", "p95", "p99"):
+        notes.append(f"{p} {report['latency_ms'][p]} ms (baseline {baseline['latency_ms'][p]} ms)")
+    return notes
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--llm-latency-ms", type=float, default=20.0)
+    parser.add_argument("--sap-latency-ms", type=float, default=10.0)
+    parser.add_argument("--servicenow-latency-ms", type=float, default=10.0)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="exit 1 when a turn does more work than the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression as a fraction")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(measure(args))
+    print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"baseline written to {args.baseline}")
+    if args.check:
+        baseline = json.loads(args.baseline.read_text())
+        for note in timing_notes(report, baseline):
+            print(f"info: {note}")
+        problems = check(report, baseline, args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        return 1 if problems else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
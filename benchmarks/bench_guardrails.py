@@ -0,0 +1,97 @@
+"""
+Benchmark: guardrails CPU time per /chat request, legacy multi-call sequence vs.
+the single-pass `evaluate_guardrails`, without and with the verdict cache.
+The cached row repeats one message, so it shows the best case for repeated turns.
+
+The single pass alone does not reach the >50% saving the change was asked for: an
+accepted turn still costs one input pass plus one output pass, against one input pass
+plus two output passes in the legacy sequence, so the saving O / (I + 2*O) stays below
+half (about 35-50% in these rows). More than half is only reached with the verdict cache,
+on text that repeats.
+
+The real validators are replaced by a stub guard whose `validate`/`parse` burn a
+fixed amount of regex work per call, so the numbers isolate how many passes the
+request path makes rather than the cost of any particular validator.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_guardrails
+"""
+import re
+import time
+from types import SimpleNamespace
+
+from src.utils import guardrails
+
+PII_PATTERNS = [re.compile(p) for p in (r"[\w.+-]+@[\w-]+\.[\w.]+", r"\b\d{16}\b", r"\bpassword\s*[:=]")]
+
+class StubGuard:
+    """Runs a fixed set of regex 'validators' over the text on every call."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def validate(self, text, section="input"):
+        self.calls += 1
+        for _ in range(20):
+            hits = [p.search(text) for p in PII_PATTERNS]
+        redacted = text
+        for p in PII_PATTERNS:
+            redacted = p.sub("<REDACTED>", redacted)
+        return SimpleNamespace(valid=not any(hits), errors=[], redacted_output=redacted)
+
+    parse = validate
+
+def legacy_request(guard, user_message, llm_response):
+    # Mirrors the pre-single-pass /chat handler.
+    if not guard.parse(user_message, section="input").valid:
+        guard.validate(user_message, section="input").errors
+        return
+    if not guard.validate(llm_response, section="output").valid:
+        guard.validate(llm_response, section="output").errors
+        return
+    guard.validate(llm_response, section="output").redacted_output
+
+def single_pass_request(user_message, llm_response, use_cache=False):
+    if not guardrails.evaluate_guardrails(user_message, section="input", use_cache=use_cache).valid:
+        return
+    output_verdict = guardrails.evaluate_guardrails(llm_response, section="output", use_cache=use_cache)
+    if not output_verdict.valid:
+        return
+    output_verdict.text
+
+REQUESTS = 2000
+
+def run(fn):
+    started = time.perf_counter()
+    for _ in range(REQUESTS):
+        fn()
+    return (time.perf_counter() - started) / REQUESTS
+
+def compare(label, guard, user_message, llm_response):
+    guard.calls = 0
+    legacy = run(lambda: legacy_request(guard, user_message, llm_response))
+    legacy_calls, guard.calls = guard.calls, 0
+    single = run(lambda: single_pass_request(user_message, llm_response))
+    single_calls, guard.calls = guard.calls, 0
+    guardrails._verdict_cache.clear()
+    cached = run(lambda: single_pass_request(user_message, llm_response, use_cache=True))
+    cached_calls = guard.calls
+
+    print(label)
+    print(f"  legacy      {legacy * 1e6:8.1f} us/request  {legacy_calls / REQUESTS:.2f} guard passes/request")
+    print(f"  single-pass {single * 1e6:8.1f} us/request  {single_calls / REQUESTS:.2f} guard passes/request  ({(1 - single / legacy) * 100:5.1f}% less)")
+    print(f"  cached      {cached * 1e6:8.1f} us/request  {cached_calls / REQUESTS:.2f} guard passes/request  ({(1 - cached / legacy) * 100:5.1f}% less)")
+
+def main():
+    guard = StubGuard()
+    guardrails._guard = guard
+
+    status_table = "Here is the status of your invoice(s):\n\n" + "| 1 | 4500012345 | 9000123 | PAID: The invoice has been paid in full. |\n" * 5
+    compare("accepted turn", guard, "PO 4500012345 invoice 9000123", status_table)
+    compare("rejected output", guard, "PO 4500012345 invoice 9000123", status_table + "Contact ap@example.com")
+    compare("rejected input", guard, "my password: hunter2", status_table)
+    print("note: single-pass alone stays below a 50% saving (one output pass of two is saved); only cached turns exceed it")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Micro-benchmark: session history encoding, legacy JSON of `BaseMessage.__dict__`
+vs. the msgpack/zstd codec in `src/memory/codec.py`.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_message_codec
+"""
+import json
+import timeit
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from src.memory.codec import decode_message, encode_message
+
+STATUS_TABLE = "Here is the status of your invoice(s):\n\n| Sr# | ACR/Invoice Number | Invoice Document Date | Status |\n|---|---|---|---|\n" + "\n".join(
+    f"| {i + 1} | ACR{i:05d} | 2023-10-27 | PENDING_APPROVAL: The invoice is pending approval. |" for i in range(50)
+)
+
+def build_session(turns: int = 10):
+    messages = []
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"PO 45000123{i:02d} invoice 90001{i:02d}"))
+        messages.append(AIMessage(content=STATUS_TABLE if i % 3 == 0 else "Are you satisfied with the information provided? (Yes/No)"))
+    return messages
+
+def json_encode(message):
+    return json.dumps(message.__dict__).encode()
+
+def json_decode(data):
+    return BaseMessage(**json.loads(data))
+
+def bench(label, encode, decode, messages, number=200):
+    encoded = [encode(m) for m in messages]
+    encode_s = timeit.timeit(lambda: [encode(m) for m in messages], number=number) / number
+    decode_s = timeit.timeit(lambda: [decode(e) for e in encoded], number=number) / number
+    print(
+        f"{label:<8} encode {encode_s * 1e6:8.1f} us/session  "
+        f"decode {decode_s * 1e6:8.1f} us/session  "
+        f"stored {sum(len(e) for e in encoded):7d} bytes/session"
+    )
+
+def main():
+    messages = build_session()
+    print(f"session of {len(messages)} messages")
+    bench("json", json_encode, json_decode, messages)
+    bench("codec", encode_message, decode_message, messages)
+
+if __name__ == "__main__":
+    main()
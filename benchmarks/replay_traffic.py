@@ -0,0 +1,217 @@
+"""
+Load test: replays /chat traffic recorded with TRAFFIC_RECORD_ENABLED=true (see `src/core/traffic.py`).
+
+Recorded turns are sent at the recorded pace sped up by `--speed`: 1 is real time, 10 is ten
+times faster and 0 is as fast as possible, with `--concurrency` sessions in flight. Turns of one
+session keep their order, and a turn is never sent before the reply to the previous turn arrives.
+
+By default the app runs in-process with the stand-ins of `bench_chat`. The difference is that the
+LLM and SAP answer each turn with the responses recorded for it, after the recorded delay.
+Calls with no recorded answer fall back to the mock SAP app or an "UNKNOWN" LLM answer, and are
+counted. With `--url`, the traffic goes to a running instance that uses its own dependencies.
+
+The report gives turns/s, latency percentiles, status codes, statuses that differ from the
+recording, and the schedule lag. Lag is how late turns went out because the previous reply of
+their session was still pending. A lag that grows with `--speed` means the app is at capacity.
+
+Run from the repository root:
+
+    python -m benchmarks.replay_traffic traffic.jsonl --speed 10
+    python -m benchmarks.replay_traffic traffic.jsonl --speed 0 --output build-a.json
+    python -m benchmarks.replay_traffic traffic.jsonl --speed 0 --compare build-a.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+os.environ.setdefault("LLM_PROVIDER", "openai")
+os.environ.setdefault("LLM_API_KEY", "benchmark")
+os.environ.setdefault("LLM_MODEL_NAME", "fake-model")
+
+import httpx
+from langchain_core.messages import AIMessage
+
+from benchmarks.bench_chat import percentile, set_up, tear_down
+from src import main
+from src.agents.tools.mock_sap import create_mock_sap_app
+from src.agents.tools.mock_servicenow import create_mock_servicenow_app
+
+# Recorded dependency responses of the turn being replayed, consumed as the app asks for them.
+_recorded: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("replay_recorded", default=None)
+unmatched: Counter = Counter()
+
+def take_recorded(kind: str, operation: str) -> Optional[Dict[str, Any]]:
+    calls = _recorded.get() or []
+    for i, call in enumerate(calls):
+        if call["kind"] == kind and call["operation"] == operation:
+            return calls.pop(i)
+    unmatched[f"{kind}.{operation}"] += 1
+    return None
+
+class ReplayLLM:
+    """Stands in for `CachedLLM`, where the responses were recorded, answering per prompt template."""
+
+    def __init__(self, dependency_latency: bool = True):
+        self.dependency_latency = dependency_latency
+
+    async def ainvoke(self, prompt: Any, *, prompt_type: str = "default", **kwargs) -> AIMessage:
+        recorded = take_recorded("llm", prompt_type)
+        if recorded is None:
+            return AIMessage(content="UNKNOWN")
+        if self.dependency_latency:
+            await asyncio.sleep(recorded["duration_ms"] / 1000)
+        return AIMessage(content=recorded["response"])
+
+class ReplaySAPTransport(httpx.AsyncBaseTransport):
+    """Answers SAP status requests with the recorded invoice details, else asks `fallback`."""
+
+    def __init__(self, fallback: httpx.AsyncBaseTransport, dependency_latency: bool = True):
+        self.fallback = fallback
+        self.dependency_latency = dependency_latency
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        recorded = take_recorded("sap", "invoice_status")
+        if recorded is None:
+            return await self.fallback.handle_async_request(request)
+        if self.dependency_latency:
+            await asyncio.sleep(recorded["duration_ms"] / 1000)
+        return httpx.Response(200, json={"invoice_details": recorded["response"]})
+
+def load_recording(path: Path) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return sorted(entries, key=lambda entry: entry["ts"])
+
+async def replay(
+    entries: List[Dict[str, Any]],
+    send: Callable[[str, Dict[str, Any]], Awaitable[int]],
+    speed: float,
+    concurrency: int,
+) -> Dict[str, Any]:
+    """Sends every recorded turn through `send(session_id, entry)` and reports how it went."""
+    sessions: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for entry in entries:
+        sessions[entry["session"]].append(entry)
+    run_id = uuid.uuid4().hex[:8]  # fresh session ids, so no checkpoint of an earlier run is resumed
+    semaphore = asyncio.Semaphore(concurrency if speed == 0 else len(sessions))
+    latencies: List[float] = []
+    lags: List[float] = []
+    statuses: Counter = Counter()
+    mismatches = 0
+    first_ts = entries[0]["ts"]
+    started = time.perf_counter()
+
+    async def run_session(name: str, turns: List[Dict[str, Any]]) -> None:
+        nonlocal mismatches
+        async with semaphore:
+            for entry in turns:
+                if speed:
+                    delay = started + (entry["ts"] - first_ts) / speed - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    lags.append(max(0.0, -delay))
+                sent = time.perf_counter()
+                status = await send(f"replay-{run_id}-{name}", entry)
+                latencies.append(time.perf_counter() - sent)
+                statuses[str(status)] += 1
+                mismatches += status != entry["status"]
+
+    await asyncio.gather(*[run_session(name, turns) for name, turns in sessions.items()])
+    elapsed = time.perf_counter() - started
+    recorded = [entry["latency_ms"] for entry in entries]
+    return {
+        "turns": len(latencies),
+        "sessions": len(sessions),
+        "speed": speed,
+        "elapsed_seconds": round(elapsed, 2),
+        "turns_per_second": round(len(latencies) / elapsed, 1),
+        "latency_ms": {p: round(percentile(latencies, q) * 1000, 2) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+        "recorded_latency_ms": {p: round(percentile(recorded, q), 2) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+        "schedule_lag_ms": {
+            "p95": round(percentile(lags, 95) * 1000, 2) if lags else 0.0,
+            "max": round(max(lags) * 1000, 2) if lags else 0.0,
+        },
+        "statuses": dict(statuses),
+        "status_mismatches": mismatches,
+        "unmatched_dependency_calls": dict(unmatched),
+    }
+
+def make_sender(client: httpx.AsyncClient) -> Callable[[str, Dict[str, Any]], Awaitable[int]]:
+    async def send(session_id: str, entry: Dict[str, Any]) -> int:
+        token = _recorded.set(list(entry.get("dependencies") or []))
+        try:
+            response = await client.post("/chat", json={"session_id": session_id, "message": entry["message"]})
+        finally:
+            _recorded.reset(token)
+        return response.status_code
+    return send
+
+async def run(args) -> Dict[str, Any]:
+    entries = load_recording(args.recording)
+    if not entries:
+        raise SystemExit(f"{args.recording} has no recorded turns")
+    timeout = httpx.Timeout(args.timeout)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=timeout) as client:
+            return await replay(entries, make_sender(client), args.speed, args.concurrency)
+
+    dependency_latency = not args.skip_dependency_latency
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = await set_up(
+            os.path.join(tmp, "records.db"),
+            ReplayLLM(dependency_latency),
+            ReplaySAPTransport(httpx.ASGITransport(app=create_mock_sap_app()), dependency_latency),
+            httpx.ASGITransport(app=create_mock_servicenow_app()),
+        )
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://chat.test", timeout=timeout)
+        try:
+            return await replay(entries, make_sender(client), args.speed, args.concurrency)
+        finally:
+            await client.aclose()
+            await tear_down(engine)
+
+def compare(report: Dict[str, Any], other: Dict[str, Any]) -> List[str]:
+    """One line per headline metric: the other run's value, this run's, and the change."""
+    rows = [("turns_per_second", report["turns_per_second"], other["turns_per_second"])]
+    rows += [(f"latency {p} ms", report["latency_ms"][p], other["latency_ms"][p]) for p in ("p50", "p95", "p99")]
+    rows.append(("schedule lag max ms", report["schedule_lag_ms"]["max"], other["schedule_lag_ms"]["max"]))
+    lines = []
+    for name, value, before in rows:
+        change = f"{(value - before) / before * 100:+.1f}%" if before else "n/a"
+        lines.append(f"{name}: {before} -> {value} ({change})")
+    return lines
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("recording", type=Path, help="JSONL file written by the traffic recorder")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = recorded pace, 10 = ten times faster, 0 = as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=20, help="sessions in flight when --speed is 0")
+    parser.add_argument("--url", help="replay against a running instance instead of the in-process app")
+    parser.add_argument("--skip-dependency-latency", action="store_true", help="answer recorded calls immediately")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", type=Path, help="write the report here")
+    parser.add_argument("--compare", type=Path, help="a report of an earlier run, e.g. another build")
+    args = parser.parse_args(argv)
+    if args.speed < 0:
+        parser.error("--speed must be 0 or positive")
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+    if args.compare:
+        for line in compare(report, json.loads(args.compare.read_text())):
+            print(line)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -1,6 +1,8 @@
+import json
+import uuid
 import streamlit as st
 import requests
-from typing import List, Dict
+from typing import Dict, Iterator, Tuple
 
 st.set_page_config(page_title="Invoice Status Chatbot", page_icon="🧾", layout="centered")
 st.title("🧾 Invoice Status Chatbot")
@@ -10,10 +12,20 @@ Welcome to the multi-lingual Invoice Status Chatbot! Ask about your PO or Non-PO
 
 if 'messages' not in st.session_state:
     st.session_state['messages'] = []
+if 'session_id' not in st.session_state:
+    st.session_state['session_id'] = str(uuid.uuid4())
 
 user_input = st.chat_input("Type your invoice query here...")
 
-backend_url = st.secrets["BACKEND_URL"] if "BACKEND_URL" in st.secrets else "http://localhost:8000/api/chat"
+backend_url = st.secrets["BACKEND_URL"] if "BACKEND_URL" in st.secrets else "http://localhost:8000/chat/stream"
+
+NODE_LABELS = {
+    "identify_intent": "Understanding your request...",
+    "collect_and_validate_po_details": "Reading the invoice details...",
+    "collect_and_validate_non_po_details": "Reading the invoice details...",
+    "call_sap_api": "Checking SAP...",
+    "create_servicenow_ticket": "Creating a ticket...",
+}
 
 def render_message(msg: Dict):
     if msg["role"] == "user":
@@ -21,11 +33,45 @@ def render_message(msg: Dict):
     else:
         st.chat_message("assistant").markdown(msg["content"])
 
-def call_backend(messages: List[Dict]):
-    try:
-        response = requests.post(backend_url, json={"messages": messages}, timeout=30)
+def stream_events(message: str) -> Iterator[Tuple[str, Dict]]:
+    """Yields (event, data) pairs from the backend's Server-Sent Events stream."""
+    with requests.post(
+        backend_url,
+        json={"session_id": st.session_state['session_id'], "message": message},
+        stream=True,
+        timeout=30,
+    ) as response:
+        if response.status_code == 400:
+            detail = response.json().get("detail", {})
+            yield "error", detail if isinstance(detail, dict) else {"error": str(detail)}
+            return
         response.raise_for_status()
-        return response.json()["reply"]
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:") and event:
+                yield event, json.loads(line[len("data:"):])
+                event = None
+
+def call_backend(message: str, placeholder) -> str:
+    """Renders the reply as it streams in and returns the final text."""
+    header, rows = None, {}
+    try:
+        for event, data in stream_events(message):
+            if event == "node" and data["node"] in NODE_LABELS and not rows:
+                placeholder.markdown(f"_{NODE_LABELS[data['node']]}_")
+            elif event == "status_header":
+                header = data["text"]
+            elif event == "status_row":
+                # Rows arrive as SAP answers, not necessarily in order.
+                rows[data["index"]] = data["text"]
+                placeholder.markdown("\n".join([header or ""] + [rows[i] for i in sorted(rows)]))
+            elif event == "done":
+                return data["response_message"]
+            elif event == "error":
+                return f"❌ Error: {data.get('error', data)}"
+        return "❌ Error: the response ended early."
     except Exception as e:
         return f"❌ Error: {str(e)}"
 
@@ -34,7 +80,10 @@ for msg in st.session_state['messages']:
 
 if user_input:
     st.session_state['messages'].append({"role": "user", "content": user_input})
-    with st.spinner("Assistant is typing..."):
-        reply = call_backend(st.session_state['messages'])
+    render_message({"role": "user", "content": user_input})
+    with st.chat_message("assistant"):
+        placeholder = st.empty()
+        placeholder.markdown("_Assistant is typing..._")
+        reply = call_backend(user_input, placeholder)
+        placeholder.markdown(reply)
     st.session_state['messages'].append({"role": "assistant", "content": reply})
-    render_message({"role": "assistant", "content": reply}) 
\ No newline at end of file
@@ -1,7 +1,5 @@
-from typing import List, Optional, TypedDict
-
-from langchain_core.messages import BaseMessage
 from langgraph.graph import StateGraph, END
+from .state import AgentState
 from .nodes import (
     greeting_node,
     identify_intent_node,
@@ -19,41 +17,60 @@ from .nodes import (
     end_conversation_node,
     route_after_satisfaction_query,
 )
+from .invoice_parser import parse_non_po_details, parse_po_details
+from src.core.telemetry import traced_node
 
-class AgentState(TypedDict):
+def route_entry(state: AgentState) -> str:
     """
-    Represents the state of the agent.
+    Resumes a checkpointed session at the node that is waiting for this turn's message.
     """
-    conversation_history: List[BaseMessage]
-    user_query: str
-    invoice_type: Optional[str]  # "PO" or "NON_PO"
-    po_number: Optional[str]
-    invoice_number: Optional[str]
-    check_all_for_po: Optional[bool]
-    acr_number: Optional[str]
-    invoice_document_date: Optional[str]
-    json_payload: Optional[dict]
-    api_response: Optional[dict]
-    is_satisfied: Optional[bool]
-    email_id: Optional[str]
-    vendor_number: Optional[str]
-    service_now_ticket: Optional[str]
-    final_response: Optional[str]
-
+    awaiting_input = state.get("awaiting_input")
+    user_query = state.get("user_query", "")
+    # Well-formed details go straight to collection; anything else is classified first, so a
+    # user who changes the subject is not stuck answering the detail question.
+    if awaiting_input == "po_details" and parse_po_details(user_query):
+        return "collect_and_validate_po_details"
+    elif awaiting_input == "non_po_details" and parse_non_po_details(user_query):
+        return "collect_and_validate_non_po_details"
+    elif awaiting_input == "satisfaction":
+        return route_after_satisfaction_query(state)
+    else:
+        return "identify_intent"
 
 def route_after_intent_identification(state: AgentState) -> str:
     """
     Routes the conversation based on the identified intent.
     """
     invoice_type = state.get("invoice_type")
+    user_query = state.get("user_query", "")
+    # Still waiting for details of this type: free-form answers go to extraction.
+    awaiting_input = state.get("awaiting_input")
+    if awaiting_input == "po_details" and invoice_type == "PO":
+        return "collect_and_validate_po_details"
+    if awaiting_input == "non_po_details" and invoice_type == "NON_PO":
+        return "collect_and_validate_non_po_details"
+    # Details given together with the intent are collected right away instead of asked for.
     if invoice_type == "PO":
+        if parse_po_details(user_query):
+            return "collect_and_validate_po_details"
         return "ask_po_invoice_details"
     elif invoice_type == "NON_PO":
+        if parse_non_po_details(user_query):
+            return "collect_and_validate_non_po_details"
         return "ask_non_po_invoice_details"
     elif invoice_type == "GREETING":
         return "greeting"
-    else:  # UNKNOWN
-        return "identify_intent"
+    else:  # UNKNOWN: the clarifying question is the reply for this turn
+        return END
+
+def route_after_details_collection(state: AgentState) -> str:
+    """
+    Ends the turn when the details still need to be (re-)entered by the user, or when
+    the request was dropped after too many unreadable answers.
+    """
+    if state.get("awaiting_input") or not state.get("invoice_type"):
+        return END
+    return "generate_json_payload"
 
 def route_after_sap_call(state: AgentState) -> str:
     """
@@ -67,25 +84,34 @@ def route_after_sap_call(state: AgentState) -> str:
 # Define the workflow
 workflow = StateGraph(AgentState)
 
-# Add the nodes
-workflow.add_node("greeting", greeting_node)
-workflow.add_node("identify_intent", identify_intent_node)
-workflow.add_node("ask_po_invoice_details", ask_po_invoice_details_node)
-workflow.add_node("ask_non_po_invoice_details", ask_non_po_invoice_details_node)
-workflow.add_node("collect_and_validate_po_details", collect_and_validate_po_details_node)
-workflow.add_node("collect_and_validate_non_po_details", collect_and_validate_non_po_details_node)
-workflow.add_node("generate_json_payload", generate_json_payload_node)
-workflow.add_node("call_sap_api", call_sap_api_node)
-workflow.add_node("explain_invoice_status", explain_invoice_status_node)
-workflow.add_node("handle_invoice_not_found", handle_invoice_not_found_node)
-workflow.add_node("ask_for_satisfaction", ask_for_satisfaction_node)
-workflow.add_node("collect_feedback_for_ticket", collect_feedback_for_ticket_node)
-workflow.add_node("create_servicenow_ticket", create_servicenow_ticket_node)
-workflow.add_node("end_conversation", end_conversation_node)
-
-
-# Set the entry point
-workflow.set_entry_point("identify_intent")
+# Add the nodes; each run is traced as a `node.<name>` span
+workflow.add_node("greeting", traced_node("greeting", greeting_node))
+workflow.add_node("identify_intent", traced_node("identify_intent", identify_intent_node))
+workflow.add_node("ask_po_invoice_details", traced_node("ask_po_invoice_details", ask_po_invoice_details_node))
+workflow.add_node("ask_non_po_invoice_details", traced_node("ask_non_po_invoice_details", ask_non_po_invoice_details_node))
+workflow.add_node("collect_and_validate_po_details", traced_node("collect_and_validate_po_details", collect_and_validate_po_details_node))
+workflow.add_node("collect_and_validate_non_po_details", traced_node("collect_and_validate_non_po_details", collect_and_validate_non_po_details_node))
+workflow.add_node("generate_json_payload", traced_node("generate_json_payload", generate_json_payload_node))
+workflow.add_node("call_sap_api", traced_node("call_sap_api", call_sap_api_node))
+workflow.add_node("explain_invoice_status", traced_node("explain_invoice_status", explain_invoice_status_node))
+workflow.add_node("handle_invoice_not_found", traced_node("handle_invoice_not_found", handle_invoice_not_found_node))
+workflow.add_node("ask_for_satisfaction", traced_node("ask_for_satisfaction", ask_for_satisfaction_node))
+workflow.add_node("collect_feedback_for_ticket", traced_node("collect_feedback_for_ticket", collect_feedback_for_ticket_node))
+workflow.add_node("create_servicenow_ticket", traced_node("create_servicenow_ticket", create_servicenow_ticket_node))
+workflow.add_node("end_conversation", traced_node("end_conversation", end_conversation_node))
+
+
+# Set the entry point: a new request starts at intent identification, a pending one resumes
+workflow.set_conditional_entry_point(
+    route_entry,
+    {
+        "identify_intent": "identify_intent",
+        "collect_and_validate_po_details": "collect_and_validate_po_details",
+        "collect_and_validate_non_po_details": "collect_and_validate_non_po_details",
+        "end_conversation": "end_conversation",
+        "collect_feedback_for_ticket": "collect_feedback_for_ticket",
+    },
+)
 
 # Define the edges
 workflow.add_conditional_edges(
@@ -95,15 +121,22 @@ workflow.add_conditional_edges(
         "greeting": "greeting",
         "ask_po_invoice_details": "ask_po_invoice_details",
         "ask_non_po_invoice_details": "ask_non_po_invoice_details",
-        "identify_intent": "identify_intent",
+        "collect_and_validate_po_details": "collect_and_validate_po_details",
+        "collect_and_validate_non_po_details": "collect_and_validate_non_po_details",
+        END: END,
     },
 )
 
 workflow.add_edge("greeting", END)
-workflow.add_edge("ask_po_invoice_details", "collect_and_validate_po_details")
-workflow.add_edge("ask_non_po_invoice_details", "collect_and_validate_non_po_details")
-workflow.add_edge("collect_and_validate_po_details", "generate_json_payload")
-workflow.add_edge("collect_and_validate_non_po_details", "generate_json_payload")
+# Asking for details ends the turn; the next message resumes at the matching collect node
+workflow.add_edge("ask_po_invoice_details", END)
+workflow.add_edge("ask_non_po_invoice_details", END)
+for collect_node in ("collect_and_validate_po_details", "collect_and_validate_non_po_details"):
+    workflow.add_conditional_edges(
+        collect_node,
+        route_after_details_collection,
+        {"generate_json_payload": "generate_json_payload", END: END},
+    )
 workflow.add_edge("generate_json_payload", "call_sap_api")
 
 workflow.add_conditional_edges(
@@ -118,18 +151,13 @@ workflow.add_conditional_edges(
 workflow.add_edge("handle_invoice_not_found", END)
 workflow.add_edge("explain_invoice_status", "ask_for_satisfaction")
 
-workflow.add_conditional_edges(
-    "ask_for_satisfaction",
-    route_after_satisfaction_query,
-    {
-        "end_conversation": "end_conversation",
-        "collect_feedback_for_ticket": "collect_feedback_for_ticket"
-    }
-)
+# The satisfaction answer arrives in the next turn and is routed by route_entry
+workflow.add_edge("ask_for_satisfaction", END)
 
 workflow.add_edge("collect_feedback_for_ticket", "create_servicenow_ticket")
 workflow.add_edge("create_servicenow_ticket", END)
 workflow.add_edge("end_conversation", END)
 
-# Compile the graph
+# Compile the graph. This stateless build runs every turn from the entry point; the API
+# compiles the same workflow with a checkpointer so sessions resume where they paused.
 app = workflow.compile()
@@ -0,0 +1,120 @@
+import json
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Sequence
+from langchain_core.messages import AIMessage, BaseMessage
+from src.core.config import settings
+from src.core.metrics import intent_classifications
+
+EXAMPLES_PATH = Path(__file__).parent / "data" / "intent_examples.json"
+
+GREETING_RE = re.compile(
+    r"^\s*(hi+|hello|hey|hiya|greetings|good\s+(morning|afternoon|evening|day)|hola|bonjour|hallo|namaste|ciao)"
+    r"([\s,!.]+(there|team|all|everyone))?[\s!.,?]*$",
+    re.IGNORECASE,
+)
+NON_PO_KEYWORD_RE = re.compile(r"\b(acr|non[\s_-]?po|non[\s-]?purchase\s+order)\b", re.IGNORECASE)
+# "no PO", "without a purchase order", "not against a PO": invoices raised without one are Non-PO.
+NEGATED_PO_RE = re.compile(
+    r"\b(no|without|not(\s+(against|on|under|for|with))?)\s+(an?\s+)?(po|purchase\s+order)s?\b", re.IGNORECASE,
+)
+PO_KEYWORD_RE = re.compile(r"\b(po|purchase\s+order)\b", re.IGNORECASE)
+PO_NUMBER_RE = re.compile(r"\b\d{10}\b")
+ISO_DATE_RE = re.compile(r"\b\d{4}-\d{2}-\d{2}\b")
+DIGITS_RE = re.compile(r"\d")
+
+# Fragments of the templated replies from ask_po_invoice_details_node / ask_non_po_invoice_details_node.
+ASKED_FOR_PO_DETAILS = "provide the PO Number and the Invoice Number"
+ASKED_FOR_NON_PO_DETAILS = "provide either the ACR or Invoice Number"
+
+@dataclass(frozen=True)
+class IntentPrediction:
+    intent: str  # "PO", "NON_PO", "GREETING" or "UNKNOWN"
+    confidence: float
+    source: str  # "rules" or "model"
+
+def _last_agent_message(history: Sequence[BaseMessage]) -> str:
+    for message in reversed(history):
+        if isinstance(message, AIMessage):
+            return str(message.content)
+    return ""
+
+def classify_by_rules(user_query: str, history: Sequence[BaseMessage] = ()) -> IntentPrediction:
+    """
+    Keyword and regex rules for the easy turns. Returns UNKNOWN with zero confidence when no rule fires.
+    """
+    if GREETING_RE.match(user_query):
+        return IntentPrediction("GREETING", 0.97, "rules")
+    if NON_PO_KEYWORD_RE.search(user_query):
+        return IntentPrediction("NON_PO", 0.95, "rules")
+    if NEGATED_PO_RE.search(user_query) and not PO_NUMBER_RE.search(user_query):
+        return IntentPrediction("NON_PO", 0.9, "rules")
+    if PO_KEYWORD_RE.search(user_query):
+        confidence = 0.97 if PO_NUMBER_RE.search(user_query) else 0.9
+        return IntentPrediction("PO", confidence, "rules")
+
+    # Bare detail answers: use the question the agent asked last.
+    if DIGITS_RE.search(user_query):
+        last_agent_message = _last_agent_message(history)
+        if ASKED_FOR_PO_DETAILS in last_agent_message:
+            return IntentPrediction("PO", 0.9, "rules")
+        if ASKED_FOR_NON_PO_DETAILS in last_agent_message:
+            return IntentPrediction("NON_PO", 0.9, "rules")
+    if ISO_DATE_RE.search(user_query):
+        # Only Non-PO lookups are keyed by invoice document date.
+        return IntentPrediction("NON_PO", 0.88, "rules")
+    if PO_NUMBER_RE.search(user_query):
+        return IntentPrediction("PO", 0.8, "rules")
+    return IntentPrediction("UNKNOWN", 0.0, "rules")
+
+_model = None
+
+def _get_model():
+    """
+    Trains the optional TF-IDF + logistic regression model on the bundled examples.
+    Returns None when disabled or when scikit-learn is not installed.
+    """
+    global _model
+    if _model is None and settings.intent_model_enabled:
+        try:
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            from sklearn.linear_model import LogisticRegression
+            from sklearn.pipeline import make_pipeline
+        except ImportError:
+            return None
+        examples: List[List[str]] = json.loads(EXAMPLES_PATH.read_text())
+        texts, labels = zip(*examples)
+        _model = make_pipeline(
+            TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 4), lowercase=True),
+            LogisticRegression(C=20.0, max_iter=1000),
+        )
+        _model.fit(texts, labels)
+    return _model
+
+def classify_by_model(user_query: str) -> Optional[IntentPrediction]:
+    model = _get_model()
+    if model is None:
+        return None
+    probabilities = model.predict_proba([user_query])[0]
+    best = probabilities.argmax()
+    return IntentPrediction(str(model.classes_[best]), float(probabilities[best]), "model")
+
+def classify_intent(user_query: str, history: Sequence[BaseMessage] = (), threshold: Optional[float] = None) -> Optional[IntentPrediction]:
+    """
+    Resolves GREETING/PO/NON_PO locally when a rule or the optional model is confident enough.
+    Returns None when the caller should fall back to the LLM, and counts the outcome in `intent_classifications`.
+    """
+    threshold = threshold if threshold is not None else settings.intent_fast_path_threshold
+    candidates = [classify_by_rules(user_query, history)]
+    if candidates[0].confidence < threshold:
+        model_prediction = classify_by_model(user_query)
+        if model_prediction is not None:
+            candidates.append(model_prediction)
+
+    for prediction in candidates:
+        if prediction.intent != "UNKNOWN" and prediction.confidence >= threshold:
+            intent_classifications.labels("fast_path").inc()
+            return prediction
+    intent_classifications.labels("llm_fallback").inc()
+    return None
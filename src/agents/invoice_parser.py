@@ -0,0 +1,93 @@
+import re
+from datetime import date
+from typing import Dict, List, Optional
+from pydantic import ValidationError
+from src.schemas.invoice import NonPOInvoice, POInvoice
+from src.utils.guardrails import check_po_number_format
+
+MAX_NON_PO_INVOICES = 50
+
+_IDENTIFIER = r"[A-Za-z0-9][A-Za-z0-9/_-]*"
+_NUMBER_LABEL = r"(?:\s+(?:number|num|no\.?|#))?\s*[:#]?\s*"
+
+PO_LABELED_RE = re.compile(r"\b(?:po|purchase\s+order)\b" + _NUMBER_LABEL + r"(\d+)\b", re.IGNORECASE)
+INVOICE_LABELED_RE = re.compile(r"\binv(?:oice)?\b" + _NUMBER_LABEL + r"((?=[A-Za-z0-9/_-]*\d)" + _IDENTIFIER + r")", re.IGNORECASE)
+PO_PAIR_RE = re.compile(r"^\s*(\d{10})\s*[,;\s]\s*(" + _IDENTIFIER + r")\s*$")
+CHECK_ALL_RE = re.compile(r"\ball\b(?:\s+\w+){0,3}\s+invoices\b", re.IGNORECASE)
+
+NON_PO_TOKEN_RE = re.compile(r"\d{4}-\d{2}-\d{2}|" + _IDENTIFIER)
+ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+# Words that may surround the rows without changing their meaning.
+NON_PO_FILLER_WORDS = {
+    "and", "date", "dated", "doc", "document", "for", "no", "non", "non-po", "number", "numbers",
+    "num", "of", "on", "please", "po", "status", "the",
+}
+ACR_LABELS = {"acr", "acrs"}
+INVOICE_LABELS = {"inv", "invoice", "invoices"}
+
+def parse_po_details(user_query: str) -> Optional[Dict]:
+    """
+    Parses a well-formed PO request, either labeled ("PO 4500012345 invoice 9000123")
+    or a bare "PO, invoice" pair. Returns None for free-form text the LLM should handle.
+    """
+    po_match = PO_LABELED_RE.search(user_query)
+    invoice_match = INVOICE_LABELED_RE.search(user_query)
+    if po_match and invoice_match:
+        po_number, invoice_number = po_match.group(1), invoice_match.group(1)
+    else:
+        pair_match = PO_PAIR_RE.match(user_query)
+        if not pair_match:
+            return None
+        po_number, invoice_number = pair_match.groups()
+
+    if not check_po_number_format(po_number):
+        return None
+    try:
+        invoice = POInvoice(po_number=po_number, invoice_number=invoice_number)
+    except ValidationError:
+        return None
+    return {**invoice.model_dump(), "check_all_for_po": bool(CHECK_ALL_RE.search(user_query))}
+
+def _is_iso_date(value: str) -> bool:
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+def parse_non_po_details(user_query: str) -> Optional[Dict]:
+    """
+    Parses comma/newline separated "ACR or invoice number, YYYY-MM-DD" rows (up to 50).
+    An "ACR"/"invoice" label applies to the rows after it; unlabeled rows are ACR numbers.
+    Returns None for free-form text the LLM should handle.
+    """
+    field = "acr_number"
+    pending_number: Optional[str] = None
+    invoices: List[Dict] = []
+
+    for token in NON_PO_TOKEN_RE.findall(user_query):
+        lowered = token.lower()
+        if lowered in ACR_LABELS:
+            field = "acr_number"
+        elif lowered in INVOICE_LABELS:
+            field = "invoice_number"
+        elif lowered in NON_PO_FILLER_WORDS:
+            continue
+        elif ISO_DATE_RE.fullmatch(token):
+            if pending_number is None or not _is_iso_date(token):
+                return None
+            try:
+                invoice = NonPOInvoice(**{field: pending_number, "invoice_document_date": token})
+            except ValidationError:
+                return None
+            invoices.append(invoice.model_dump())
+            pending_number = None
+        elif pending_number is None and any(ch.isdigit() for ch in token):
+            pending_number = token
+        else:
+            # Two numbers in a row, or a word we do not understand: not a simple list.
+            return None
+
+    if pending_number is not None or not invoices or len(invoices) > MAX_NON_PO_INVOICES:
+        return None
+    return {"invoices": invoices}
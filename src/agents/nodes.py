@@ -1,14 +1,33 @@
 import json
-from .graph import AgentState
+import re
+from typing import Callable, Dict, List, Optional
+from opentelemetry import trace
+from .state import AgentState
 from .prompts import (
+    conversation_summary_prompt,
     intent_identification_prompt,
     po_details_extraction_prompt,
     non_po_details_extraction_prompt,
 )
 from src.core.llm import llm
+from .intent_classifier import classify_intent
+from .invoice_parser import parse_non_po_details, parse_po_details
 from langchain_core.messages import HumanMessage
-from src.agents.tools.sap_api import get_invoice_status_from_sap
-from src.agents.tools.servicenow_api import create_servicenow_ticket
+from langgraph.config import get_stream_writer
+from src.core.config import settings
+from src.memory.context import ConversationContextBuilder
+from src.agents.tools.sap_api import SAPUnavailableError, aget_invoice_status_from_sap
+from src.agents.tools.ticket_outbox import get_ticket_outbox
+
+async def summarize_conversation(summary: str, messages: List[str]) -> str:
+    """Folds messages that dropped out of the prompt window into the running summary."""
+    prompt = conversation_summary_prompt.format(summary=summary, messages="\n".join(messages))
+    response = await llm.ainvoke(prompt, prompt_type="conversation_summary")
+    return str(response.content).strip()
+
+context_builder = ConversationContextBuilder(
+    summarize=summarize_conversation if settings.context_summary_enabled else None,
+)
 
 def greeting_node(state: AgentState) -> AgentState:
     """
@@ -23,28 +42,51 @@ def greeting_node(state: AgentState) -> AgentState:
     state["final_response"] = response
     return state
 
-def identify_intent_node(state: AgentState) -> AgentState:
+# The invoice type each pending detail question belongs to.
+DETAIL_INPUT_TYPES = {"po_details": "PO", "non_po_details": "NON_PO"}
+
+async def identify_intent_node(state: AgentState) -> AgentState:
     """
     Identifies the user's intent (PO, NON_PO, GREETING, UNKNOWN).
+    Easy turns are resolved by the local pre-classifier; the LLM is only asked when it is unsure.
     """
-    prompt = intent_identification_prompt.format(
-        user_query=state.get("user_query", ""),
-        conversation_history=state.get("conversation_history", [])
-    )
-    
-    response = llm.invoke(prompt)
-    intent = str(response.content).strip().upper()
+    user_query = state.get("user_query", "")
+    conversation_history = state.get("conversation_history", [])
 
-    if "PO" in intent:
-        state["invoice_type"] = "PO"
-    elif "NON_PO" in intent:
+    prediction = classify_intent(user_query, conversation_history)
+    if prediction is not None:
+        intent = prediction.intent
+    else:
+        prompt = intent_identification_prompt.format(
+            user_query=user_query,
+            conversation_history=await context_builder.build(conversation_history, state.get("session_id")),
+        )
+        response = await llm.ainvoke(prompt, prompt_type="intent_identification")
+        intent = str(response.content).strip().upper()
+
+    # NON_PO is checked first because "PO" is a substring of it.
+    if "NON_PO" in intent:
         state["invoice_type"] = "NON_PO"
+    elif "PO" in intent:
+        state["invoice_type"] = "PO"
     elif "GREETING" in intent:
         state["invoice_type"] = "GREETING"
     else:
         state["invoice_type"] = "UNKNOWN"
         state["final_response"] = "I'm sorry, I'm not sure what you're asking. Are you enquiring about PO or NON PO(ACR) based invoices?"
 
+    if state.get("awaiting_input") == "satisfaction":
+        # Not a yes or no (route_entry consumes those): the question is dropped for this request.
+        state["awaiting_input"] = None
+    awaited_type = DETAIL_INPUT_TYPES.get(state.get("awaiting_input"))
+    if awaited_type is not None:
+        if state["invoice_type"] == "UNKNOWN":
+            # Probably a free-form answer to the pending detail question; let extraction read it.
+            state["invoice_type"] = awaited_type
+        elif state["invoice_type"] != awaited_type:
+            # A new request (greeting or the other invoice type) replaces the pending question.
+            state["awaiting_input"] = None
+            state["detail_attempts"] = 0
     return state
 
 def ask_po_invoice_details_node(state: AgentState) -> AgentState:
@@ -53,6 +95,7 @@ def ask_po_invoice_details_node(state: AgentState) -> AgentState:
     """
     response = "Please provide the PO Number and the Invoice Number. Also, let me know if you want to check the status of all invoices for the given PO."
     state["final_response"] = response
+    state["awaiting_input"] = "po_details"
     return state
 
 def ask_non_po_invoice_details_node(state: AgentState) -> AgentState:
@@ -61,48 +104,70 @@ def ask_non_po_invoice_details_node(state: AgentState) -> AgentState:
     """
     response = "Please provide either the ACR or Invoice Number, and the Invoice Document Date (in YYYY-MM-DD format) for up to 50 invoices. Please provide the details in a comma-separated format."
     state["final_response"] = response
+    state["awaiting_input"] = "non_po_details"
     return state
 
-def collect_and_validate_po_details_node(state: AgentState) -> AgentState:
+def _details_not_understood(state: AgentState, retry_message: str) -> AgentState:
     """
-    Collects and validates PO invoice details from the user query.
+    Asks for the details again, or after `detail_max_attempts` unreadable answers in a row
+    drops the pending question so the next message starts a new request.
     """
-    print("---COLLECTING AND VALIDATING PO DETAILS---")
-    
-    prompt = po_details_extraction_prompt.format(user_query=state.get("user_query", ""))
-    response = llm.invoke(prompt)
-    details_json = str(response.content).strip()
+    attempts = (state.get("detail_attempts") or 0) + 1
+    if attempts >= settings.detail_max_attempts:
+        state["awaiting_input"] = None
+        state["invoice_type"] = None
+        state["detail_attempts"] = 0
+        state["final_response"] = (
+            "I'm sorry, I still could not read the invoice details. Let's start over: "
+            "are you enquiring about PO or NON PO(ACR) based invoices?"
+        )
+        return state
+    state["detail_attempts"] = attempts
+    state["final_response"] = retry_message
+    return state
 
+async def collect_and_validate_po_details_node(state: AgentState) -> AgentState:
+    """
+    Collects and validates PO invoice details from the user query.
+    """
+    user_query = state.get("user_query", "")
+    # Stays set until valid details arrive, so the next turn resumes here.
+    state["awaiting_input"] = "po_details"
     try:
-        details = json.loads(details_json)
+        # Well-formed "PO, invoice" input is parsed locally; only free-form text goes to the LLM.
+        details = parse_po_details(user_query)
+        if details is None:
+            prompt = po_details_extraction_prompt.format(user_query=user_query)
+            response = await llm.ainvoke(prompt, prompt_type="po_details_extraction")
+            details = json.loads(str(response.content).strip())
         state["po_number"] = details.get("po_number")
         state["invoice_number"] = details.get("invoice_number")
         state["check_all_for_po"] = details.get("check_all_for_po")
         # Add validation logic here
         if not state["po_number"] or not state["invoice_number"]:
-             state["final_response"] = "I seem to be missing some details. Please provide both the PO Number and Invoice Number."
-             # This should ideally route back to ask_po_invoice_details
-             return state
+             return _details_not_understood(state, "I seem to be missing some details. Please provide both the PO Number and Invoice Number.")
     except json.JSONDecodeError:
-        state["final_response"] = "I'm sorry, I had trouble understanding the details. Could you please provide them again clearly?"
-        # This should ideally route back to ask_po_invoice_details
-        return state
+        return _details_not_understood(state, "I'm sorry, I had trouble understanding the details. Could you please provide them again clearly?")
 
+    state["awaiting_input"] = None
+    state["detail_attempts"] = 0
     state["final_response"] = "Details for PO collected."
     return state
 
-def collect_and_validate_non_po_details_node(state: AgentState) -> AgentState:
+async def collect_and_validate_non_po_details_node(state: AgentState) -> AgentState:
     """
     Collects and validates Non-PO invoice details from the user query.
     """
-    print("---COLLECTING AND VALIDATING NON-PO DETAILS---")
-    
-    prompt = non_po_details_extraction_prompt.format(user_query=state.get("user_query", ""))
-    response = llm.invoke(prompt)
-    details_json = str(response.content).strip()
-
+    user_query = state.get("user_query", "")
+    # Stays set until valid details arrive, so the next turn resumes here.
+    state["awaiting_input"] = "non_po_details"
     try:
-        details = json.loads(details_json)
+        # Lists of "ACR/invoice, date" rows are parsed locally; only free-form text goes to the LLM.
+        details = parse_non_po_details(user_query)
+        if details is None:
+            prompt = non_po_details_extraction_prompt.format(user_query=user_query)
+            response = await llm.ainvoke(prompt, prompt_type="non_po_details_extraction")
+            details = json.loads(str(response.content).strip())
         # We will store the list of invoices directly in the state for now
         # In a real scenario, you'd iterate and validate each one
         state["json_payload"] = details 
@@ -110,10 +175,12 @@ def collect_and_validate_non_po_details_node(state: AgentState) -> AgentState:
             raise ValueError("No invoices found")
 
     except (json.JSONDecodeError, ValueError):
-        state["final_response"] = "I'm sorry, I had trouble understanding the details. Could you please provide them again clearly in the requested format?"
-        # This should ideally route back to ask_non_po_invoice_details
-        return state
+        return _details_not_understood(
+            state, "I'm sorry, I had trouble understanding the details. Could you please provide them again clearly in the requested format?",
+        )
     
+    state["awaiting_input"] = None
+    state["detail_attempts"] = 0
     state["final_response"] = "Details for Non-PO collected."
     return state
 
@@ -121,7 +188,6 @@ def generate_json_payload_node(state: AgentState) -> AgentState:
     """
     Generates the JSON payload for the SAP API call.
     """
-    print("---GENERATING JSON PAYLOAD---")
     invoice_type = state.get("invoice_type")
     payload = {"type": invoice_type, "invoices": []}
 
@@ -133,13 +199,13 @@ def generate_json_payload_node(state: AgentState) -> AgentState:
         }
         payload["invoices"].append(invoice_info)
     elif invoice_type == "NON_PO":
-        # The payload is already structured correctly from the extraction step
-        payload = state.get("json_payload", {})
+        # The invoices are already structured correctly from the extraction step
+        payload["invoices"] = (state.get("json_payload") or {}).get("invoices", [])
 
     state["json_payload"] = payload
     return state
 
-def call_sap_api_node(state: AgentState) -> AgentState:
+async def call_sap_api_node(state: AgentState) -> AgentState:
     """
     Calls the SAP API with the generated payload.
     """
@@ -149,10 +215,48 @@ def call_sap_api_node(state: AgentState) -> AgentState:
         state["api_response"] = None
         return state
         
-    api_result = get_invoice_status_from_sap(payload)
+    state["sap_unavailable"] = False
+    try:
+        api_result = await aget_invoice_status_from_sap(payload, on_row=_status_row_streamer(payload.get("type")))
+    except SAPUnavailableError as exc:
+        trace.get_current_span().record_exception(exc)
+        state["sap_unavailable"] = True
+        api_result = None
     state["api_response"] = api_result
     return state
 
+STATUS_TABLE_INTRO = "Here is the status of your invoice(s):\n\n"
+
+def status_table_header(invoice_type: Optional[str]) -> str:
+    if invoice_type == "PO":
+        return "| Sr# | PO Number | Invoice Number | Status |\n|---|---|---|---|"
+    return "| Sr# | ACR/Invoice Number | Invoice Document Date | Status |\n|---|---|---|---|"
+
+def status_table_row(invoice_type: Optional[str], index: int, row: Dict) -> str:
+    """One table line; `index` is the row's position in the SAP request."""
+    if invoice_type == "PO":
+        return f"| {index+1} | {row.get('po_number','')} | {row.get('invoice_number','')} | {row.get('status_code','')}: {row.get('status_description','')} |"
+    return f"| {index+1} | {row.get('acr_number') or row.get('invoice_number','')} | {row.get('invoice_document_date','')} | {row.get('status_code','')}: {row.get('status_description','')} |"
+
+def _status_row_streamer(invoice_type: Optional[str]) -> Optional[Callable[[int, Dict], None]]:
+    """
+    While the graph is streamed (POST /chat/stream), sends each status table line as a
+    custom stream event as soon as SAP has answered for it. None when not streaming.
+    """
+    try:
+        writer = get_stream_writer()
+    except RuntimeError:  # Called outside a graph run, e.g. directly in a test.
+        return None
+    header_sent = False
+
+    def on_row(index: int, row: Dict) -> None:
+        nonlocal header_sent
+        if not header_sent:
+            writer({"type": "status_header", "text": STATUS_TABLE_INTRO + status_table_header(invoice_type)})
+            header_sent = True
+        writer({"type": "status_row", "index": index, "text": status_table_row(invoice_type, index, row)})
+    return on_row
+
 def explain_invoice_status_node(state: AgentState) -> AgentState:
     """
     Formats the invoice status as a table in the response.
@@ -161,42 +265,46 @@ def explain_invoice_status_node(state: AgentState) -> AgentState:
     api_response = state.get("api_response", {})
     invoice_details = api_response.get("invoice_details", [])
 
-    if invoice_type == "PO":
-        header = "| Sr# | PO Number | Invoice Number | Status |\n|---|---|---|---|"
-        rows = [
-            f"| {i+1} | {row.get('po_number','')} | {row.get('invoice_number','')} | {row.get('status_code','')}: {row.get('status_description','')} |"
-            for i, row in enumerate(invoice_details)
-        ]
-    else:  # Non-PO
-        header = "| Sr# | ACR/Invoice Number | Invoice Document Date | Status |\n|---|---|---|---|"
-        rows = [
-            f"| {i+1} | {row.get('acr_number') or row.get('invoice_number','')} | {row.get('invoice_document_date','')} | {row.get('status_code','')}: {row.get('status_description','')} |"
-            for i, row in enumerate(invoice_details)
-        ]
+    header = status_table_header(invoice_type)
+    rows = [status_table_row(invoice_type, i, row) for i, row in enumerate(invoice_details)]
 
     table = "\n".join([header] + rows)
-    explanation = "Here is the status of your invoice(s):\n\n" + table
+    explanation = STATUS_TABLE_INTRO + table
     state["final_response"] = explanation
     return state
 
 def handle_invoice_not_found_node(state: AgentState) -> AgentState:
     # Placeholder
-    print("---HANDLING INVOICE NOT FOUND---")
+    if state.get("sap_unavailable"):
+        state["final_response"] = "The invoice system is not responding right now. Please try again in a few minutes."
+        return state
     state["final_response"] = "The requested invoice was not found. Please check the details and try again, or try again tomorrow."
     return state
 
 def ask_for_satisfaction_node(state: AgentState) -> AgentState:
     # Placeholder
-    print("---ASKING FOR SATISFACTION---")
-    state["final_response"] = "Are you satisfied with the information provided? (Yes/No)"
+    question = "Are you satisfied with the information provided? (Yes/No)"
+    # Keep the status table from explain_invoice_status_node in the same reply.
+    status = state.get("final_response")
+    state["final_response"] = f"{status}\n\n{question}" if status else question
+    state["awaiting_input"] = "satisfaction"
     return state
 
+# Only a message that is just the answer counts; "yesterday" or "yes, but ..." do not.
+SATISFIED_RE = re.compile(r"^\s*(yes|yeah|yep|y)([\s,]+(thanks?|thank you))?[\s.!]*$", re.IGNORECASE)
+NOT_SATISFIED_RE = re.compile(r"^\s*(no|nope|n|not really)([\s,]+(thanks?|thank you))?[\s.!]*$", re.IGNORECASE)
+
 def route_after_satisfaction_query(state: AgentState) -> str:
-    # Placeholder for routing based on Yes/No
-    if "yes" in state.get("user_query", "").lower():
+    """
+    Routes an explicit yes or no to the answer's node. Anything else is a new request and is
+    classified like one.
+    """
+    user_query = state.get("user_query", "")
+    if SATISFIED_RE.match(user_query):
         return "end_conversation"
-    else:
+    if NOT_SATISFIED_RE.match(user_query):
         return "collect_feedback_for_ticket"
+    return "identify_intent"
 
 def collect_feedback_for_ticket_node(state: AgentState) -> AgentState:
     """
@@ -204,7 +312,8 @@ def collect_feedback_for_ticket_node(state: AgentState) -> AgentState:
     In a real scenario, this would use an LLM to extract entities.
     For now, we'll mock the extraction from the user_query.
     """
-    print("---COLLECTING FEEDBACK FOR TICKET---")
+    state["awaiting_input"] = None
+    state["is_satisfied"] = False
     user_query = state.get("user_query", "")
     # Mock extraction
     state["email_id"] = "user@example.com" # Extracted from query
@@ -212,34 +321,42 @@ def collect_feedback_for_ticket_node(state: AgentState) -> AgentState:
     state["final_response"] = "Thank you. I have collected your details."
     return state
 
-def create_servicenow_ticket_node(state: AgentState) -> AgentState:
+async def create_servicenow_ticket_node(state: AgentState) -> AgentState:
     """
-    Creates a ServiceNow ticket with the collected user details.
+    Queues a ServiceNow ticket with the collected user details and answers with a provisional
+    reference; a background worker creates the ticket and posts the INC number to the session.
     """
-    print("---CREATING SERVICENOW TICKET---")
-    
     email = state.get("email_id")
     vendor_number = state.get("vendor_number")
-    # For a real implementation, you'd format the history nicely
-    conversation_history = str(state.get("conversation_history", []))
+    conversation_history = "\n".join(
+        f"{message.type}: {message.content}" for message in state.get("conversation_history") or []
+    )
 
     if not email or not vendor_number:
         state["final_response"] = "I am missing some of your details and cannot create a ticket. Please start over."
         return state
 
-    ticket_number = create_servicenow_ticket(
+    receipt = await get_ticket_outbox().enqueue(
+        session_id=state.get("session_id"),
         email=email,
         vendor_number=vendor_number,
         details="User not satisfied with invoice status response.",
-        conversation=conversation_history
+        conversation=conversation_history,
+        invoices=(state.get("json_payload") or {}).get("invoices"),
     )
     
-    state["service_now_ticket"] = ticket_number
-    state["final_response"] = f"I have created a ServiceNow ticket for you. The ticket number is {ticket_number}. A team member will follow up with you via email."
+    state["service_now_ticket"] = receipt.number or receipt.reference
+    if receipt.number:
+        state["final_response"] = f"A ServiceNow ticket already exists for your request: {receipt.number}. A team member will follow up with you via email."
+    elif receipt.duplicate:
+        state["final_response"] = f"Your ServiceNow ticket {receipt.reference} is already being created. A team member will follow up with you via email."
+    else:
+        state["final_response"] = f"I have logged a ServiceNow ticket for you with reference {receipt.reference}. The ticket number will follow shortly, and a team member will follow up with you via email."
     return state
 
 def end_conversation_node(state: AgentState) -> AgentState:
     # Placeholder
-    print("---ENDING CONVERSATION---")
+    state["awaiting_input"] = None
+    state["is_satisfied"] = True
     state["final_response"] = "Thank you for using the invoice agent. Goodbye!"
     return state
@@ -72,3 +72,16 @@ non_po_details_extraction_prompt = PromptTemplate.from_template(
     If a value is not present, use null.
     """
 )
+
+conversation_summary_prompt = PromptTemplate.from_template(
+    """
+    You keep a short running summary of a conversation between a vendor and an invoice status assistant.
+    The summary so far is: "{summary}"
+    Earlier messages not yet covered:
+    {messages}
+
+    Update the summary with these messages. Keep invoice types, PO/ACR and invoice numbers, dates and
+    whether the user was satisfied. Leave out greetings and anything already covered.
+    Respond with only the updated summary, in at most 60 words.
+    """
+)
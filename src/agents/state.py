@@ -0,0 +1,27 @@
+from typing import List, Optional, TypedDict
+
+from langchain_core.messages import BaseMessage
+
+class AgentState(TypedDict):
+    """
+    Represents the state of the agent.
+    """
+    session_id: Optional[str]
+    conversation_history: List[BaseMessage]
+    user_query: str
+    invoice_type: Optional[str]  # "PO" or "NON_PO"
+    po_number: Optional[str]
+    invoice_number: Optional[str]
+    check_all_for_po: Optional[bool]
+    acr_number: Optional[str]
+    invoice_document_date: Optional[str]
+    json_payload: Optional[dict]
+    api_response: Optional[dict]
+    sap_unavailable: Optional[bool]  # SAP timed out, kept failing or its circuit is open
+    is_satisfied: Optional[bool]
+    email_id: Optional[str]
+    vendor_number: Optional[str]
+    service_now_ticket: Optional[str]
+    final_response: Optional[str]
+    awaiting_input: Optional[str]  # "po_details", "non_po_details" or "satisfaction" while a turn is pending
+    detail_attempts: Optional[int]  # unreadable answers to the pending detail question so far
@@ -0,0 +1,243 @@
+"""
+Bulk invoice status lookups behind POST /invoices/status:bulk, without the LLM or the graph.
+
+The upload is read line by line as it arrives, each row is validated with the invoice schemas,
+valid rows are grouped per invoice type into SAP-sized chunks, and at most
+`bulk_status_max_chunks_in_flight` chunks are looked up at a time. Result rows are yielded as
+their chunks finish, so memory use does not grow with the size of the upload.
+"""
+import asyncio
+import csv
+import io
+import json
+from collections import deque
+from datetime import date
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from pydantic import ValidationError
+from src.core.config import settings
+from src.core.metrics import bulk_status_rows
+from src.core.resilience import deadline_scope
+from src.schemas.invoice import NonPOInvoice, POInvoice
+from src.utils.guardrails import check_po_number_format
+from src.agents.tools.sap_api import NOT_FOUND_STATUS, SAPUnavailableError, aget_invoice_statuses
+
+INPUT_FORMATS = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+INVOICE_FIELDS = ("po_number", "acr_number", "invoice_number", "invoice_document_date")
+OUTPUT_FIELDS = ("line", "type") + INVOICE_FIELDS + ("status_code", "status_description")
+OUTPUT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+INVALID_STATUS_CODE = "INVALID"
+UNAVAILABLE_STATUS = {
+    "status_code": "SAP_UNAVAILABLE",
+    "status_description": "SAP did not answer in time. Please try these invoices again later.",
+}
+
+# (line number, parsed row or None, why the line could not be parsed)
+UploadRecord = Tuple[int, Optional[Dict], Optional[str]]
+StatusLookup = Callable[[str, List[Dict]], Awaitable[List[Dict]]]
+
+class BulkUploadError(ValueError):
+    """The upload cannot be read at all: an unsupported content type or CSV header."""
+
+def input_format(content_type: Optional[str]) -> str:
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type not in INPUT_FORMATS:
+        raise BulkUploadError(f"Upload CSV (text/csv) or NDJSON (application/x-ndjson), not {media_type or 'no content type'}")
+    return INPUT_FORMATS[media_type]
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line_bytes: Optional[int] = None) -> AsyncIterator[Tuple[int, Optional[str]]]:
+    """
+    (line number, text) for each line of the body as its bytes arrive. A line longer than
+    `max_line_bytes` is dropped while it is read and comes out as None.
+    """
+    max_line_bytes = max_line_bytes or settings.bulk_status_max_line_bytes
+    buffer = b""
+    number = 0
+    too_long = False
+    async for chunk in chunks:
+        lines = (buffer + chunk).split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            number += 1
+            yield number, None if too_long or len(line) > max_line_bytes else line.decode("utf-8", "replace").rstrip("\r")
+            too_long = False
+        if len(buffer) > max_line_bytes:
+            too_long, buffer = True, b""
+    if buffer or too_long:
+        yield number + 1, None if too_long or len(buffer) > max_line_bytes else buffer.decode("utf-8", "replace").rstrip("\r")
+
+async def open_upload(chunks: AsyncIterator[bytes], upload_format: str) -> AsyncIterator[UploadRecord]:
+    """
+    The rows of an upload. The CSV header is read and checked here, before anything is
+    streamed back, so a file that cannot be read at all is rejected with one error.
+    """
+    lines = iter_lines(chunks)
+    if upload_format == "ndjson":
+        return _ndjson_records(lines)
+
+    async for _, text in lines:
+        if text is None:
+            raise BulkUploadError("The CSV header line is too long")
+        if text.strip():
+            fields = [name.strip().lower() for name in next(csv.reader([text]))]
+            break
+    else:
+        raise BulkUploadError("The upload is empty")
+    if not set(fields) & set(INVOICE_FIELDS):
+        raise BulkUploadError(f"The CSV header needs some of the columns {', '.join(('type',) + INVOICE_FIELDS)}")
+    return _csv_records(lines, fields)
+
+async def _ndjson_records(lines: AsyncIterator[Tuple[int, Optional[str]]]) -> AsyncIterator[UploadRecord]:
+    async for number, text in lines:
+        if text is None:
+            yield number, None, "The line is too long"
+        elif text.strip():
+            try:
+                record = json.loads(text)
+            except ValueError:
+                yield number, None, "The line is not valid JSON"
+                continue
+            yield (number, record, None) if isinstance(record, dict) else (number, None, "The line is not a JSON object")
+
+async def _csv_records(lines: AsyncIterator[Tuple[int, Optional[str]]], fields: List[str]) -> AsyncIterator[UploadRecord]:
+    async for number, text in lines:
+        if text is None:
+            yield number, None, "The line is too long"
+        elif text.strip():
+            values = next(csv.reader([text]))
+            if len(values) > len(fields):
+                yield number, None, f"The line has {len(values)} values for {len(fields)} columns"
+            else:
+                yield number, dict(zip(fields, values)), None
+
+def validate_row(record: Dict) -> Tuple[str, Dict]:
+    """
+    The invoice type and the invoice of one uploaded row, validated like the chat flow's
+    invoices. Rows without a type are PO rows when they have a PO number. Raises ValueError.
+    """
+    values = {name: str(record[name]).strip() or None for name in INVOICE_FIELDS if record.get(name) is not None}
+    invoice_type = str(record.get("type") or "").strip().upper().replace("-", "_")
+    if not invoice_type:
+        invoice_type = "PO" if values.get("po_number") else "NON_PO"
+
+    if invoice_type == "PO":
+        invoice = POInvoice.model_validate(values)
+        if not check_po_number_format(invoice.po_number):
+            raise ValueError("po_number must be 10 digits")
+        return invoice_type, invoice.model_dump()
+    if invoice_type == "NON_PO":
+        invoice = NonPOInvoice.model_validate(values)
+        if not (invoice.acr_number or invoice.invoice_number):
+            raise ValueError("acr_number or invoice_number is required")
+        try:
+            date.fromisoformat(invoice.invoice_document_date)
+        except ValueError:
+            raise ValueError("invoice_document_date must be a YYYY-MM-DD date") from None
+        return invoice_type, invoice.model_dump()
+    raise ValueError(f"type must be PO or NON_PO, not {record.get('type')!r}")
+
+def _describe(exc: ValueError) -> str:
+    if isinstance(exc, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in exc.errors())
+    return str(exc)
+
+def _invalid_row(line: int, record: Optional[Dict], reason: str) -> Dict:
+    row = {name: (record or {}).get(name) for name in ("type",) + INVOICE_FIELDS}
+    return {**row, "line": line, "status_code": INVALID_STATUS_CODE, "status_description": reason}
+
+def _outcome(row: Dict) -> str:
+    status_code = row.get("status_code")
+    if status_code == INVALID_STATUS_CODE:
+        return "invalid"
+    if status_code == UNAVAILABLE_STATUS["status_code"]:
+        return "unavailable"
+    return "not_found" if status_code == NOT_FOUND_STATUS["status_code"] else "found"
+
+def _counted(row: Dict) -> Dict:
+    bulk_status_rows.labels(row.get("type") or "unknown", _outcome(row)).inc()
+    return {name: row.get(name) for name in OUTPUT_FIELDS}
+
+async def _lookup_chunk(lookup: StatusLookup, invoice_type: str, batch: List[Tuple[int, Dict]]) -> List[Dict]:
+    invoices = [invoice for _, invoice in batch]
+    try:
+        with deadline_scope(settings.bulk_status_chunk_deadline_seconds):
+            rows = await lookup(invoice_type, invoices)
+    except SAPUnavailableError:
+        # The other chunks may still get through; only these rows are reported as unanswered.
+        rows = [UNAVAILABLE_STATUS] * len(invoices)
+    return [{**invoice, **row, "line": line, "type": invoice_type} for (line, invoice), row in zip(batch, rows)]
+
+async def _submit(in_flight: Deque[asyncio.Task], start: Callable[[], Awaitable[List[Dict]]]) -> AsyncIterator[Dict]:
+    """
+    Starts a chunk lookup, first waiting for the oldest one while the limit is reached,
+    and yields the rows of the chunks that have finished in the meantime.
+    """
+    if len(in_flight) >= settings.bulk_status_max_chunks_in_flight:
+        for row in await in_flight.popleft():
+            yield row
+    in_flight.append(asyncio.ensure_future(start()))
+    while in_flight and in_flight[0].done():
+        for row in in_flight.popleft().result():
+            yield row
+
+async def bulk_invoice_statuses(records: AsyncIterator[UploadRecord], lookup: Optional[StatusLookup] = None) -> AsyncIterator[Dict]:
+    """
+    A result row with `OUTPUT_FIELDS` for each uploaded row. Rows come out as their chunks
+    finish, not in upload order; `line` is the row's line number in the upload. Invalid rows
+    get status_code INVALID and the reason, and nothing after `bulk_status_max_rows` rows is
+    looked up.
+    """
+    lookup = lookup or aget_invoice_statuses
+    batches: Dict[str, List[Tuple[int, Dict]]] = {"PO": [], "NON_PO": []}
+    in_flight: Deque[asyncio.Task] = deque()
+    rows_read = 0
+    try:
+        async for line, record, error in records:
+            rows_read += 1
+            if rows_read > settings.bulk_status_max_rows:
+                reason = f"Only the first {settings.bulk_status_max_rows} rows of an upload are looked up"
+                yield _counted(_invalid_row(line, None, reason))
+                break
+            if error is None:
+                try:
+                    invoice_type, invoice = validate_row(record)
+                except ValueError as exc:
+                    error = _describe(exc)
+            if error is not None:
+                yield _counted(_invalid_row(line, record, error))
+                continue
+
+            batch = batches[invoice_type]
+            batch.append((line, invoice))
+            if len(batch) >= settings.sap_batch_size:
+                batches[invoice_type] = []
+                async for row in _submit(in_flight, lambda t=invoice_type, b=batch: _lookup_chunk(lookup, t, b)):
+                    yield _counted(row)
+
+        for invoice_type, batch in batches.items():
+            if batch:
+                async for row in _submit(in_flight, lambda t=invoice_type, b=batch: _lookup_chunk(lookup, t, b)):
+                    yield _counted(row)
+        while in_flight:
+            for row in await in_flight.popleft():
+                yield _counted(row)
+    finally:
+        # The client went away or a lookup failed: stop the remaining lookups.
+        for task in in_flight:
+            task.cancel()
+
+def ndjson_line(row: Dict) -> str:
+    return json.dumps(row) + "\n"
+
+def csv_line(row: Dict) -> str:
+    out = io.StringIO()
+    csv.writer(out).writerow(["" if row.get(name) is None else row[name] for name in OUTPUT_FIELDS])
+    return out.getvalue()
+
+def csv_header() -> str:
+    return ",".join(OUTPUT_FIELDS) + "\r\n"
@@ -0,0 +1,128 @@
+import asyncio
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from src.core.config import settings
+from src.core.metrics import invoice_status_cache_lookups
+from src.core.telemetry import tracer
+from src.utils.cache import TTLCache
+
+StatusKey = Tuple[Optional[str], Optional[str], Optional[str], Optional[str]]
+
+def status_key(invoice_type: str, invoice: Dict) -> StatusKey:
+    """(type, po_number or acr_number, invoice_number, document date) identifies one status lookup."""
+    return (
+        invoice_type,
+        invoice.get("po_number") or invoice.get("acr_number"),
+        invoice.get("invoice_number"),
+        invoice.get("invoice_document_date"),
+    )
+
+class CachedInvoiceStatusLookup:
+    """
+    Sits in front of `SAPInvoiceStatusClient.get_invoice_statuses`.
+
+    - Rows are cached with a TTL chosen by their status_code, so settled states
+      (PAID) live long and moving ones (PENDING_APPROVAL) expire quickly.
+    - Concurrent lookups of the same key share one SAP request.
+    - A batch only sends its cache misses to SAP.
+    """
+
+    def __init__(self, sap_client, maxsize: Optional[int] = None):
+        self.sap_client = sap_client
+        self._cache = TTLCache(maxsize=maxsize or settings.invoice_status_cache_size)
+        self._in_flight: Dict[StatusKey, asyncio.Future] = {}
+        self._fetches: Set[asyncio.Task] = set()
+
+    def _ttl(self, row: Dict) -> int:
+        return settings.invoice_status_ttl_seconds.get(row.get("status_code"), settings.invoice_status_default_ttl_seconds)
+
+    async def get_invoice_statuses(
+        self, invoice_type: str, invoices: List[Dict], on_row: Optional[Callable[[int, Dict], None]] = None,
+    ) -> List[Dict]:
+        """
+        Statuses in input order. `on_row(index, row)` is called for each row as soon as it is
+        known: cache hits first, then SAP rows as their chunks come back.
+        """
+        with tracer.start_as_current_span("sap.status_lookup", attributes={"sap.invoice_type": invoice_type}) as span:
+            results, fetched, coalesced = await self._lookup(invoice_type, invoices, on_row)
+            span.set_attribute("sap.invoices", len(invoices))
+            span.set_attribute("sap.cache_hits", len(invoices) - fetched - coalesced)
+            span.set_attribute("sap.coalesced", coalesced)
+            return results
+
+    async def _lookup(
+        self, invoice_type: str, invoices: List[Dict], on_row: Optional[Callable[[int, Dict], None]] = None,
+    ) -> Tuple[List[Dict], int, int]:
+        results: List[Optional[Dict]] = [None] * len(invoices)
+        waiting: List[Tuple[int, asyncio.Future]] = []
+        to_fetch: Dict[StatusKey, Dict] = {}
+        fetch_index: List[int] = []  # input position of each invoice sent to SAP
+        owned: Dict[StatusKey, asyncio.Future] = {}
+        coalesced = 0
+
+        for i, invoice in enumerate(invoices):
+            key = status_key(invoice_type, invoice)
+            cached = self._cache.get(key)
+            if cached is not None:
+                invoice_status_cache_lookups.labels(invoice_type, "hit").inc()
+                results[i] = cached
+                if on_row is not None:
+                    on_row(i, dict(cached))
+            elif key in self._in_flight:
+                # Requested by another session or earlier in this batch: wait for that fetch.
+                invoice_status_cache_lookups.labels(invoice_type, "coalesced").inc()
+                coalesced += 1
+                waiting.append((i, self._in_flight[key]))
+            else:
+                invoice_status_cache_lookups.labels(invoice_type, "miss").inc()
+                future = asyncio.get_running_loop().create_future()
+                self._in_flight[key] = owned[key] = future
+                to_fetch[key] = invoice
+                fetch_index.append(i)
+                waiting.append((i, future))
+
+        streamed = set()
+        listening = True
+
+        def on_fetched(position: int, row: Dict) -> None:
+            streamed.add(fetch_index[position])
+            if listening:
+                on_row(fetch_index[position], dict(row))
+
+        if to_fetch:
+            # The fetch runs in its own task, so a caller that is cancelled (a client that went
+            # away) does not cancel the request other sessions are coalesced onto.
+            fetch = asyncio.ensure_future(self._fetch(invoice_type, to_fetch, owned, on_fetched if on_row is not None else None))
+            self._fetches.add(fetch)
+            fetch.add_done_callback(self._fetches.discard)
+            try:
+                await asyncio.shield(fetch)
+            except asyncio.CancelledError:
+                listening = False
+                raise
+
+        for i, future in waiting:
+            results[i] = await asyncio.shield(future)
+            if on_row is not None and i not in streamed:
+                on_row(i, dict(results[i]))  # coalesced onto another lookup's request
+        return [dict(row) for row in results], len(to_fetch), coalesced
+
+    async def _fetch(
+        self, invoice_type: str, to_fetch: Dict[StatusKey, Dict], owned: Dict[StatusKey, asyncio.Future],
+        on_row: Optional[Callable[[int, Dict], None]],
+    ) -> None:
+        """Looks up the misses in SAP and settles the futures every caller of those keys waits on."""
+        try:
+            rows = await self.sap_client.get_invoice_statuses(invoice_type, list(to_fetch.values()), on_row=on_row)
+            for key, row in zip(to_fetch, rows):
+                self._cache.set(key, row, ttl_seconds=self._ttl(row))
+                owned[key].set_result(row)
+        except Exception as exc:
+            for future in owned.values():
+                if not future.done():
+                    future.set_exception(exc)
+                    future.exception()  # Mark retrieved; waiters still receive it.
+            raise
+        finally:
+            for key, future in owned.items():
+                future.cancel()  # No-op once settled; only if the fetch itself was cancelled.
+                self._in_flight.pop(key, None)
@@ -0,0 +1,73 @@
+"""
+A local stand-in for the SAP S/4HANA invoice status API, for tests, benchmarks and local runs.
+
+Run it as a server with:
+
+    SAP_MOCK_LATENCY_MS=200 SAP_MOCK_ERROR_RATE=0.1 uvicorn src.agents.tools.mock_sap:app --port 8001
+
+or serve it in-process with `httpx.ASGITransport(app=create_mock_sap_app(...))`.
+"""
+import asyncio
+import os
+import random
+from typing import Dict, List, Optional
+from fastapi import FastAPI, Header, HTTPException
+from pydantic import BaseModel
+
+# Identifiers starting with this prefix are reported as not found.
+NOT_FOUND_PREFIX = "NF"
+
+STATUS_BY_TYPE = {
+    "PO": ("PAID", "The invoice has been paid in full."),
+    "NON_PO": ("PENDING_APPROVAL", "The invoice is pending approval."),
+}
+
+class StatusRequest(BaseModel):
+    type: str
+    invoices: List[Dict]
+
+def lookup_invoice(invoice_type: str, invoice: Dict) -> Optional[Dict]:
+    identifier = invoice.get("invoice_number") or invoice.get("acr_number") or ""
+    if invoice_type not in STATUS_BY_TYPE or str(identifier).startswith(NOT_FOUND_PREFIX):
+        return None
+    status_code, status_description = STATUS_BY_TYPE[invoice_type]
+    return {**invoice, "status_code": status_code, "status_description": status_description}
+
+def create_mock_sap_app(
+    latency_seconds: float = 0.0,
+    max_batch_size: int = 50,
+    error_rate: float = 0.0,
+    slow_rate: float = 0.0,
+    slow_latency_seconds: float = 1.0,
+    seed: Optional[int] = None,
+) -> FastAPI:
+    """
+    Builds the mock app. Every request waits `latency_seconds` before answering, like one SAP round trip.
+    For fault injection, a share `error_rate` of requests fail with 503 and a share `slow_rate`
+    wait `slow_latency_seconds` instead. Both can be changed on `app.state` while the app runs.
+    """
+    mock_app = FastAPI(title="Mock SAP invoice status API")
+    mock_app.state.requests = 0
+    mock_app.state.error_rate = error_rate
+    mock_app.state.slow_rate = slow_rate
+    rng = random.Random(seed)
+
+    @mock_app.post("/invoices/status")
+    async def invoice_status(request: StatusRequest, x_api_key: Optional[str] = Header(default=None)):
+        mock_app.state.requests += 1
+        if len(request.invoices) > max_batch_size:
+            raise HTTPException(status_code=413, detail=f"At most {max_batch_size} invoices per request.")
+        if rng.random() < mock_app.state.error_rate:
+            raise HTTPException(status_code=503, detail="SAP is temporarily unavailable.")
+        delay = slow_latency_seconds if rng.random() < mock_app.state.slow_rate else latency_seconds
+        if delay:
+            await asyncio.sleep(delay)
+        # One entry per requested invoice, in request order; null means not found.
+        return {"invoice_details": [lookup_invoice(request.type, invoice) for invoice in request.invoices]}
+
+    return mock_app
+
+app = create_mock_sap_app(
+    latency_seconds=float(os.getenv("SAP_MOCK_LATENCY_MS", "0")) / 1000,
+    error_rate=float(os.getenv("SAP_MOCK_ERROR_RATE", "0")),
+)
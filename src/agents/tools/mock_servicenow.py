@@ -0,0 +1,41 @@
+"""
+A local stand-in for the ServiceNow incident table API, for tests, benchmarks and local runs.
+
+Run it as a server with:
+
+    SERVICENOW_MOCK_LATENCY_MS=300 uvicorn src.agents.tools.mock_servicenow:app --port 8002
+
+or serve it in-process with `httpx.ASGITransport(app=create_mock_servicenow_app(...))`.
+"""
+import asyncio
+import itertools
+import os
+from typing import Dict
+from fastapi import Body, FastAPI
+
+def create_mock_servicenow_app(latency_seconds: float = 0.0) -> FastAPI:
+    """
+    Builds the mock app. Each created incident gets the next INC number.
+    """
+    mock_app = FastAPI(title="Mock ServiceNow incident API")
+    mock_app.state.incidents = []
+    ticket_numbers = itertools.count(12345)
+
+    @mock_app.get("/api/now/table/incident")
+    async def list_incidents(sysparm_query: str = ""):
+        # Only the "correlation_id=<id>" query used by the client is understood.
+        field, _, value = sysparm_query.partition("=")
+        matches = [incident for incident in mock_app.state.incidents if field and incident.get(field) == value]
+        return {"result": [{"number": incident["number"]} for incident in matches]}
+
+    @mock_app.post("/api/now/table/incident", status_code=201)
+    async def create_incident(incident: Dict = Body(...)):
+        if latency_seconds:
+            await asyncio.sleep(latency_seconds)
+        number = f"INC{next(ticket_numbers):07d}"
+        mock_app.state.incidents.append({**incident, "number": number})
+        return {"result": {"number": number, "sys_id": number.lower()}}
+
+    return mock_app
+
+app = create_mock_servicenow_app(latency_seconds=float(os.getenv("SERVICENOW_MOCK_LATENCY_MS", "0")) / 1000)
@@ -1,13 +1,29 @@
-import requests
-from typing import Optional
+import asyncio
+import logging
+import time
+import httpx
+from typing import Callable, Dict, List, Optional
 from src.core.config import settings
+from src.core.http import get_http_clients
+from src.core.metrics import GaugeFunction, dependency_duration, dependency_errors
+from src.core.telemetry import tracer
+from src.core.traffic import record_dependency
+from src.core.resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, LatencyTracker, call_with_resilience
+from src.agents.tools.invoice_status_cache import CachedInvoiceStatusLookup
+
+logger = logging.getLogger(__name__)
+
+NOT_FOUND_STATUS = {
+    "status_code": "NOT_FOUND",
+    "status_description": "The invoice was not found in SAP.",
+}
 
 def get_invoice_status_from_sap(payload: dict) -> Optional[dict]:
     """
     Makes an API call to the SAP S4 system with the JSON data.
     This is a mock implementation that returns detailed data for table generation.
     """
-    print(f"---CALLING SAP API with payload: {payload}---")
+    logger.debug("Mock SAP lookup for %s invoices", payload.get("type"))
     
     # In a real implementation, you would use settings.sap_api_url
     # and handle authentication with settings.sap_api_key
@@ -47,3 +63,179 @@ def get_invoice_status_from_sap(payload: dict) -> Optional[dict]:
         
     # Return None if the invoice is "not found" in the mock logic
     return None
+
+class SAPUnavailableError(Exception):
+    """SAP could not answer in time: deadline passed, retries exhausted or circuit open."""
+
+class SAPResponseError(Exception):
+    """SAP answered with a body that is not an invoice_details list, e.g. a proxy error page."""
+
+def _is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    return isinstance(exc, (httpx.TransportError, SAPResponseError))
+
+def _invoice_details(response: httpx.Response) -> List:
+    try:
+        payload = response.json()
+    except ValueError as exc:
+        raise SAPResponseError("SAP answered with a body that is not JSON") from exc
+    details = payload.get("invoice_details") if isinstance(payload, dict) else None
+    if details is None and isinstance(payload, dict):
+        return []
+    if not isinstance(details, list) or not all(row is None or isinstance(row, dict) for row in details):
+        raise SAPResponseError("SAP answered without an invoice_details list")
+    return details
+
+class SAPInvoiceStatusClient:
+    """
+    Batched invoice status lookups against the SAP S4 invoice status API.
+    The invoice list is split into SAP-sized chunks that are sent concurrently,
+    bounded by a semaphore, and the results are returned in input order.
+    `http_client` carries the SAP base URL, API key header and connection pool.
+    Every chunk request runs under the request deadline with jittered retries, an
+    optional hedged duplicate after the p95 latency (only when a concurrency slot is
+    free), and a circuit breaker shared by all lookups through this client.
+    """
+
+    def __init__(
+        self,
+        http_client: httpx.AsyncClient,
+        batch_size: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.http_client = http_client
+        self.batch_size = batch_size or settings.sap_batch_size
+        self._semaphore = asyncio.Semaphore(max_concurrency or settings.sap_max_concurrency)
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=settings.sap_breaker_failure_threshold,
+            window=settings.sap_breaker_window,
+            min_calls=settings.sap_breaker_min_calls,
+            reset_timeout=settings.sap_breaker_reset_seconds,
+        )
+        self.latency = LatencyTracker()
+
+    async def _post_chunk(self, invoice_type: str, chunk: List[Dict]) -> List:
+        attributes = {"sap.invoice_type": invoice_type, "sap.batch_size": len(chunk)}
+        started = time.perf_counter()
+        try:
+            with tracer.start_as_current_span("sap.invoice_status", attributes=attributes) as span:
+                response = await self.http_client.post(
+                    "/invoices/status",
+                    json={"type": invoice_type, "invoices": chunk},
+                )
+                span.set_attribute("http.status_code", response.status_code)
+                response.raise_for_status()
+                details = _invoice_details(response)
+                record_dependency("sap", "invoice_status", details, time.perf_counter() - started)
+                return details
+        except httpx.HTTPStatusError as exc:
+            dependency_errors.labels("sap", "invoice_status", str(exc.response.status_code)).inc()
+            raise
+        except Exception as exc:
+            dependency_errors.labels("sap", "invoice_status", type(exc).__name__).inc()
+            raise
+        finally:
+            dependency_duration.labels("sap", "invoice_status").observe(time.perf_counter() - started)
+
+    async def _fetch_chunk(self, invoice_type: str, chunk: List[Dict]) -> List[Dict]:
+        try:
+            async with self._semaphore:
+                details = await call_with_resilience(
+                    lambda: self._post_chunk(invoice_type, chunk),
+                    breaker=self.breaker,
+                    latency=self.latency,
+                    max_retries=settings.sap_max_retries,
+                    backoff_seconds=settings.sap_retry_backoff_seconds,
+                    is_retryable=_is_retryable,
+                    hedge_percentile=settings.sap_hedge_percentile,
+                    hedge_slot=self._semaphore,
+                )
+        except (DeadlineExceeded, CircuitOpenError, httpx.HTTPError, SAPResponseError) as exc:
+            if isinstance(exc, (DeadlineExceeded, CircuitOpenError)):
+                # Failures short of an HTTP attempt; attempt errors are counted in _post_chunk.
+                dependency_errors.labels("sap", "invoice_status", type(exc).__name__).inc()
+            raise SAPUnavailableError(str(exc) or type(exc).__name__) from exc
+        # SAP answers one entry per requested invoice; a missing or null entry is "not found".
+        return [
+            details[i] if i < len(details) and details[i] else {**invoice, **NOT_FOUND_STATUS}
+            for i, invoice in enumerate(chunk)
+        ]
+
+    async def get_invoice_statuses(
+        self, invoice_type: str, invoices: List[Dict], on_row: Optional[Callable[[int, Dict], None]] = None,
+    ) -> List[Dict]:
+        """Statuses in input order. `on_row(index, row)` is called for each row as soon as its chunk is back."""
+        async def fetch(offset: int, chunk: List[Dict]) -> List[Dict]:
+            rows = await self._fetch_chunk(invoice_type, chunk)
+            if on_row is not None:
+                for i, row in enumerate(rows):
+                    on_row(offset + i, row)
+            return rows
+
+        offsets = range(0, len(invoices), self.batch_size)
+        results = await asyncio.gather(*[fetch(i, invoices[i:i + self.batch_size]) for i in offsets])
+        return [row for chunk_rows in results for row in chunk_rows]
+
+_sap_client: Optional[SAPInvoiceStatusClient] = None
+
+def get_sap_client() -> SAPInvoiceStatusClient:
+    """Returns the SAP client bound to the shared, pooled SAP HTTP client."""
+    global _sap_client
+    http_client = get_http_clients().sap
+    if _sap_client is None or _sap_client.http_client is not http_client:
+        _sap_client = SAPInvoiceStatusClient(http_client)
+    return _sap_client
+
+_status_lookup: Optional[CachedInvoiceStatusLookup] = None
+
+GaugeFunction(
+    "invoice_status_cache_size",
+    "Invoice status rows held in the status cache.",
+    lambda: len(_status_lookup._cache) if _status_lookup is not None else 0,
+)
+
+def get_invoice_status_lookup() -> CachedInvoiceStatusLookup:
+    """Returns the process-wide status cache in front of the SAP client."""
+    global _status_lookup
+    sap_client = get_sap_client()
+    if _status_lookup is None:
+        _status_lookup = CachedInvoiceStatusLookup(sap_client)
+    _status_lookup.sap_client = sap_client
+    return _status_lookup
+
+async def aget_invoice_status_from_sap(payload: dict, on_row: Optional[Callable[[int, Dict], None]] = None) -> Optional[dict]:
+    """
+    Looks up every invoice in the payload through the status cache and the batched SAP client.
+    Falls back to the mock above while no SAP URL is configured.
+    Returns None when none of the invoices were found.
+    `on_row(index, row)` is called for each row as soon as it is known, in any order.
+    """
+    if settings.sap_api_url == "default":
+        result = get_invoice_status_from_sap(payload)
+        if result is not None and on_row is not None:
+            for i, row in enumerate(result["invoice_details"]):
+                on_row(i, row)
+        return result
+
+    invoices = payload.get("invoices") or []
+    if not invoices:
+        return None
+    rows = await get_invoice_status_lookup().get_invoice_statuses(payload.get("type"), invoices, on_row=on_row)
+    if all(row.get("status_code") == NOT_FOUND_STATUS["status_code"] for row in rows):
+        return None
+    return {"invoice_details": rows}
+
+async def aget_invoice_statuses(invoice_type: str, invoices: List[Dict]) -> List[Dict]:
+    """
+    One status row per invoice, in input order, with NOT_FOUND rows for unknown invoices.
+    Falls back to the mock above, invoice by invoice, while no SAP URL is configured.
+    """
+    if settings.sap_api_url == "default":
+        rows = []
+        for invoice in invoices:
+            result = get_invoice_status_from_sap({"type": invoice_type, "invoices": [invoice]})
+            rows.append(result["invoice_details"][0] if result else {**invoice, **NOT_FOUND_STATUS})
+        return rows
+    return await get_invoice_status_lookup().get_invoice_statuses(invoice_type, invoices)
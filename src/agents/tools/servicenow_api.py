@@ -1,15 +1,20 @@
-import requests
+import logging
+import time
+import httpx
+from typing import Optional
 from src.core.config import settings
+from src.core.http import get_http_clients
+from src.core.metrics import dependency_duration, dependency_errors
+from src.core.telemetry import tracer
+
+logger = logging.getLogger(__name__)
 
 def create_servicenow_ticket(email: str, vendor_number: str, details: str, conversation: str) -> str:
     """
     Creates a ServiceNow interaction ticket.
     This is a mock implementation.
     """
-    print(f"---CREATING SERVICENOW TICKET---")
-    print(f"Email: {email}")
-    print(f"Vendor Number: {vendor_number}")
-    print(f"Details: {details}")
+    logger.debug("Mock ServiceNow ticket for vendor %s", vendor_number)
     
     # In a real implementation, you would use settings.servicenow_instance_url,
     # settings.servicenow_username, and settings.servicenow_password
@@ -18,6 +23,53 @@ def create_servicenow_ticket(email: str, vendor_number: str, details: str, conve
     
     # Mock response: return a fake ticket number
     mock_ticket_number = "INC0012345"
-    print(f"Generated Ticket: {mock_ticket_number}")
     
     return mock_ticket_number
+
+async def acreate_servicenow_ticket(
+    email: str, vendor_number: str, details: str, conversation: str, correlation_id: Optional[str] = None,
+) -> str:
+    """
+    Creates a ServiceNow incident through the shared, pooled ServiceNow HTTP client.
+    With a `correlation_id`, an incident already created for it is returned instead of a new
+    one, so a job retried after an unacknowledged success does not open a duplicate.
+    Falls back to the mock above while no instance URL is configured.
+    """
+    with tracer.start_as_current_span("servicenow.create_incident") as span:
+        if settings.servicenow_instance_url == "default":
+            return create_servicenow_ticket(email, vendor_number, details, conversation)
+
+        started = time.perf_counter()
+        try:
+            client = get_http_clients().servicenow
+            if correlation_id:
+                existing = await client.get(
+                    "/api/now/table/incident",
+                    params={"sysparm_query": f"correlation_id={correlation_id}", "sysparm_fields": "number", "sysparm_limit": 1},
+                )
+                existing.raise_for_status()
+                found = existing.json().get("result") or []
+                if found:
+                    span.set_attribute("servicenow.existing_incident", True)
+                    return found[0]["number"]
+            response = await client.post(
+                "/api/now/table/incident",
+                json={
+                    "caller_id": email,
+                    "u_vendor_number": vendor_number,
+                    "short_description": details,
+                    "description": conversation,
+                    **({"correlation_id": correlation_id} if correlation_id else {}),
+                },
+            )
+            span.set_attribute("http.status_code", response.status_code)
+            response.raise_for_status()
+            return response.json()["result"]["number"]
+        except httpx.HTTPStatusError as exc:
+            dependency_errors.labels("servicenow", "create_incident", str(exc.response.status_code)).inc()
+            raise
+        except Exception as exc:
+            dependency_errors.labels("servicenow", "create_incident", type(exc).__name__).inc()
+            raise
+        finally:
+            dependency_duration.labels("servicenow", "create_incident").observe(time.perf_counter() - started)
@@ -0,0 +1,232 @@
+"""
+Durable outbox for ServiceNow tickets.
+
+The chat turn only records a ticket job in a Redis stream and answers with a provisional
+reference. A pool of background workers drains the stream, creates the incidents and writes
+the real INC number back to the session's history.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import redis.asyncio as redis
+from langchain_core.messages import AIMessage
+from src.core.config import settings
+from src.memory.short_term import append_messages_for_session, get_redis_client
+from src.agents.tools.servicenow_api import acreate_servicenow_ticket
+
+logger = logging.getLogger(__name__)
+
+TICKET_KEY_PREFIX = "servicenow_ticket:"
+CONSUMER_GROUP = "servicenow_workers"
+JOB_FIELDS = ("idempotency_key", "session_id", "email", "vendor_number", "details", "conversation")
+
+@dataclass
+class TicketReceipt:
+    reference: str
+    number: Optional[str] = None  # the INC number once a worker has created the ticket
+    duplicate: bool = False
+
+def ticket_idempotency_key(
+    session_id: Optional[str], email: str, vendor_number: str, invoices: Optional[List[Dict]] = None, details: str = "",
+) -> str:
+    """
+    One ticket per session, requester, set of invoices and complaint, however many times
+    the user answers "No"; a different escalation in the same session gets its own ticket.
+    """
+    subject = json.dumps([invoices or [], details.strip()], sort_keys=True, default=str)
+    raw = "\x1f".join([session_id or "", email.strip().lower(), vendor_number.strip().upper(), subject])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _decode(fields: Dict[bytes, bytes]) -> Dict[str, str]:
+    return {k.decode("utf-8"): v.decode("utf-8") for k, v in fields.items()}
+
+class TicketOutbox:
+    def __init__(self, client: Optional[redis.Redis] = None, stream: Optional[str] = None):
+        self.client = client if client is not None else get_redis_client()
+        self.stream = stream or settings.servicenow_outbox_stream
+        self._group_ready = False
+
+    async def enqueue(
+        self,
+        session_id: Optional[str],
+        email: str,
+        vendor_number: str,
+        details: str,
+        conversation: str,
+        invoices: Optional[List[Dict]] = None,
+    ) -> TicketReceipt:
+        """
+        Records a ticket job and returns its provisional reference without calling ServiceNow.
+        A job with the same idempotency key is not queued again; its existing receipt is returned.
+        A job that failed for good is queued again under its old reference, with fresh attempts.
+        The ticket hash and the stream entry are written in one MULTI, so there is never a
+        reference without a queued job.
+        """
+        key = ticket_idempotency_key(session_id, email, vendor_number, invoices, details)
+        ticket_key = f"{TICKET_KEY_PREFIX}{key}"
+        reference = f"TKT-{key[:10].upper()}"
+        job = dict(zip(JOB_FIELDS, (key, session_id or "", email, vendor_number, details, conversation)))
+        async with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(ticket_key)
+                    existing = _decode(await pipe.hgetall(ticket_key))
+                    if existing and existing.get("status") != "failed":
+                        return TicketReceipt(existing.get("reference", reference), existing.get("number"), duplicate=True)
+                    reference = existing.get("reference", reference)
+                    pipe.multi()
+                    pipe.hset(ticket_key, mapping={
+                        "reference": reference, "status": "queued", "session_id": session_id or "", "attempts": 0,
+                    })
+                    pipe.expire(ticket_key, settings.redis_session_ttl_seconds)
+                    pipe.xadd(self.stream, job, maxlen=settings.servicenow_outbox_max_length, approximate=True)
+                    await pipe.execute()
+                    return TicketReceipt(reference)
+                except redis.WatchError:
+                    continue  # Another worker claimed the key meanwhile; read its receipt.
+
+    async def get_ticket(self, idempotency_key: str) -> Dict[str, str]:
+        return _decode(await self.client.hgetall(f"{TICKET_KEY_PREFIX}{idempotency_key}"))
+
+    async def ensure_group(self) -> None:
+        if self._group_ready:
+            return
+        try:
+            await self.client.xgroup_create(self.stream, CONSUMER_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+        self._group_ready = True
+
+    async def _read_batch(self, consumer: str, block_ms: Optional[int]) -> List[Tuple[bytes, Dict[bytes, bytes]]]:
+        # Jobs whose worker failed or died are retried once they have been idle long enough.
+        _, entries, *_ = await self.client.xautoclaim(
+            self.stream,
+            CONSUMER_GROUP,
+            consumer,
+            min_idle_time=settings.servicenow_outbox_retry_after_ms,
+            count=settings.servicenow_outbox_batch_size,
+        )
+        entries = [entry for entry in entries if entry[1]]
+        room = settings.servicenow_outbox_batch_size - len(entries)
+        if room > 0:
+            response = await self.client.xreadgroup(
+                CONSUMER_GROUP, consumer, {self.stream: ">"}, count=room, block=None if entries else block_ms,
+            )
+            for _, stream_entries in response or []:
+                entries.extend(stream_entries)
+        return entries
+
+    async def _notify_session(self, job: Dict[str, str], message: str) -> None:
+        if job["session_id"]:
+            await append_messages_for_session(job["session_id"], [AIMessage(content=message)], client=self.client)
+
+    async def _process(self, entry_id: bytes, fields: Dict[bytes, bytes]) -> Optional[bytes]:
+        """Creates one ticket. Returns the entry id once it needs no further attempts."""
+        job = _decode(fields)
+        ticket_key = f"{TICKET_KEY_PREFIX}{job['idempotency_key']}"
+        ticket = _decode(await self.client.hgetall(ticket_key))
+        if ticket.get("status") == "created":
+            return entry_id  # Redelivered after the ticket was already created.
+        try:
+            # Bounded well below the reclaim idle time, so another worker never retries a job
+            # that is still in flight; the correlation id covers a success that was not acked.
+            number = await asyncio.wait_for(
+                acreate_servicenow_ticket(
+                    email=job["email"],
+                    vendor_number=job["vendor_number"],
+                    details=job["details"],
+                    conversation=job["conversation"],
+                    correlation_id=job["idempotency_key"],
+                ),
+                timeout=settings.servicenow_outbox_attempt_timeout_seconds,
+            )
+        except Exception as exc:
+            attempts = await self.client.hincrby(ticket_key, "attempts", 1)
+            logger.warning("ServiceNow ticket failed (attempt %d): %s", attempts, exc)
+            if attempts < settings.servicenow_outbox_max_attempts:
+                return None
+            await self.client.hset(ticket_key, "status", "failed")
+            await self._notify_session(
+                job, f"Your ServiceNow ticket {ticket.get('reference', '')} could not be created. Please contact the support desk.",
+            )
+            return entry_id
+
+        await self.client.hset(ticket_key, mapping={"status": "created", "number": number})
+        await self._notify_session(job, f"Your ServiceNow ticket {ticket.get('reference', '')} has been created as {number}.")
+        return entry_id
+
+    async def process_batch(self, consumer: str, block_ms: Optional[int] = None) -> int:
+        """Reads up to one batch of jobs, creates their tickets concurrently and acknowledges them together."""
+        await self.ensure_group()
+        entries = await self._read_batch(consumer, block_ms)
+        if not entries:
+            return 0
+        finished = [entry_id for entry_id in await asyncio.gather(*[self._process(*entry) for entry in entries]) if entry_id]
+        if finished:
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.xack(self.stream, CONSUMER_GROUP, *finished)
+                pipe.xdel(self.stream, *finished)
+                await pipe.execute()
+        return len(entries)
+
+class TicketWorkerPool:
+    """A fixed number of consumers draining the outbox until stopped."""
+
+    def __init__(self, outbox: TicketOutbox, workers: Optional[int] = None):
+        self.outbox = outbox
+        self.workers = workers or settings.servicenow_outbox_workers
+        self._tasks: List[asyncio.Task] = []
+
+    async def _run(self, consumer: str) -> None:
+        while True:
+            try:
+                if not await self.outbox.process_batch(consumer, block_ms=settings.servicenow_outbox_block_ms):
+                    # The blocking read normally did the waiting; this only stops a busy loop
+                    # when the server answers an empty read at once.
+                    await asyncio.sleep(0.1)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                # Redis unreachable or similar: back off and keep the worker alive.
+                logger.exception("ServiceNow outbox worker error: %s", exc)
+                await asyncio.sleep(1)
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run(f"worker-{i}")) for i in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+_outbox: Optional[TicketOutbox] = None
+_worker_pool: Optional[TicketWorkerPool] = None
+
+def get_ticket_outbox() -> TicketOutbox:
+    """Returns the process-wide outbox bound to the shared Redis pool."""
+    global _outbox
+    if _outbox is None:
+        _outbox = TicketOutbox()
+    return _outbox
+
+def start_ticket_workers() -> TicketWorkerPool:
+    """Starts the background ticket workers. Called once at app startup."""
+    global _worker_pool
+    if _worker_pool is None:
+        _worker_pool = TicketWorkerPool(get_ticket_outbox())
+        _worker_pool.start()
+    return _worker_pool
+
+async def stop_ticket_workers() -> None:
+    """Stops the workers; unacknowledged jobs stay in the stream for the next start. Called on shutdown."""
+    global _worker_pool, _outbox
+    if _worker_pool is not None:
+        await _worker_pool.stop()
+        _worker_pool = None
+    _outbox = None
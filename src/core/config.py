@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
 
 class Settings(BaseSettings):
     # LLM Provider
@@ -7,19 +7,118 @@ class Settings(BaseSettings):
     llm_api_key: str = "default"
     llm_model_name: str = "default"
 
+    # Per-task model routing: templates routed to "small" use a cheaper model first and are
+    # escalated to the main ("large") model when its answer fails validation
+    llm_small_provider: str = "ollama"
+    llm_small_model_name: Optional[str] = None  # None sends every task to the main model
+    llm_small_base_url: Optional[str] = None  # e.g. a local Ollama server
+    llm_task_tiers: Dict[str, str] = {
+        "intent_identification": "small",
+        "po_details_extraction": "small",
+        "non_po_details_extraction": "large",  # free-form lists of up to 50 invoices
+        "conversation_summary": "small",
+    }
+
+    # LLM response cache
+    llm_cache_enabled: bool = True
+    llm_cache_size: int = 2048
+    llm_cache_default_ttl_seconds: int = 600
+    llm_cache_ttl_seconds: Dict[str, int] = {
+        "intent_identification": 600,
+        "po_details_extraction": 3600,
+        "non_po_details_extraction": 3600,
+    }
+    llm_cache_redis_enabled: bool = False  # share entries across workers through Redis
+
+    # LLM micro-batching: concurrent calls of one prompt template share a provider request
+    llm_batch_enabled: bool = False  # answers come from one multi-request prompt; validate with your model first
+    llm_batch_window_ms: int = 10
+    llm_batch_max_size: int = 16
+
+    # Conversation context in prompts
+    context_max_turns: int = 6  # user/assistant turns
+    context_max_tokens: int = 500
+    context_tokenizer: str = "cl100k_base"  # tiktoken encoding; "" estimates tokens from length
+    context_summary_enabled: bool = False  # summarize the turns before the window with the LLM
+    context_summary_refresh_turns: int = 5
+
+    # Intent pre-classifier (fast path before the LLM)
+    intent_fast_path_threshold: float = 0.85
+    intent_model_enabled: bool = False  # TF-IDF + logistic regression; needs scikit-learn
+
+    # Conversation flow
+    detail_max_attempts: int = 3  # unreadable detail answers before a pending request starts over
+
     # SAP S4HANA
     sap_api_url: str = "default"
     sap_api_key: str = "default"
+    sap_batch_size: int = 10  # invoices per SAP request
+    sap_max_concurrency: int = 5  # SAP requests in flight per worker
+    sap_max_retries: int = 2
+    sap_retry_backoff_seconds: float = 0.2
+    sap_hedge_percentile: Optional[float] = 95.0  # None disables hedged requests
+    sap_breaker_failure_threshold: float = 0.5
+    sap_breaker_window: int = 20
+    sap_breaker_min_calls: int = 10
+    sap_breaker_reset_seconds: float = 30.0
+    invoice_status_cache_size: int = 10000
+    invoice_status_default_ttl_seconds: int = 300
+    invoice_status_ttl_seconds: Dict[str, int] = {
+        "PAID": 86400,
+        "PENDING_APPROVAL": 60,
+        "NOT_FOUND": 30,
+    }
+    bulk_status_max_rows: int = 10000  # rows per POST /invoices/status:bulk upload
+    bulk_status_max_line_bytes: int = 4096
+    bulk_status_max_chunks_in_flight: int = 4  # SAP chunks per upload; the client semaphore still applies
+    bulk_status_chunk_deadline_seconds: float = 10.0
 
     # ServiceNow
     servicenow_instance_url: str = "default"
     servicenow_username: str = "default"
     servicenow_password: str = "default"
+    servicenow_outbox_stream: str = "servicenow_outbox"  # Redis stream of pending ticket jobs
+    servicenow_outbox_workers: int = 2
+    servicenow_outbox_batch_size: int = 10
+    servicenow_outbox_block_ms: int = 1000
+    servicenow_outbox_attempt_timeout_seconds: float = 30.0  # one ServiceNow lookup + create
+    servicenow_outbox_retry_after_ms: int = 120000  # idle time before a job is retried; keep well above the attempt timeout
+    servicenow_outbox_max_attempts: int = 5
+    servicenow_outbox_max_length: int = 100000
+
+    # Outbound HTTP (SAP / ServiceNow); limits apply per integration host
+    http_connect_timeout_seconds: float = 3.0
+    http_read_timeout_seconds: float = 10.0
+    http_pool_timeout_seconds: float = 5.0
+    http_max_connections_per_host: int = 20
+    http_max_keepalive_connections_per_host: int = 10
+    http2_enabled: bool = True
+    chat_deadline_seconds: float = 20.0  # budget for one /chat turn, shared by every dependency call
 
     # Redis (for short-term memory)
     redis_host: str = "localhost"
     redis_port: int = 6379
     redis_password: Optional[str] = None
+    redis_max_connections: int = 50
+    redis_pool_timeout_seconds: int = 5
+    redis_session_ttl_seconds: int = 86400
+    redis_history_window: int = 20  # messages read back per turn
+    redis_history_max_messages: int = 200  # messages kept per session before trimming
+    message_compression_threshold_bytes: int = 512  # zstd-compress stored messages above this size
+
+    # Tracing (OpenTelemetry): "none", "otlp" (OTEL_EXPORTER_OTLP_* env vars), "file" or "console"
+    otel_exporter: str = "none"
+    otel_file_path: str = "traces.jsonl"
+    otel_service_name: str = "invoice-agent"
+
+    # Traffic recording for replay load tests (benchmarks/replay_traffic.py); PII is redacted
+    traffic_record_enabled: bool = False
+    traffic_record_path: str = "traffic.jsonl"
+    traffic_record_max_pending: int = 10000  # turns beyond this are dropped, never waited for
+
+    # Guardrails verdict cache
+    guardrails_cache_size: int = 4096
+    guardrails_cache_ttl_seconds: int = 3600
 
     # SAP HANA Cloud DB (for long-term memory)
     hana_db_address: str = "default"
@@ -27,6 +126,18 @@ class Settings(BaseSettings):
     hana_db_user: str = "default"
     hana_db_password: str = "default"
     hana_db_database: str = "default"
+    record_buffer_batch_size: int = 100  # conversation records per multi-row INSERT
+    record_buffer_flush_interval_ms: int = 500
+    record_buffer_max_pending: int = 10000  # unwritten records held; beyond this a record waits briefly, then is dropped
+    record_buffer_add_timeout_ms: int = 50  # longest a /chat turn waits for room in a full buffer
+    record_buffer_max_flush_attempts: int = 5  # a batch failing this many flushes in a row is dead-lettered
+    record_buffer_dead_letter_path: str = "conversation_records.deadletter.jsonl"
+    record_buffer_stop_timeout_seconds: float = 5.0  # final flush on shutdown
+    analytics_page_size_max: int = 1000
+    analytics_stream_chunk_size: int = 1000  # rows fetched per round trip by the NDJSON export
+    analytics_rollup_batch_size: int = 5000
+    analytics_rollup_interval_seconds: int = 60
+    analytics_rollup_safety_lag_seconds: float = 120.0  # records younger than this wait; keep above twice the longest insert
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,84 @@
+from dataclasses import dataclass
+from typing import Dict, Optional
+import httpx
+from src.core.config import settings
+
+try:
+    import h2  # noqa: F401  HTTP/2 support for httpx is optional.
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+@dataclass
+class IntegrationClients:
+    """
+    One pooled async HTTP client per integration host. Each client keeps its own
+    keep-alive pool, so the connection limits in Settings apply per host.
+    """
+    sap: httpx.AsyncClient
+    servicenow: httpx.AsyncClient
+
+    async def aclose(self) -> None:
+        await self.sap.aclose()
+        await self.servicenow.aclose()
+
+_clients: Optional[IntegrationClients] = None
+
+def build_http_client(
+    base_url: str,
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+    headers: Optional[Dict[str, str]] = None,
+    auth: Optional[httpx.Auth] = None,
+) -> httpx.AsyncClient:
+    """Builds a keep-alive client with the timeouts and pool limits from Settings."""
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers=headers,
+        auth=auth,
+        transport=transport,
+        http2=settings.http2_enabled and HTTP2_AVAILABLE and transport is None,
+        timeout=httpx.Timeout(
+            connect=settings.http_connect_timeout_seconds,
+            read=settings.http_read_timeout_seconds,
+            write=settings.http_read_timeout_seconds,
+            pool=settings.http_pool_timeout_seconds,
+        ),
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections_per_host,
+            max_keepalive_connections=settings.http_max_keepalive_connections_per_host,
+        ),
+    )
+
+def init_http_clients(transports: Optional[Dict[str, httpx.AsyncBaseTransport]] = None) -> IntegrationClients:
+    """
+    Creates the process-wide integration clients. Called once at app startup.
+    `transports` maps "sap"/"servicenow" to a transport, e.g. `httpx.ASGITransport`
+    around an in-process fake, for tests and benchmarks.
+    """
+    global _clients
+    if _clients is None:
+        transports = transports or {}
+        _clients = IntegrationClients(
+            sap=build_http_client(
+                settings.sap_api_url,
+                transport=transports.get("sap"),
+                headers={"x-api-key": settings.sap_api_key},
+            ),
+            servicenow=build_http_client(
+                settings.servicenow_instance_url,
+                transport=transports.get("servicenow"),
+                auth=httpx.BasicAuth(settings.servicenow_username, settings.servicenow_password),
+            ),
+        )
+    return _clients
+
+def get_http_clients() -> IntegrationClients:
+    """Returns the integration clients, creating them on first use outside the app lifespan."""
+    return init_http_clients()
+
+async def close_http_clients() -> None:
+    """Closes every pooled connection. Called on app shutdown."""
+    global _clients
+    if _clients is not None:
+        await _clients.aclose()
+        _clients = None
@@ -1,20 +1,57 @@
+from typing import Optional
 from langchain_community.chat_models import ChatOllama
 from langchain_openai import ChatOpenAI
 
+from src.agents.prompts import (
+    intent_identification_prompt,
+    non_po_details_extraction_prompt,
+    po_details_extraction_prompt,
+)
 from src.core.config import settings
+from src.core.llm_batch import BatchingLLM
+from src.core.llm_cache import CachedLLM
+from src.core.llm_router import TieredLLM
 
-def get_llm():
+def get_llm(provider: Optional[str] = None, model_name: Optional[str] = None, base_url: Optional[str] = None):
     """
-    Returns the configured LLM.
+    Returns the configured LLM, or the one for `provider`/`model_name` when given.
     """
-    if settings.llm_provider == "openai":
-        return ChatOpenAI(api_key=settings.llm_api_key, model=settings.llm_model_name)
-    elif settings.llm_provider == "ollama":
+    provider = provider or settings.llm_provider
+    model_name = model_name or settings.llm_model_name
+    if provider == "openai":
+        return ChatOpenAI(api_key=settings.llm_api_key, model=model_name, base_url=base_url)
+    elif provider == "ollama":
         # For local testing with Ollama
-        return ChatOllama(model=settings.llm_model_name)
+        return ChatOllama(model=model_name, base_url=base_url) if base_url else ChatOllama(model=model_name)
     else:
         # Default to a local model for safety, or raise an error
         # For now, let's raise an error if not configured
-        raise ValueError(f"Unsupported LLM provider: {settings.llm_provider}")
+        raise ValueError(f"Unsupported LLM provider: {provider}")
 
-llm = get_llm()
+def _with_cache(model, model_name: str) -> CachedLLM:
+    """
+    `model` behind the response cache and, when `llm_batch_enabled` is set, the
+    micro-batching dispatcher for the intent and extraction prompts.
+    Only cache misses reach the dispatcher.
+    """
+    if settings.llm_batch_enabled:
+        model = BatchingLLM(model, templates={
+            "intent_identification": intent_identification_prompt,
+            "po_details_extraction": po_details_extraction_prompt,
+            "non_po_details_extraction": non_po_details_extraction_prompt,
+        })
+    return CachedLLM(model, model_name=model_name)
+
+def build_llm():
+    """
+    The LLM the graph nodes call. With `llm_small_model_name` set, each prompt template
+    is routed to the tier in `llm_task_tiers`, escalating to the main model when needed.
+    """
+    large = _with_cache(get_llm(), settings.llm_model_name)
+    if not settings.llm_small_model_name:
+        return large
+    small_model = get_llm(settings.llm_small_provider, settings.llm_small_model_name, settings.llm_small_base_url)
+    small = _with_cache(small_model, settings.llm_small_model_name)
+    return TieredLLM({"small": small, "large": large}, routes=settings.llm_task_tiers)
+
+llm = build_llm()
@@ -0,0 +1,166 @@
+import asyncio
+import json
+from typing import Any, Dict, List, Optional, Set, Tuple
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import PromptTemplate
+from opentelemetry import trace
+from opentelemetry.context import Context
+from src.core.config import settings
+from src.core.metrics import llm_batch_size, llm_batches
+from src.core.telemetry import tracer
+
+_SENTINEL = "\0value\0"
+
+def split_template(template: PromptTemplate) -> Tuple[str, str]:
+    """
+    The static head and tail of every prompt rendered from `template`, in whole lines: the
+    text before the line of the first variable and after the line of the last one.
+    """
+    rendered = template.format(**{name: _SENTINEL for name in template.input_variables})
+    first, last = rendered.index(_SENTINEL), rendered.rindex(_SENTINEL) + len(_SENTINEL)
+    head = rendered[:rendered.rfind("\n", 0, first) + 1]
+    line_end = rendered.find("\n", last)
+    tail = rendered[line_end:] if line_end != -1 else ""
+    return head, tail
+
+def parse_batch_answers(content: str, expected: int) -> Optional[List[str]]:
+    """The per-request answers of a batched response, or None unless it is a JSON array of `expected` items."""
+    text = content.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        answers = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(answers, list) or len(answers) != expected:
+        return None
+    # Extraction answers are JSON objects; callers parse the content themselves, as for a single call.
+    return [answer if isinstance(answer, str) else json.dumps(answer) for answer in answers]
+
+class _Pending:
+    __slots__ = ("prompt", "body", "future", "caller")
+
+    def __init__(self, prompt: str, body: str, future: asyncio.Future, caller: trace.SpanContext):
+        self.prompt = prompt
+        self.body = body
+        self.future = future
+        self.caller = caller
+
+class BatchingLLM:
+    """
+    Micro-batches concurrent calls that use one of the registered prompt templates.
+
+    Calls of one template that arrive within `window_ms` of the first, up to `max_batch_size`,
+    become a single provider request: the template's static head and tail once, the varying
+    lines of each call as numbered requests, and an instruction to answer with a JSON array.
+    Each caller gets its element of the array as its own response, with an equal share of
+    the token usage. When the answer is not an array of the right length, every call of
+    the batch is retried on its own. A lone call is sent unchanged. Other prompts, and
+    calls with extra arguments, go straight to the wrapped model.
+    """
+
+    def __init__(
+        self,
+        llm: Any,
+        templates: Dict[str, PromptTemplate],
+        window_ms: Optional[int] = None,
+        max_batch_size: Optional[int] = None,
+    ):
+        self.llm = llm
+        self.window = (window_ms if window_ms is not None else settings.llm_batch_window_ms) / 1000
+        self.max_batch_size = max_batch_size or settings.llm_batch_max_size
+        self._templates = {name: split_template(template) for name, template in templates.items()}
+        self._pending: Dict[str, List[_Pending]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._dispatches: Set[asyncio.Task] = set()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.llm, name)
+
+    def _match(self, prompt: str) -> Optional[Tuple[str, str]]:
+        for name, (head, tail) in self._templates.items():
+            if prompt.startswith(head) and prompt.endswith(tail) and len(prompt) >= len(head) + len(tail):
+                return name, prompt[len(head):len(prompt) - len(tail)]
+        return None
+
+    async def ainvoke(self, prompt: Any, **kwargs) -> Any:
+        match = self._match(prompt) if isinstance(prompt, str) and not kwargs else None
+        if match is None:
+            return await self.llm.ainvoke(prompt, **kwargs)
+        name, body = match
+        loop = asyncio.get_running_loop()
+        pending = self._pending.setdefault(name, [])
+        pending.append(_Pending(prompt, body, loop.create_future(), trace.get_current_span().get_span_context()))
+        future = pending[-1].future
+        if len(pending) >= self.max_batch_size:
+            self._flush(name)
+        elif len(pending) == 1:
+            self._timers[name] = loop.call_later(self.window, self._flush, name)
+        return await future
+
+    def _flush(self, name: str) -> None:
+        timer = self._timers.pop(name, None)
+        if timer is not None:
+            timer.cancel()
+        calls = self._pending.pop(name, [])
+        if calls:
+            task = asyncio.create_task(self._dispatch(name, calls))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    def _combine(self, name: str, calls: List[_Pending]) -> str:
+        head, tail = self._templates[name]
+        requests = "\n".join(f"### Request {i}\n{call.body.rstrip()}\n" for i, call in enumerate(calls, start=1))
+        return (
+            f"{head}"
+            f"There are {len(calls)} separate requests below, numbered 1 to {len(calls)}. Handle each one on its own.\n\n"
+            f"{requests}"
+            f"{tail.rstrip()}\n\n"
+            f"Apply these instructions to every request separately. Respond with only a JSON array of {len(calls)} "
+            f"elements, where element i is the complete response to request i.\n"
+        )
+
+    async def _dispatch(self, name: str, calls: List[_Pending]) -> None:
+        llm_batch_size.labels(name).observe(len(calls))
+        if len(calls) == 1:
+            llm_batches.labels(name, "single").inc()
+            await self._answer(calls[0])
+            return
+
+        links = [trace.Link(call.caller) for call in calls if call.caller.is_valid]
+        # A batch serves many turns, so its span is a root linked to each caller's span.
+        with tracer.start_as_current_span(
+            "llm.batch", context=Context(), links=links, attributes={"llm.prompt_template": name, "llm.batch_size": len(calls)},
+        ) as span:
+            try:
+                response = await self.llm.ainvoke(self._combine(name, calls))
+            except Exception as exc:
+                llm_batches.labels(name, "error").inc()
+                for call in calls:
+                    if not call.future.done():
+                        call.future.set_exception(exc)
+                return
+            answers = parse_batch_answers(str(response.content), len(calls))
+            span.set_attribute("llm.batch_parsed", answers is not None)
+
+        if answers is None:
+            llm_batches.labels(name, "fallback").inc()
+            await asyncio.gather(*[self._answer(call) for call in calls])
+            return
+        llm_batches.labels(name, "batched").inc()
+        usage = getattr(response, "usage_metadata", None) or {}
+        share = {key: usage.get(key, 0) // len(calls) for key in ("input_tokens", "output_tokens", "total_tokens")}
+        for call, answer in zip(calls, answers):
+            if not call.future.done():  # the caller may have given up, e.g. at its deadline
+                call.future.set_result(AIMessage(content=answer, usage_metadata=share if usage else None))
+
+    async def _answer(self, call: _Pending) -> None:
+        """Sends one call's own prompt and settles its caller with the outcome."""
+        try:
+            response = await self.llm.ainvoke(call.prompt)
+        except Exception as exc:
+            if not call.future.done():
+                call.future.set_exception(exc)
+            return
+        if not call.future.done():
+            call.future.set_result(response)
@@ -0,0 +1,117 @@
+import hashlib
+import time
+from typing import Any, Optional, Tuple
+from langchain_core.messages import AIMessage
+from redis.exceptions import RedisError
+from src.core.config import settings
+from src.core.metrics import llm_cache_lookups, llm_call_duration, llm_tokens
+from src.core.telemetry import tracer
+from src.core.traffic import record_dependency
+from src.utils.cache import TTLCache
+
+REDIS_KEY_PREFIX = "llm_cache:"
+DEFAULT_PROMPT_TYPE = "default"
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapses whitespace so re-indented renderings of a template share a key."""
+    return " ".join(prompt.split())
+
+class CachedLLM:
+    """
+    Wraps a chat model with an exact-match response cache keyed on model name + normalized prompt.
+    Entries live in an in-process LRU and, when `llm_cache_redis_enabled` is set, in Redis so
+    every worker shares them. TTLs are chosen per prompt type. Anything other than
+    `ainvoke` is delegated to the wrapped model.
+    """
+
+    def __init__(self, llm: Any, model_name: str, redis_client: Any = None):
+        self.llm = llm
+        self.model_name = model_name
+        self._redis_client = redis_client
+        self._memory = TTLCache(maxsize=settings.llm_cache_size, ttl_seconds=settings.llm_cache_default_ttl_seconds)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.llm, name)
+
+    def _key(self, prompt: str) -> str:
+        digest = hashlib.sha256(f"{self.model_name}\0{normalize_prompt(prompt)}".encode()).hexdigest()
+        return f"{REDIS_KEY_PREFIX}{digest}"
+
+    def _ttl(self, prompt_type: str) -> int:
+        return settings.llm_cache_ttl_seconds.get(prompt_type, settings.llm_cache_default_ttl_seconds)
+
+    def _redis(self):
+        if not settings.llm_cache_redis_enabled:
+            return None
+        if self._redis_client is None:
+            from src.memory.short_term import get_redis_client
+            self._redis_client = get_redis_client()
+        return self._redis_client
+
+    async def _get_shared(self, key: str) -> Optional[str]:
+        client = self._redis()
+        if client is None:
+            return None
+        try:
+            value = await client.get(key)
+        except RedisError:
+            return None  # A cache outage must never fail the chat turn.
+        if value is None:
+            return None
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def _set_shared(self, key: str, content: str, ttl: int) -> None:
+        client = self._redis()
+        if client is None:
+            return
+        try:
+            await client.set(key, content.encode(), ex=ttl)
+        except RedisError:
+            pass
+
+    async def ainvoke(self, prompt: str, *, prompt_type: str = DEFAULT_PROMPT_TYPE, bypass_cache: bool = False, **kwargs) -> Any:
+        attributes = {"llm.model": self.model_name, "llm.prompt_template": prompt_type}
+        started = time.perf_counter()
+        with tracer.start_as_current_span("llm.invoke", attributes=attributes) as span:
+            response, cache = await self._ainvoke(span, prompt, prompt_type, bypass_cache, **kwargs)
+        elapsed = time.perf_counter() - started
+        llm_call_duration.labels(prompt_type, cache).observe(elapsed)
+        record_dependency("llm", prompt_type, str(response.content), elapsed)
+        return response
+
+    async def _call_model(self, span: Any, prompt: Any, prompt_type: str, **kwargs) -> Any:
+        response = await self.llm.ainvoke(prompt, **kwargs)
+        usage = getattr(response, "usage_metadata", None) or {}
+        if usage:
+            input_tokens, output_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+            span.set_attribute("llm.tokens.input", input_tokens)
+            span.set_attribute("llm.tokens.output", output_tokens)
+            llm_tokens.labels(prompt_type, "input").inc(input_tokens)
+            llm_tokens.labels(prompt_type, "output").inc(output_tokens)
+        return response
+
+    async def _ainvoke(self, span: Any, prompt: Any, prompt_type: str, bypass_cache: bool, **kwargs) -> Tuple[Any, str]:
+        """Returns the response and how the cache was involved: "hit", "miss" or "bypass"."""
+        if bypass_cache or not settings.llm_cache_enabled or not isinstance(prompt, str):
+            llm_cache_lookups.labels(prompt_type, "bypass").inc()
+            span.set_attribute("llm.cache_hit", False)
+            return await self._call_model(span, prompt, prompt_type, **kwargs), "bypass"
+
+        key = self._key(prompt)
+        content = self._memory.get(key)
+        if content is None:
+            content = await self._get_shared(key)
+            if content is not None:
+                self._memory.set(key, content, ttl_seconds=self._ttl(prompt_type))
+        span.set_attribute("llm.cache_hit", content is not None)
+        if content is not None:
+            llm_cache_lookups.labels(prompt_type, "hit").inc()
+            return AIMessage(content=content), "hit"
+
+        llm_cache_lookups.labels(prompt_type, "miss").inc()
+        response = await self._call_model(span, prompt, prompt_type, **kwargs)
+        content = str(response.content)
+        ttl = self._ttl(prompt_type)
+        self._memory.set(key, content, ttl_seconds=ttl)
+        await self._set_shared(key, content, ttl)
+        return response, "miss"
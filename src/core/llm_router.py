@@ -0,0 +1,89 @@
+import json
+import logging
+from typing import Any, Callable, Dict, Optional
+from opentelemetry import trace
+from pydantic import ValidationError
+from src.core.metrics import llm_escalations, llm_routed_calls
+from src.schemas.invoice import NonPOInvoice, POInvoice
+
+logger = logging.getLogger(__name__)
+
+LARGE_TIER = "large"
+INTENTS = {"PO", "NON_PO", "GREETING"}
+
+def _check_intent(content: str) -> Optional[str]:
+    intent = content.strip().strip('"').upper()
+    if intent == "UNKNOWN":
+        return "low_confidence"  # the small model could not tell; the large one may
+    return None if intent in INTENTS else "invalid"
+
+def _check_po_details(content: str) -> Optional[str]:
+    try:
+        POInvoice.model_validate(json.loads(content.strip()))
+    except (ValueError, ValidationError):
+        return "schema"
+    return None
+
+def _check_non_po_details(content: str) -> Optional[str]:
+    try:
+        details = json.loads(content.strip())
+        invoices = details.get("invoices") if isinstance(details, dict) else None
+        if not invoices:
+            return "schema"
+        for invoice in invoices:
+            NonPOInvoice.model_validate(invoice)
+    except (ValueError, ValidationError):
+        return "schema"
+    return None
+
+# Per prompt template: why an answer of a cheaper tier cannot be used as is, or None when it can.
+OUTPUT_CHECKS: Dict[str, Callable[[str], Optional[str]]] = {
+    "intent_identification": _check_intent,
+    "po_details_extraction": _check_po_details,
+    "non_po_details_extraction": _check_non_po_details,
+}
+
+def check_task_output(prompt_type: str, content: str) -> Optional[str]:
+    """The escalation reason for `content` as an answer to `prompt_type`, or None if it is acceptable."""
+    check = OUTPUT_CHECKS.get(prompt_type)
+    return check(content) if check is not None else None
+
+class TieredLLM:
+    """
+    Sends each call to the model tier configured for its prompt template in `routes`.
+    Templates without a route use the large tier. An answer from a cheaper tier that fails
+    `check_task_output`, or a failed call to it, is escalated to the large tier.
+    Anything other than `ainvoke` is delegated to the large tier.
+    """
+
+    def __init__(self, tiers: Dict[str, Any], routes: Dict[str, str]):
+        if LARGE_TIER not in tiers:
+            raise ValueError(f"The {LARGE_TIER!r} tier is required")
+        self.tiers = tiers
+        self.routes = routes
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.tiers[LARGE_TIER], name)
+
+    def tier_for(self, prompt_type: str) -> str:
+        tier = self.routes.get(prompt_type, LARGE_TIER)
+        return tier if tier in self.tiers else LARGE_TIER
+
+    async def ainvoke(self, prompt: Any, *, prompt_type: str = "default", **kwargs) -> Any:
+        tier = self.tier_for(prompt_type)
+        llm_routed_calls.labels(prompt_type, tier).inc()
+        if tier == LARGE_TIER:
+            return await self.tiers[LARGE_TIER].ainvoke(prompt, prompt_type=prompt_type, **kwargs)
+
+        try:
+            response = await self.tiers[tier].ainvoke(prompt, prompt_type=prompt_type, **kwargs)
+            reason = check_task_output(prompt_type, str(response.content))
+        except Exception as exc:
+            logger.warning("LLM tier %s failed for %s, escalating: %s", tier, prompt_type, exc)
+            reason = "error"
+        if reason is None:
+            return response
+
+        llm_escalations.labels(prompt_type, tier, reason).inc()
+        trace.get_current_span().add_event("llm.escalated", {"llm.tier": tier, "llm.escalation_reason": reason})
+        return await self.tiers[LARGE_TIER].ainvoke(prompt, prompt_type=prompt_type, **kwargs)
@@ -0,0 +1,193 @@
+"""
+Always-on aggregate metrics in the Prometheus text format, served at /metrics.
+
+Recording is a dict lookup plus plain attribute increments, with no locks: the app runs on one
+event loop, so updates made there are exact. Sync graph nodes run in executor threads; under
+heavy contention an increment from there can very rarely be lost, which is acceptable for
+monitoring and keeps the hot path cheap.
+"""
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self.labels()  # Unlabelled metrics are exported from the start, at zero.
+        REGISTRY.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            # setdefault keeps the first child if two callers race to create it.
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _render_child(self, values, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = 'le="+Inf"' if bound == float("inf") else f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class GaugeFunction(_Metric):
+    """A gauge read from a callback at scrape time, e.g. a queue depth."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], Optional[float]]):
+        super().__init__(name, documentation)
+        self.read = read
+
+    def _new_child(self):
+        return None
+
+    def render(self) -> List[str]:
+        value = self.read()
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        if value is not None:
+            lines.append(f"{self.name} {_format_value(value)}")
+        return lines
+
+REGISTRY: List[_Metric] = []
+
+def render_metrics() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Latency of HTTP requests by route.", ("method", "route", "status"),
+)
+node_duration = Histogram("agent_node_duration_seconds", "Duration of each graph node run.", ("node",))
+llm_call_duration = Histogram(
+    "llm_call_duration_seconds", "Duration of LLM calls by prompt template, including cache hits.", ("prompt_template", "cache"),
+)
+llm_routed_calls = Counter("llm_routed_calls_total", "LLM calls by prompt template and the model tier routed to.", ("prompt_template", "tier"))
+llm_escalations = Counter(
+    "llm_escalations_total", "LLM calls escalated from a cheaper tier to the large model.", ("prompt_template", "tier", "reason"),
+)
+llm_batches = Counter(
+    "llm_batches_total", "Micro-batched LLM dispatches by prompt template and outcome.", ("prompt_template", "outcome"),
+)
+llm_batch_size = Histogram(
+    "llm_batch_size", "Calls served by one micro-batched LLM dispatch.", ("prompt_template",), buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+llm_tokens = Counter("llm_tokens_total", "LLM tokens by prompt template and direction.", ("prompt_template", "direction"))
+dependency_duration = Histogram(
+    "dependency_request_duration_seconds", "Latency of SAP and ServiceNow requests.", ("dependency", "operation"),
+)
+dependency_errors = Counter("dependency_errors_total", "Failed SAP and ServiceNow requests.", ("dependency", "operation", "reason"))
+bulk_status_rows = Counter(
+    "bulk_invoice_status_rows_total", "Rows answered by the bulk invoice status endpoint.", ("invoice_type", "outcome"),
+)
+sessions_in_flight = Gauge("chat_sessions_in_flight", "Chat turns currently being processed.")
+conversation_records_dropped = Counter(
+    "conversation_records_dropped_total", "Conversation records not written to the database, by reason.", ("reason",),
+)
+guardrail_rejections = Counter("guardrail_rejections_total", "Messages rejected by guardrails.", ("section",))
+guardrails_cache_lookups = Counter(
+    "guardrails_cache_lookups_total", "Guardrails verdict cache lookups by section and result (hit, miss).", ("section", "result"),
+)
+intent_classifications = Counter(
+    "intent_classifications_total", "Intent lookups answered by the local fast path or sent to the LLM.", ("path",),
+)
+llm_cache_lookups = Counter(
+    "llm_cache_lookups_total", "LLM response cache lookups by prompt template and result (hit, miss, bypass).", ("prompt_template", "result"),
+)
+invoice_status_cache_lookups = Counter(
+    "invoice_status_cache_lookups_total",
+    "Invoice status lookups by result: hit, miss (sent to SAP) or coalesced onto an in-flight request.",
+    ("invoice_type", "result"),
+)
@@ -0,0 +1,205 @@
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Deque, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before the dependency answered."""
+
+class CircuitOpenError(Exception):
+    """The dependency is failing; calls are rejected until the breaker's cool-down ends."""
+
+# Absolute deadline (time.monotonic()) of the request being served. Context variables
+# are copied into every task, so the value follows the request through the graph nodes.
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+@contextmanager
+def deadline_scope(seconds: float) -> Iterator[None]:
+    """Sets a deadline `seconds` from now for everything awaited inside, keeping any tighter outer one."""
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining_seconds() -> Optional[float]:
+    """Seconds left before the current deadline, or None when no deadline is set."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+class LatencyTracker:
+    """Rolling window of call durations used to derive the hedging delay."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+class CircuitBreaker:
+    """
+    Opens when the failure rate over the last `window` calls reaches `failure_threshold`
+    (once at least `min_calls` were made), rejects calls for `reset_timeout` seconds,
+    then lets a single probe through: success closes it, failure re-opens it.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: float = 0.5,
+        window: int = 20,
+        min_calls: int = 10,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._clock = clock
+        self._opened_at: Optional[float] = None
+        self._probe_started_at: Optional[float] = None
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def _probe_in_flight(self) -> bool:
+        # A probe that never reported back (e.g. it was cancelled) stops blocking after a cool-down.
+        return self._probe_started_at is not None and self._clock() - self._probe_started_at < self.reset_timeout
+
+    def before_call(self) -> None:
+        state = self.state
+        if state == "open" or (state == "half_open" and self._probe_in_flight()):
+            self.rejected += 1
+            raise CircuitOpenError("Circuit open; dependency is failing")
+        if state == "half_open":
+            self._probe_started_at = self._clock()
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            self._opened_at = None
+            self._outcomes.clear()
+        self._probe_started_at = None
+        self._outcomes.append(True)
+
+    def record_failure(self) -> None:
+        if self._opened_at is not None:
+            # The half-open probe failed: start another cool-down.
+            self._opened_at = self._clock()
+            self._probe_started_at = None
+            return
+        self._outcomes.append(False)
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_threshold:
+            self._opened_at = self._clock()
+
+async def _with_deadline(attempt: Callable[[], Awaitable[T]]) -> T:
+    remaining = remaining_seconds()
+    if remaining is None:
+        return await attempt()
+    if remaining <= 0:
+        raise DeadlineExceeded()
+    try:
+        return await asyncio.wait_for(attempt(), timeout=remaining)
+    except asyncio.TimeoutError as exc:
+        raise DeadlineExceeded() from exc
+
+async def _hedged(
+    attempt: Callable[[], Awaitable[T]], hedge_delay: Optional[float], hedge_slot: Optional[asyncio.Semaphore] = None,
+) -> T:
+    """
+    Runs `attempt`; if it is still pending after `hedge_delay`, races a second copy against it.
+    The hedge takes a free slot of `hedge_slot` and is skipped when there is none, so hedging
+    never pushes the dependency past its concurrency limit. Both copies are cancelled once one
+    wins or the caller is cancelled.
+    """
+    pending = {asyncio.ensure_future(_with_deadline(attempt))}
+    try:
+        if hedge_delay is not None:
+            done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+            if not done and (hedge_slot is None or not hedge_slot.locked()):
+                if hedge_slot is not None:
+                    await hedge_slot.acquire()  # Free, so this does not wait.
+                hedge = asyncio.ensure_future(_with_deadline(attempt))
+                if hedge_slot is not None:
+                    hedge.add_done_callback(lambda _: hedge_slot.release())
+                pending.add(hedge)
+
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error  # type: ignore[misc]
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def call_with_resilience(
+    attempt: Callable[[], Awaitable[T]],
+    *,
+    breaker: CircuitBreaker,
+    latency: LatencyTracker,
+    max_retries: int,
+    backoff_seconds: float,
+    is_retryable: Callable[[BaseException], bool],
+    hedge_percentile: Optional[float] = None,
+    hedge_slot: Optional[asyncio.Semaphore] = None,
+) -> T:
+    """
+    Calls `attempt` under the current deadline with bounded, jittered retries, an optional
+    hedged second request after the tracked latency percentile (only while `hedge_slot` has a
+    free slot), and a circuit breaker.
+    """
+    for retry in range(max_retries + 1):
+        remaining = remaining_seconds()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded()
+        breaker.before_call()
+        started = time.monotonic()
+        hedge_delay = latency.percentile(hedge_percentile) if hedge_percentile else None
+        try:
+            result = await _hedged(attempt, hedge_delay, hedge_slot)
+        except DeadlineExceeded:
+            breaker.record_failure()
+            raise
+        except Exception as exc:
+            if not is_retryable(exc):
+                # The dependency answered (e.g. a 4xx); that is not an outage.
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            if retry == max_retries:
+                raise
+            # Full jitter, never sleeping past the deadline.
+            delay = random.uniform(0, backoff_seconds * 2 ** retry)
+            remaining = remaining_seconds()
+            if remaining is not None:
+                delay = min(delay, max(remaining, 0))
+            await asyncio.sleep(delay)
+            continue
+        breaker.record_success()
+        latency.record(time.monotonic() - started)
+        return result
+    raise AssertionError("unreachable")
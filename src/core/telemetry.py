@@ -0,0 +1,99 @@
+"""
+OpenTelemetry tracing for a /chat turn: graph nodes, LLM calls, guardrails, Redis and SAP/ServiceNow.
+
+Spans go nowhere until `init_tracing()` installs a provider (the API's default tracer is a no-op),
+so instrumented code costs next to nothing when tracing is off.
+"""
+import functools
+import hashlib
+import inspect
+import time
+from typing import IO, Any, Callable, Optional
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SpanExporter
+from src.core.config import settings
+from src.core.metrics import node_duration
+
+tracer = trace.get_tracer("invoice_agent")
+
+_provider: Optional[TracerProvider] = None
+_span_file: Optional[IO[str]] = None  # opened for the "file" exporter, closed on shutdown
+
+def session_hash(session_id: Optional[str]) -> str:
+    """Sessions are identified in spans by a short hash, never the raw id."""
+    return hashlib.sha256((session_id or "").encode("utf-8")).hexdigest()[:16]
+
+def _build_exporter() -> Optional[SpanExporter]:
+    global _span_file
+    if settings.otel_exporter == "otlp":
+        # Endpoint and headers come from the standard OTEL_EXPORTER_OTLP_* variables.
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    if settings.otel_exporter == "file":
+        _span_file = open(settings.otel_file_path, "a", encoding="utf-8")
+        return ConsoleSpanExporter(
+            out=_span_file,
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+    if settings.otel_exporter == "console":
+        return ConsoleSpanExporter()
+    return None
+
+def init_tracing(exporter: Optional[SpanExporter] = None) -> Optional[TracerProvider]:
+    """
+    Installs the process-wide tracer provider with the exporter chosen by `otel_exporter`
+    ("otlp", "file", "console" or "none"). Called once at app startup.
+    """
+    global _provider
+    if _provider is not None:
+        return _provider
+    exporter = exporter or _build_exporter()
+    if exporter is None:
+        return None
+    _provider = TracerProvider(resource=Resource.create({"service.name": settings.otel_service_name}))
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(_provider)
+    return _provider
+
+def shutdown_tracing() -> None:
+    """Flushes buffered spans and shuts the exporters down. Called on app shutdown."""
+    global _provider, _span_file
+    if _provider is not None:
+        _provider.shutdown()  # Flushes the batch processors, then shuts down their exporters.
+        _provider = None
+    if _span_file is not None:
+        _span_file.close()
+        _span_file = None
+
+def traced_node(name: str, node: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """Wraps a graph node so each run is a `node.<name>` span and a sample of its duration histogram."""
+    duration = node_duration.labels(name)
+
+    def start_span(state):
+        attributes = {"node.name": name}
+        if isinstance(state, dict) and state.get("session_id"):
+            attributes["session.hash"] = session_hash(state["session_id"])
+        return tracer.start_as_current_span(f"node.{name}", attributes=attributes)
+
+    if inspect.iscoroutinefunction(node):
+        @functools.wraps(node)
+        async def async_wrapper(state):
+            started = time.perf_counter()
+            try:
+                with start_span(state):
+                    return await node(state)
+            finally:
+                duration.observe(time.perf_counter() - started)
+        return async_wrapper
+
+    @functools.wraps(node)
+    def wrapper(state):
+        started = time.perf_counter()
+        try:
+            with start_span(state):
+                return node(state)
+        finally:
+            duration.observe(time.perf_counter() - started)
+    return wrapper
@@ -0,0 +1,124 @@
+"""
+Opt-in recording of /chat traffic for replay load tests (see `benchmarks/replay_traffic.py`).
+
+While a turn is recorded, the LLM and SAP clients report each response they return through
+`record_dependency`. The request, reply and those responses become one JSON line. Lines are
+queued and appended to the file by a background task, so a slow disk never delays a turn.
+"""
+import asyncio
+import json
+import logging
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_dependency_calls: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("traffic_dependency_calls", default=None)
+
+def record_dependency(kind: str, operation: str, response: Any, duration_seconds: float) -> None:
+    """Notes a dependency response for the turn being recorded; a no-op otherwise."""
+    calls = _dependency_calls.get()
+    if calls is not None:
+        calls.append({
+            "kind": kind,
+            "operation": operation,
+            "response": response,
+            "duration_ms": round(duration_seconds * 1000, 2),
+        })
+
+@contextmanager
+def capture_dependencies() -> Iterator[List[Dict[str, Any]]]:
+    """Collects the dependency responses of everything run inside the block, in call order."""
+    calls: List[Dict[str, Any]] = []
+    token = _dependency_calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _dependency_calls.reset(token)
+
+class TrafficRecorder:
+    """
+    Appends recorded turns to a JSONL file from a background task.
+
+    `record` never waits: beyond `max_pending` unwritten lines, new turns are dropped
+    and counted instead, because recording must not add backpressure to /chat.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_pending: Optional[int] = None, flush_interval_ms: int = 500):
+        self.path = path or settings.traffic_record_path
+        self.max_pending = max_pending or settings.traffic_record_max_pending
+        self.flush_interval = flush_interval_ms / 1000
+        self._pending: Deque[str] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.dropped = 0
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append(json.dumps(entry, default=str))
+
+    def _write(self, lines: List[str]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    async def flush(self) -> int:
+        """Writes every queued line. Returns how many were written."""
+        lines = list(self._pending)
+        if not lines:
+            return 0
+        await asyncio.to_thread(self._write, lines)
+        for _ in lines:
+            self._pending.popleft()
+        self.written += len(lines)
+        return len(lines)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except OSError as exc:
+                logger.warning("Traffic recording flush failed (%d pending): %s", len(self._pending), exc)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the background writer and writes everything still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": len(self._pending), "written": self.written, "dropped": self.dropped}
+
+_recorder: Optional[TrafficRecorder] = None
+
+def get_traffic_recorder() -> Optional[TrafficRecorder]:
+    """Returns the process-wide recorder, or None while recording is off."""
+    global _recorder
+    if _recorder is None and settings.traffic_record_enabled:
+        _recorder = TrafficRecorder()
+    return _recorder
+
+def start_traffic_recorder() -> Optional[TrafficRecorder]:
+    """Starts the background writer when `traffic_record_enabled` is set. Called once at app startup."""
+    recorder = get_traffic_recorder()
+    if recorder is not None:
+        recorder.start()
+    return recorder
+
+async def stop_traffic_recorder() -> None:
+    """Writes the remaining lines. Called on app shutdown."""
+    global _recorder
+    if _recorder is not None:
+        await _recorder.stop()
+        _recorder = None
@@ -1,20 +1,168 @@
-from fastapi import FastAPI, HTTPException, Query
+import asyncio
+import inspect
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from langchain_core.messages import AIMessage, HumanMessage
+from opentelemetry import trace
 
-from src.agents.graph import app as invoice_agent_app
+from src.agents.graph import workflow
+from src.agents.tools.bulk_status import (
+    OUTPUT_MEDIA_TYPES,
+    BulkUploadError,
+    bulk_invoice_statuses,
+    csv_header,
+    csv_line,
+    input_format,
+    ndjson_line,
+    open_upload,
+)
+from src.agents.tools.ticket_outbox import start_ticket_workers, stop_ticket_workers
+from src.core.config import settings
+from src.core.http import init_http_clients, close_http_clients
+from src.core.metrics import CONTENT_TYPE, http_request_duration, render_metrics, sessions_in_flight
+from src.core.resilience import deadline_scope
+from src.core.telemetry import init_tracing, session_hash, shutdown_tracing, tracer
+from src.core.traffic import capture_dependencies, get_traffic_recorder, start_traffic_recorder, stop_traffic_recorder
 from src.schemas.api import ChatRequest, ChatResponse
-from src.memory.short_term import get_history_for_session, save_history_for_session
-from src.memory.long_term import save_conversation_record, fetch_conversation_records
-from src.utils.guardrails import validate_input, validate_output, get_guardrails_errors, redact_pii, check_po_number_format, check_po_number_format
+from src.memory.short_term import get_history_for_session, append_messages_for_session, init_redis_pool, close_redis_pool
+from src.memory.checkpoint import RedisCheckpointSaver
+from src.memory.context import init_tokenizer
+from src.memory.long_term import (
+    fetch_analytics_summary,
+    fetch_conversation_records,
+    get_record_buffer,
+    save_conversation_record,
+    start_record_buffer,
+    start_rollup_job,
+    stop_record_buffer,
+    stop_rollup_job,
+    stream_conversation_records,
+)
+from src.utils.guardrails import evaluate_guardrails, check_po_number_format, redact_pii
+
+logger = logging.getLogger(__name__)
+
+# Each session is a LangGraph thread; its checkpoint lets the next turn resume at the pending node.
+invoice_agent_app = workflow.compile(checkpointer=RedisCheckpointSaver())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Creates process-wide resources on startup and releases them on shutdown.
+    """
+    init_tracing()
+    init_tokenizer()
+    init_redis_pool()
+    init_http_clients()
+    start_ticket_workers()
+    start_record_buffer()
+    start_rollup_job()
+    start_traffic_recorder()
+    try:
+        yield
+    finally:
+        # Each step runs even if an earlier one fails, so nothing is left open on shutdown.
+        for stop in (
+            stop_traffic_recorder,
+            stop_rollup_job,
+            stop_record_buffer,
+            stop_ticket_workers,
+            close_http_clients,
+            close_redis_pool,
+            shutdown_tracing,
+        ):
+            try:
+                result = stop()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("Shutdown step %s failed", stop.__name__)
 
 app = FastAPI(
     title="Invoice Agent API",
     description="API for the Invoice Agent chatbot.",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """
+    Observes every request in the per-route latency histogram, labelled by the route template.
+    """
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        http_request_duration.labels(
+            request.method, route.path if route is not None else "unmatched", str(status),
+        ).observe(time.perf_counter() - started)
+
+def _redacted(value: Any) -> Any:
+    """`redact_pii` applied to every string in a recorded dependency response."""
+    if isinstance(value, str):
+        return redact_pii(value)
+    if isinstance(value, dict):
+        return {key: _redacted(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_redacted(item) for item in value]
+    return value
+
+async def record_chat_traffic(request: Request, call_next):
+    """
+    Records each /chat request for replay load tests. The message, the reply and the LLM and
+    SAP responses pass through `redact_pii`, and the session is identified by its hash only.
+    """
+    recorder = get_traffic_recorder()
+    if recorder is None or request.method != "POST" or request.url.path != "/chat":
+        return await call_next(request)
+
+    arrived = time.time()
+    started = time.perf_counter()
+    body = await request.body()
+    with capture_dependencies() as dependencies:
+        response = await call_next(request)
+        content = b"".join([chunk async for chunk in response.body_iterator])
+    latency_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    try:
+        payload = json.loads(body)
+        reply = json.loads(content) if response.status_code == 200 else {}
+    except ValueError:
+        payload, reply = {}, {}
+    # Any JSON is recorded; a body that is not an object is rejected by validation (422).
+    payload = payload if isinstance(payload, dict) else {}
+    reply = reply if isinstance(reply, dict) else {}
+    for call in dependencies:
+        call["response"] = _redacted(call["response"])
+    recorder.record({
+        "ts": arrived,
+        "session": session_hash(payload.get("session_id")),
+        "message": redact_pii(str(payload.get("message", ""))),
+        "status": response.status_code,
+        "response": redact_pii(reply["response_message"]) if reply.get("response_message") else None,
+        "latency_ms": latency_ms,
+        "dependencies": dependencies,
+    })
+    return Response(
+        content=content, status_code=response.status_code, headers=dict(response.headers), media_type=response.media_type,
+    )
+
+# Opt-in, so the extra middleware layer costs nothing unless recording is enabled
+if settings.traffic_record_enabled:
+    app.middleware("http")(record_chat_traffic)
+
 class HealthCheck(BaseModel):
     status: str
 
@@ -23,6 +171,18 @@ class AnalyticsRecord(BaseModel):
     user_query: str
     agent_response: str
     final_status: Optional[str] = None
+    intent: Optional[str] = None
+    latency_ms: Optional[int] = None
+
+def turn_status(result: Dict) -> str:
+    """Outcome of a turn as recorded in the analytics table."""
+    if result.get("service_now_ticket"):
+        return "ESCALATED"
+    if result.get("is_satisfied"):
+        return "SATISFIED"
+    if result.get("awaiting_input"):
+        return f"AWAITING_{result['awaiting_input'].upper()}"
+    return "ANSWERED"
 
 @app.get("/health", response_model=HealthCheck, tags=["Health"])
 async def health_check():
@@ -31,6 +191,13 @@ async def health_check():
     """
     return {"status": "ok"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Aggregate metrics in the Prometheus text format.
+    """
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Invoice Agent API"}
@@ -40,13 +207,33 @@ async def chat(request: ChatRequest):
     """
     Main chat endpoint for the invoice agent.
     """
+    # One trace per turn; node, LLM, guardrails, Redis and SAP/ServiceNow spans nest under it.
+    in_flight = sessions_in_flight.labels()
+    in_flight.inc()
+    try:
+        with tracer.start_as_current_span("chat.turn", attributes={"session.hash": session_hash(request.session_id)}):
+            return await _chat_turn(request)
+    finally:
+        in_flight.dec()
+
+async def _chat_turn(request: ChatRequest) -> ChatResponse:
+    started = time.perf_counter()
+    agent_input, config = await _prepare_turn(request)
+    
+    # Invoke the agent without blocking the event loop; SAP calls inside share the turn's deadline
+    with deadline_scope(settings.chat_deadline_seconds):
+        result = await invoice_agent_app.ainvoke(agent_input, config)
+    return await _finish_turn(request, result, started)
+
+async def _prepare_turn(request: ChatRequest) -> Tuple[Dict, Dict]:
+    """Checks the message and returns the graph input and config for this turn."""
     session_id = request.session_id
     user_message = request.message
     
-    # Input guardrails
-    if not validate_input(user_message):
-        errors = get_guardrails_errors(user_message, section="input")
-        raise HTTPException(status_code=400, detail={"error": "Input failed guardrails validation.", "details": errors})
+    # Input guardrails (single pass)
+    input_verdict = evaluate_guardrails(user_message, section="input")
+    if not input_verdict.valid:
+        raise HTTPException(status_code=400, detail={"error": "Input failed guardrails validation.", "details": input_verdict.errors})
     
     # Advanced: Custom regex for po number (if present in input)
     import re
@@ -58,30 +245,46 @@ async def chat(request: ChatRequest):
     # Retrieve conversation history from Redis
     history = await get_history_for_session(session_id)
     
-    # Prepare the input for the LangGraph agent
+    # Prepare the input for the LangGraph agent. Slots from earlier turns come from the
+    # session checkpoint; per-turn outputs are reset so they are not reported twice.
     agent_input = {
+        "session_id": session_id,
         "user_query": user_message,
         "conversation_history": history,
+        "final_response": None,
+        "service_now_ticket": None,
+        "is_satisfied": None,
     }
+    config = {"configurable": {"thread_id": session_id}}
+    return agent_input, config
+
+async def _finish_turn(request: ChatRequest, result: Dict, started: float) -> ChatResponse:
+    """Checks the reply, stores the turn and builds the response."""
+    session_id = request.session_id
+    user_message = request.message
+    llm_response = result.get("final_response") or "I am sorry, something went wrong."
     
-    # Invoke the agent
-    result = invoice_agent_app.invoke(agent_input)
-    llm_response = result.get("final_response", "I am sorry, something went wrong.")
-    
-    # Output guardrails
-    if not validate_output(llm_response):
-        errors = get_guardrails_errors(llm_response, section="output")
-        raise HTTPException(status_code=400, detail={"error": "Output failed guardrails validation.", "details": errors})
-    
-    # Advanced: Redact PII in output if present
-    llm_response = redact_pii(llm_response)
+    # Output guardrails (single pass: validity, errors and PII redaction together)
+    output_verdict = evaluate_guardrails(llm_response, section="output")
+    if not output_verdict.valid:
+        raise HTTPException(status_code=400, detail={"error": "Output failed guardrails validation.", "details": output_verdict.errors})
+    llm_response = output_verdict.text
     
-    # Update history
-    history.append(HumanMessage(content=user_message))
-    history.append(AIMessage(content=llm_response))
+    # Append only this turn's messages to the history in Redis
+    await append_messages_for_session(
+        session_id,
+        [HumanMessage(content=user_message), AIMessage(content=llm_response)],
+    )
     
-    # Save updated history to Redis
-    save_history_for_session(session_id, history)
+    # Log the turn for analytics; the buffer writes it in the background
+    await get_record_buffer().add(
+        session_id=session_id,
+        user_query=user_message,
+        agent_response=llm_response,
+        final_status=turn_status(result),
+        intent=result.get("invoice_type"),
+        latency_ms=int((time.perf_counter() - started) * 1000),
+    )
     
     return ChatResponse(
         response_message=llm_response,
@@ -89,17 +292,173 @@ async def chat(request: ChatRequest):
         service_now_ticket=result.get("service_now_ticket")
     )
 
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream", tags=["Chat"])
+async def chat_stream(request: ChatRequest):
+    """
+    The same turn as /chat, streamed as Server-Sent Events:
+
+    - `node` when a graph node has run, with its name
+    - `status_header`, then `status_row` for each invoice status table line as SAP answers for it;
+      rows may arrive out of order and carry their `index`
+    - `done` with the /chat response body, whose `response_message` is the complete reply,
+      or `error` when the reply fails the output guardrails
+
+    Every streamed line passes the output guardrails on its own, and is redacted, before it is sent.
+    An invalid message is rejected with a 400 before the stream starts.
+    """
+    started = time.perf_counter()
+    span = tracer.start_span("chat.turn", attributes={"session.hash": session_hash(request.session_id), "chat.stream": True})
+    try:
+        with trace.use_span(span, end_on_exit=False):
+            agent_input, config = await _prepare_turn(request)
+    except BaseException as exc:
+        span.record_exception(exc)
+        span.end()
+        raise
+    return StreamingResponse(
+        _stream_turn(request, agent_input, config, started, span),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _stream_turn(request: ChatRequest, agent_input: Dict, config: Dict, started: float, span) -> AsyncIterator[str]:
+    in_flight = sessions_in_flight.labels()
+    in_flight.inc()
+    try:
+        with trace.use_span(span, end_on_exit=True):
+            result: Dict = {}
+            with deadline_scope(settings.chat_deadline_seconds):
+                async for mode, chunk in invoice_agent_app.astream(agent_input, config, stream_mode=["updates", "custom", "values"]):
+                    if mode == "values":
+                        result = chunk
+                    elif mode == "updates":
+                        for node in chunk:
+                            yield _sse("node", {"node": node})
+                    elif mode == "custom" and chunk.get("type") in ("status_header", "status_row"):
+                        verdict = evaluate_guardrails(chunk["text"], section="output")
+                        if verdict.valid:
+                            yield _sse(chunk["type"], {**chunk, "text": verdict.text})
+            try:
+                response = await _finish_turn(request, result, started)
+            except HTTPException as exc:
+                yield _sse("error", exc.detail)
+                return
+            yield _sse("done", response.model_dump())
+    finally:
+        in_flight.dec()
+
+class UploadStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse whose content is produced while the request body is still being read.
+    Starlette's disconnect listener would take the body messages away from that reader, so it
+    is left out; a client that goes away mid-upload still ends the reader with ClientDisconnect.
+    """
+
+    async def listen_for_disconnect(self, receive) -> None:
+        await asyncio.Event().wait()  # cancelled once the response has been sent
+
+@app.post("/invoices/status:bulk", tags=["Invoices"])
+async def bulk_invoice_status(
+    request: Request,
+    format: Optional[str] = Query(None, description="Result format, ndjson or csv; defaults to the upload's format"),
+):
+    """
+    Looks up the status of every invoice in a CSV (text/csv) or NDJSON (application/x-ndjson)
+    upload, without the chat flow. Rows have a `type` (PO or NON_PO) and the invoice fields
+    `po_number`, `acr_number`, `invoice_number` and `invoice_document_date`.
+
+    One result row per uploaded row is streamed back as rows are answered, with the upload
+    `line` it belongs to; rows are not in upload order. Invalid rows get status_code INVALID.
+    """
+    try:
+        upload_format = input_format(request.headers.get("content-type"))
+    except BulkUploadError as exc:
+        raise HTTPException(status_code=415, detail=str(exc))
+    output_format = format or upload_format
+    if output_format not in OUTPUT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"format must be ndjson or csv, not {output_format}")
+    try:
+        records = await open_upload(request.stream(), upload_format)
+    except BulkUploadError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    async def lines():
+        with tracer.start_as_current_span("invoices.bulk_status", attributes={"bulk.format": upload_format}) as span:
+            rows = 0
+            if output_format == "csv":
+                yield csv_header()
+            async for row in bulk_invoice_statuses(records):
+                rows += 1
+                yield csv_line(row) if output_format == "csv" else ndjson_line(row)
+            span.set_attribute("bulk.rows", rows)
+
+    return UploadStreamingResponse(lines(), media_type=OUTPUT_MEDIA_TYPES[output_format])
+
 @app.get("/analytics", tags=["Analytics"])
-async def get_analytics(session_id: Optional[str] = Query(None, description="Session ID to filter by")):
+async def get_analytics(
+    session_id: Optional[str] = Query(None, description="Session ID to filter by"),
+    final_status: Optional[str] = Query(None, description="Final status to filter by"),
+    start: Optional[datetime] = Query(None, description="Only records created at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only records created before this time"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(100, ge=1, le=settings.analytics_page_size_max),
+):
+    """
+    Fetch one page of conversation analytics from long-term memory, oldest first.
+    Pass the returned next_cursor to get the following page.
+    """
+    try:
+        records, next_cursor = await fetch_conversation_records(
+            session_id=session_id, final_status=final_status, start=start, end=end, cursor=cursor, limit=limit,
+        )
+        return {"records": records, "next_cursor": next_cursor}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/analytics/export", tags=["Analytics"])
+async def export_analytics(
+    session_id: Optional[str] = Query(None, description="Session ID to filter by"),
+    final_status: Optional[str] = Query(None, description="Final status to filter by"),
+    start: Optional[datetime] = Query(None, description="Only records created at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only records created before this time"),
+):
+    """
+    Stream every matching conversation record as NDJSON, one record per line.
     """
-    Fetch conversation analytics from long-term memory. Optionally filter by session_id.
+    async def lines():
+        async for record in stream_conversation_records(
+            session_id=session_id, final_status=final_status, start=start, end=end,
+        ):
+            yield json.dumps(record) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/analytics/summary", tags=["Analytics"])
+async def get_analytics_summary(
+    start_day: Optional[date] = Query(None, description="First day to include"),
+    end_day: Optional[date] = Query(None, description="Last day to include"),
+):
+    """
+    Satisfied and escalation rates, counts per day, final status and intent, and latency
+    percentiles, answered from the pre-aggregated rollups.
     """
     try:
-        records = await fetch_conversation_records(session_id=session_id)
-        return {"records": records}
+        return await fetch_analytics_summary(start_day=start_day, end_day=end_day)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/analytics/buffer", tags=["Analytics"])
+async def get_record_buffer_stats():
+    """
+    Depth and flush counters of the write-behind buffer for conversation records.
+    """
+    return get_record_buffer().stats()
+
 @app.post("/analytics", tags=["Analytics"])
 async def save_analytics(record: AnalyticsRecord):
     """
@@ -110,7 +469,9 @@ async def save_analytics(record: AnalyticsRecord):
             session_id=record.session_id,
             user_query=record.user_query,
             agent_response=record.agent_response,
-            final_status=record.final_status
+            final_status=record.final_status,
+            intent=record.intent,
+            latency_ms=record.latency_ms,
         )
         return {"status": "success"}
     except Exception as e:
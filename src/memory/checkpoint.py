@@ -0,0 +1,156 @@
+from typing import Any, AsyncIterator, Dict, Optional, Sequence
+import msgpack
+import redis.asyncio as redis
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from src.core.config import settings
+from src.core.telemetry import session_hash, tracer
+from src.memory.short_term import get_redis_client
+
+CHECKPOINT_KEY_PREFIX = "checkpoint:"
+WRITES_KEY_PREFIX = "checkpoint_writes:"
+
+class RedisCheckpointSaver(BaseCheckpointSaver):
+    """
+    LangGraph checkpointer that keeps the latest checkpoint of each thread (session) in Redis.
+
+    Only the latest checkpoint and its pending writes are stored: resuming a session at
+    its pending node is all the agent needs, so there is no time-travel history to grow.
+    Keys share the session TTL. Only the async API is implemented; the graph is always
+    run with `ainvoke`.
+    """
+
+    def __init__(self, client: Optional[redis.Redis] = None, ttl_seconds: Optional[int] = None):
+        super().__init__()
+        self._client = client
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.redis_session_ttl_seconds
+
+    @property
+    def client(self) -> redis.Redis:
+        # Resolved lazily so the graph can be compiled before the app creates the pool.
+        if self._client is None:
+            self._client = get_redis_client()
+        return self._client
+
+    @staticmethod
+    def _keys(config: RunnableConfig):
+        configurable = config["configurable"]
+        suffix = f"{configurable['thread_id']}:{configurable.get('checkpoint_ns', '')}"
+        return f"{CHECKPOINT_KEY_PREFIX}{suffix}", f"{WRITES_KEY_PREFIX}{suffix}"
+
+    @staticmethod
+    def _span_attributes(config: RunnableConfig):
+        return {"db.system": "redis", "session.hash": session_hash(config["configurable"]["thread_id"])}
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        checkpoint_key, writes_key = self._keys(config)
+        with tracer.start_as_current_span("redis.checkpoint.get", attributes=self._span_attributes(config)):
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.get(checkpoint_key)
+                pipe.hgetall(writes_key)
+                stored, stored_writes = await pipe.execute()
+        if stored is None:
+            return None
+
+        checkpoint_id, parent_id, checkpoint_type, checkpoint_bytes, metadata_type, metadata_bytes = msgpack.unpackb(stored)
+        requested_id = get_checkpoint_id(config)
+        if requested_id and requested_id != checkpoint_id:
+            return None  # Older checkpoints are not kept.
+
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        pending_writes = []
+        for _, write in sorted(stored_writes.items()):
+            write_checkpoint_id, task_id, channel, value_type, value_bytes = msgpack.unpackb(write)
+            if write_checkpoint_id == checkpoint_id:
+                pending_writes.append((task_id, channel, self.serde.loads_typed((value_type, value_bytes))))
+
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=self.serde.loads_typed((checkpoint_type, checkpoint_bytes)),
+            metadata=self.serde.loads_typed((metadata_type, metadata_bytes)),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                if parent_id
+                else None
+            ),
+            pending_writes=pending_writes,
+        )
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        if config is None or before is not None or limit == 0:
+            return
+        checkpoint_tuple = await self.aget_tuple(config)
+        if checkpoint_tuple is None:
+            return
+        if filter and any(checkpoint_tuple.metadata.get(k) != v for k, v in filter.items()):
+            return
+        yield checkpoint_tuple
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        checkpoint_key, writes_key = self._keys(config)
+        stored = msgpack.packb([
+            checkpoint["id"],
+            config["configurable"].get("checkpoint_id"),  # parent
+            *self.serde.dumps_typed(checkpoint),
+            *self.serde.dumps_typed(get_checkpoint_metadata(config, metadata)),
+        ])
+        with tracer.start_as_current_span("redis.checkpoint.put", attributes=self._span_attributes(config)):
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.set(checkpoint_key, stored, ex=self.ttl_seconds)
+                pipe.delete(writes_key)  # Writes of the previous checkpoint are now applied.
+                await pipe.execute()
+        return {
+            "configurable": {
+                "thread_id": config["configurable"]["thread_id"],
+                "checkpoint_ns": config["configurable"].get("checkpoint_ns", ""),
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        _, writes_key = self._keys(config)
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        fields = {}
+        for idx, (channel, value) in enumerate(writes):
+            write_idx = WRITES_IDX_MAP.get(channel, idx)
+            fields[f"{task_id}:{write_idx:08d}"] = msgpack.packb([checkpoint_id, task_id, channel, *self.serde.dumps_typed(value)])
+        if not fields:
+            return
+        with tracer.start_as_current_span("redis.checkpoint.put_writes", attributes=self._span_attributes(config)):
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.hset(writes_key, mapping=fields)
+                pipe.expire(writes_key, self.ttl_seconds)
+                await pipe.execute()
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        checkpoint_key, writes_key = self._keys({"configurable": {"thread_id": thread_id}})
+        await self.client.delete(checkpoint_key, writes_key)
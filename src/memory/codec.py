@@ -0,0 +1,74 @@
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Optional
+import msgpack
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from src.core.config import settings
+
+try:
+    import zstandard
+except ImportError:  # Compression is optional; messages are stored uncompressed without it.
+    zstandard = None
+
+# Reused across calls; building a (de)compressor context costs more than compressing a message.
+_compressor = zstandard.ZstdCompressor() if zstandard is not None else None
+_decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+
+# One-byte header in front of every stored message.
+RAW = b"\x00"
+ZSTD = b"\x01"
+
+class MessageRole(IntEnum):
+    HUMAN = 0
+    AI = 1
+    SYSTEM = 2
+
+_ROLE_BY_TYPE = {
+    HumanMessage: MessageRole.HUMAN,
+    AIMessage: MessageRole.AI,
+    SystemMessage: MessageRole.SYSTEM,
+}
+_TYPE_BY_ROLE = {role: message_type for message_type, role in _ROLE_BY_TYPE.items()}
+
+@dataclass(frozen=True)
+class StoredMessage:
+    """
+    The only parts of a conversation message that are persisted.
+    """
+    role: MessageRole
+    content: str
+
+    @classmethod
+    def from_message(cls, message: BaseMessage) -> "StoredMessage":
+        role = _ROLE_BY_TYPE.get(type(message))
+        if role is None:
+            raise ValueError(f"Unsupported message type: {type(message).__name__}")
+        return cls(role=role, content=str(message.content))
+
+    def to_message(self) -> BaseMessage:
+        return _TYPE_BY_ROLE[self.role](content=self.content)
+
+def encode_message(message: BaseMessage, compress_threshold: Optional[int] = None) -> bytes:
+    """
+    Encodes a message as msgpack `[role, content]`, zstd-compressed when it exceeds the threshold.
+    """
+    stored = StoredMessage.from_message(message)
+    packed = msgpack.packb((int(stored.role), stored.content))
+    threshold = compress_threshold if compress_threshold is not None else settings.message_compression_threshold_bytes
+    if zstandard is not None and len(packed) > threshold:
+        return ZSTD + _compressor.compress(packed)
+    return RAW + packed
+
+def decode_message(data: bytes) -> BaseMessage:
+    """
+    Decodes bytes produced by `encode_message` back into a Human/AI/System message.
+    """
+    header, body = data[:1], data[1:]
+    if header == ZSTD:
+        if _decompressor is None:
+            raise RuntimeError("zstandard is required to decode a compressed message")
+        body = _decompressor.decompress(body)
+    elif header != RAW:
+        raise ValueError(f"Unknown message encoding header: {header!r}")
+    role, content = msgpack.unpackb(body)
+    return StoredMessage(role=MessageRole(role), content=content).to_message()
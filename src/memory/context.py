@@ -0,0 +1,135 @@
+"""
+Conversation context for prompts: the most recent turns as compact "role: content" lines,
+kept within a token budget, optionally preceded by a rolling summary of the older turns.
+"""
+import asyncio
+import logging
+import math
+from typing import Awaitable, Callable, List, Optional, Sequence, Set, Tuple
+from langchain_core.messages import BaseMessage
+from redis.exceptions import RedisError
+from src.core.config import settings
+from src.memory.short_term import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_KEY_PREFIX = "context_summary:"
+ROLES = {"human": "user", "ai": "assistant"}
+
+_encoding = None
+
+def init_tokenizer() -> None:
+    """
+    Loads the tiktoken encoding named by `context_tokenizer`. Called once at app startup.
+    Until it is loaded, or when it cannot be, tokens are estimated from the text length.
+    """
+    global _encoding
+    if _encoding is not None or not settings.context_tokenizer:
+        return
+    try:
+        import tiktoken
+        _encoding = tiktoken.get_encoding(settings.context_tokenizer)
+    except Exception as exc:  # Not installed, or the encoding file is not cached and cannot be fetched.
+        logger.warning("Tokenizer %s unavailable, estimating token counts: %s", settings.context_tokenizer, exc)
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode_ordinary(text))
+    return math.ceil(len(text) / 4)  # About four characters per token in English text.
+
+def render_message(message: BaseMessage) -> str:
+    role = ROLES.get(message.type, message.type)
+    return f"{role}: {' '.join(str(message.content).split())}"
+
+def render_recent_turns(messages: Sequence[BaseMessage], max_turns: int, max_tokens: int) -> Tuple[List[str], int]:
+    """
+    The last `max_turns` user/assistant turns as lines, oldest first, without the oldest
+    lines that do not fit in `max_tokens`. Also returns how many messages were left out.
+    """
+    lines: List[str] = []
+    used = 0
+    for message in reversed(messages[-2 * max_turns:] if max_turns > 0 else []):
+        line = render_message(message)
+        cost = count_tokens(line) + 1  # and the newline
+        if used + cost > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+    lines.reverse()
+    return lines, len(messages) - len(lines)
+
+class ConversationContextBuilder:
+    """
+    Builds the `conversation_history` text of a prompt.
+
+    With a `summarize` callable, the turns left out of the window are represented by a
+    per-session summary kept in Redis. The summary is refreshed in the background, at
+    most every `refresh_turns` turns, so a turn never waits for it; the summary may
+    lag by up to that many turns.
+    """
+
+    def __init__(
+        self,
+        max_turns: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+        summarize: Optional[Callable[[str, List[str]], Awaitable[str]]] = None,
+        refresh_turns: Optional[int] = None,
+        client=None,
+    ):
+        self.max_turns = max_turns if max_turns is not None else settings.context_max_turns
+        self.max_tokens = max_tokens if max_tokens is not None else settings.context_max_tokens
+        self.summarize = summarize
+        self.refresh_turns = refresh_turns or settings.context_summary_refresh_turns
+        self._client = client
+        self._refreshes: Set[asyncio.Task] = set()
+
+    def _redis(self):
+        if self._client is None:
+            self._client = get_redis_client()
+        return self._client
+
+    async def build(self, messages: Sequence[BaseMessage], session_id: Optional[str] = None) -> str:
+        if self.summarize is None or not session_id:
+            return "\n".join(render_recent_turns(messages, self.max_turns, self.max_tokens)[0])
+
+        summary = await self._read_summary(session_id)
+        lines: List[str] = []
+        budget = self.max_tokens
+        if summary:
+            summary_line = f"summary of earlier turns: {summary}"
+            if count_tokens(summary_line) + 1 <= budget:
+                lines.append(summary_line)
+                budget -= count_tokens(summary_line) + 1
+        recent, omitted = render_recent_turns(messages, self.max_turns, budget)
+        if omitted:
+            await self._maybe_refresh(session_id, summary, [render_message(m) for m in messages[:omitted]])
+        return "\n".join(lines + recent)
+
+    async def _read_summary(self, session_id: str) -> Optional[str]:
+        try:
+            summary = await self._redis().hget(f"{SUMMARY_KEY_PREFIX}{session_id}", "text")
+        except RedisError:
+            return None  # A summary is an optimization; the recent turns are enough to go on.
+        return summary.decode() if isinstance(summary, bytes) else summary
+
+    async def _maybe_refresh(self, session_id: str, summary: Optional[str], older_lines: List[str]) -> None:
+        key = f"{SUMMARY_KEY_PREFIX}{session_id}"
+        try:
+            turns = await self._redis().hincrby(key, "turns", 1)
+        except RedisError:
+            return
+        if summary is not None and turns < self.refresh_turns:
+            return
+        task = asyncio.create_task(self._refresh(key, summary, older_lines))
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
+
+    async def _refresh(self, key: str, summary: Optional[str], older_lines: List[str]) -> None:
+        try:
+            text = await self.summarize(summary or "", older_lines)
+            async with self._redis().pipeline(transaction=False) as pipe:
+                pipe.hset(key, mapping={"text": " ".join(text.split()), "turns": 0})
+                pipe.expire(key, settings.redis_session_ttl_seconds)
+                await pipe.execute()
+        except Exception as exc:
+            logger.warning("Conversation summary refresh failed: %s", exc)
@@ -1,21 +1,63 @@
 import asyncio
-from typing import Optional, List, Dict
+import base64
+import json
+import logging
+from bisect import bisect_left
+from collections import Counter, deque
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Deque, Optional, List, Dict, Tuple
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.ext.asyncio import async_sessionmaker
-from sqlalchemy import Column, Integer, String, Text, DateTime, func, select
+from sqlalchemy import Column, Date, Index, Integer, String, Text, DateTime, and_, func, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 from src.core.config import settings
+from src.core.metrics import GaugeFunction, conversation_records_dropped
+
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
 class ConversationRecord(Base):
     __tablename__ = "conversation_records"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    session_id = Column(String(128), nullable=False)
+    session_id = Column(String(128), nullable=False, index=True)
     user_query = Column(Text, nullable=False)
     agent_response = Column(Text, nullable=False)
     final_status = Column(String(64), nullable=True)
-    created_at = Column(DateTime, server_default=func.now())
+    intent = Column(String(32), nullable=True)  # invoice_type of the session when the turn ended
+    latency_ms = Column(Integer, nullable=True)
+    created_at = Column(DateTime, server_default=func.now(), index=True)
+    # Always set by the database when the row is inserted; the rollups use it to wait out
+    # inserts that allocated a lower id but had not committed yet.
+    inserted_at = Column(DateTime, server_default=func.now(), nullable=True)
+
+    # Keyset pagination walks (created_at, id).
+    __table_args__ = (Index("ix_conversation_records_created_at_id", "created_at", "id"),)
+
+# Upper bounds (ms) of the latency histogram buckets kept in the rollups; the last bucket is open-ended.
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+class ConversationRollup(Base):
+    """Turn counts per day, final_status and intent."""
+    __tablename__ = "conversation_rollups"
+    day = Column(Date, primary_key=True)
+    final_status = Column(String(64), primary_key=True)
+    intent = Column(String(32), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class LatencyRollup(Base):
+    """Turn latency histogram per day; `bucket` indexes LATENCY_BUCKETS_MS."""
+    __tablename__ = "latency_rollups"
+    day = Column(Date, primary_key=True)
+    bucket = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class RollupCheckpoint(Base):
+    """Highest conversation_records.id already folded into the rollups."""
+    __tablename__ = "rollup_checkpoints"
+    name = Column(String(64), primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
 
 # Build the SAP HANA Cloud DB connection string
 DB_URL = f"postgresql+asyncpg://{settings.hana_db_user}:{settings.hana_db_password}@{settings.hana_db_address}:{settings.hana_db_port}/{settings.hana_db_database}"
@@ -31,7 +73,9 @@ async def save_conversation_record(
     session_id: str,
     user_query: str,
     agent_response: str,
-    final_status: Optional[str] = None
+    final_status: Optional[str] = None,
+    intent: Optional[str] = None,
+    latency_ms: Optional[int] = None,
 ) -> None:
     """Save a conversation record to SAP HANA Cloud."""
     async with AsyncSessionLocal() as session:
@@ -39,27 +83,479 @@ async def save_conversation_record(
             session_id=session_id,
             user_query=user_query,
             agent_response=agent_response,
-            final_status=final_status
+            final_status=final_status,
+            intent=intent,
+            latency_ms=latency_ms,
         )
         session.add(record)
         await session.commit()
 
-async def fetch_conversation_records(session_id: Optional[str] = None) -> List[Dict]:
-    """Fetch conversation records by session_id (or all if None)."""
-    async with AsyncSessionLocal() as session:
-        stmt = select(ConversationRecord)
-        if session_id:
-            stmt = stmt.where(ConversationRecord.session_id == session_id)
+class ConversationRecordBuffer:
+    """
+    Write-behind buffer for `ConversationRecord` inserts.
+
+    Records are queued in memory and written with one multi-row INSERT once
+    `batch_size` records are waiting or `flush_interval_ms` has passed, and on `stop()`.
+    At most `max_pending` records are held: when the DB lags, `add` waits up to
+    `add_timeout_ms` for room and then drops the record, so a turn is never held up
+    for long by analytics. A failed flush keeps its records and is retried on the next
+    cycle; a batch that fails `max_flush_attempts` times in a row is appended to the
+    dead-letter file instead, so one bad row cannot wedge the queue.
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[async_sessionmaker] = None,
+        batch_size: Optional[int] = None,
+        flush_interval_ms: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        add_timeout_ms: Optional[int] = None,
+        max_flush_attempts: Optional[int] = None,
+        dead_letter_path: Optional[str] = None,
+    ):
+        self.session_factory = session_factory or AsyncSessionLocal
+        self.batch_size = batch_size or settings.record_buffer_batch_size
+        self.flush_interval = (flush_interval_ms or settings.record_buffer_flush_interval_ms) / 1000
+        self.add_timeout = (add_timeout_ms if add_timeout_ms is not None else settings.record_buffer_add_timeout_ms) / 1000
+        self.max_flush_attempts = max_flush_attempts or settings.record_buffer_max_flush_attempts
+        self.dead_letter_path = dead_letter_path or settings.record_buffer_dead_letter_path
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._room = asyncio.Semaphore(max_pending or settings.record_buffer_max_pending)
+        self._batch_ready = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._head_failures = 0  # failed flushes of the batch at the head of the queue
+        self.flushed = 0
+        self.batches = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.dead_lettered = 0
+
+    @property
+    def depth(self) -> int:
+        """Records accepted but not yet written."""
+        return len(self._pending)
+
+    async def add(
+        self,
+        session_id: str,
+        user_query: str,
+        agent_response: str,
+        final_status: Optional[str] = None,
+        intent: Optional[str] = None,
+        latency_ms: Optional[int] = None,
+    ) -> None:
+        """Queues one record; only waits, briefly, when the buffer is full."""
+        try:
+            await asyncio.wait_for(self._room.acquire(), timeout=self.add_timeout)
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            conversation_records_dropped.labels("buffer_full").inc()
+            logger.warning("Conversation record buffer full (%d pending), record dropped", self.depth)
+            return
+        self._pending.append({
+            "session_id": session_id,
+            "user_query": user_query,
+            "agent_response": agent_response,
+            "final_status": final_status,
+            "intent": intent,
+            "latency_ms": latency_ms,
+            # Stamped now, not at flush time, so created_at still orders the turns.
+            "created_at": datetime.now(timezone.utc).replace(tzinfo=None),
+        })
+        if len(self._pending) >= self.batch_size:
+            self._batch_ready.set()
+
+    async def flush(self) -> int:
+        """Writes up to one batch with a single INSERT. Returns how many records were written."""
+        async with self._flush_lock:
+            rows = [self._pending[i] for i in range(min(self.batch_size, len(self._pending)))]
+            if not rows:
+                return 0
+            try:
+                async with self.session_factory() as session:
+                    await session.execute(insert(ConversationRecord).values(rows))
+                    await session.commit()
+            except Exception:
+                self.failed_flushes += 1
+                self._head_failures += 1
+                if self._head_failures >= self.max_flush_attempts:
+                    await self._dead_letter(len(rows))
+                raise
+            self._release(len(rows))
+            self.flushed += len(rows)
+            self.batches += 1
+            return len(rows)
+
+    def _release(self, count: int) -> None:
+        for _ in range(count):
+            self._pending.popleft()
+            self._room.release()
+        self._head_failures = 0
+
+    def _write_dead_letters(self, rows: List[Dict[str, Any]]) -> None:
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(row, default=str) + "\n" for row in rows))
+
+    async def _dead_letter(self, count: int) -> None:
+        """Moves the first `count` pending records to the dead-letter file."""
+        rows = [self._pending[i] for i in range(count)]
+        try:
+            await asyncio.to_thread(self._write_dead_letters, rows)
+        except OSError as exc:
+            logger.error("Could not dead-letter %d conversation records, dropping them: %s", count, exc)
+            conversation_records_dropped.labels("dead_letter_failed").inc(count)
+        else:
+            logger.error("Dead-lettered %d conversation records to %s", count, self.dead_letter_path)
+            conversation_records_dropped.labels("dead_lettered").inc(count)
+        self.dead_lettered += count
+        self._release(count)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            try:
+                while await self.flush() == self.batch_size:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Conversation record flush failed (%d pending): %s", self.depth, exc)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Stops the background flusher and writes everything still buffered. Gives up after
+        the first failed flush or `timeout` seconds, and dead-letters what is left.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        async def drain() -> None:
+            while self._pending:
+                await self.flush()
+
+        try:
+            await asyncio.wait_for(drain(), timeout=timeout or settings.record_buffer_stop_timeout_seconds)
+        except Exception as exc:
+            logger.error("Final conversation record flush failed (%d pending): %s", self.depth, repr(exc))
+            async with self._flush_lock:
+                if self._pending:
+                    await self._dead_letter(len(self._pending))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "depth": self.depth,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+            "dead_lettered": self.dead_lettered,
+        }
+
+_record_buffer: Optional[ConversationRecordBuffer] = None
+
+GaugeFunction(
+    "conversation_record_buffer_depth",
+    "Conversation records accepted but not yet written to the database.",
+    lambda: _record_buffer.depth if _record_buffer is not None else 0,
+)
+
+def get_record_buffer() -> ConversationRecordBuffer:
+    """Returns the process-wide record buffer."""
+    global _record_buffer
+    if _record_buffer is None:
+        _record_buffer = ConversationRecordBuffer()
+    return _record_buffer
+
+def start_record_buffer() -> ConversationRecordBuffer:
+    """Starts the background flusher. Called once at app startup."""
+    buffer = get_record_buffer()
+    buffer.start()
+    return buffer
+
+async def stop_record_buffer() -> None:
+    """Flushes the remaining records. Called on app shutdown."""
+    global _record_buffer
+    if _record_buffer is not None:
+        await _record_buffer.stop()
+        _record_buffer = None
+
+def _record_to_dict(r: ConversationRecord) -> Dict:
+    return {
+        "id": r.id,
+        "session_id": r.session_id,
+        "user_query": r.user_query,
+        "agent_response": r.agent_response,
+        "final_status": r.final_status,
+        "intent": r.intent,
+        "latency_ms": r.latency_ms,
+        "created_at": r.created_at.isoformat() if r.created_at is not None else None
+    }
+
+def encode_cursor(created_at: datetime, record_id: int) -> str:
+    """Opaque page cursor for the (created_at, id) position of the last record returned."""
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{record_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, record_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(record_id)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+def _records_query(
+    session_id: Optional[str] = None,
+    final_status: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+):
+    stmt = select(ConversationRecord).order_by(ConversationRecord.created_at, ConversationRecord.id)
+    if session_id:
+        stmt = stmt.where(ConversationRecord.session_id == session_id)
+    if final_status:
+        stmt = stmt.where(ConversationRecord.final_status == final_status)
+    if start:
+        stmt = stmt.where(ConversationRecord.created_at >= start)
+    if end:
+        stmt = stmt.where(ConversationRecord.created_at < end)
+    if cursor:
+        created_at, record_id = decode_cursor(cursor)
+        stmt = stmt.where(or_(
+            ConversationRecord.created_at > created_at,
+            and_(ConversationRecord.created_at == created_at, ConversationRecord.id > record_id),
+        ))
+    return stmt
+
+async def fetch_conversation_records(
+    session_id: Optional[str] = None,
+    final_status: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    session_factory: Optional[async_sessionmaker] = None,
+) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Fetch one page of conversation records ordered by (created_at, id), with optional filters.
+    Returns the records and the cursor of the next page (None on the last page).
+    """
+    stmt = _records_query(session_id, final_status, start, end, cursor).limit(limit + 1)
+    async with (session_factory or AsyncSessionLocal)() as session:
         result = await session.execute(stmt)
         records = result.scalars().all()
-        return [
-            {
-                "id": r.id,
-                "session_id": r.session_id,
-                "user_query": r.user_query,
-                "agent_response": r.agent_response,
-                "final_status": r.final_status,
-                "created_at": r.created_at.isoformat() if r.created_at is not None else None
-            }
-            for r in records
-        ]
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor(records[-1].created_at, records[-1].id)
+    return [_record_to_dict(r) for r in records], next_cursor
+
+async def stream_conversation_records(
+    session_id: Optional[str] = None,
+    final_status: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    session_factory: Optional[async_sessionmaker] = None,
+) -> AsyncIterator[Dict]:
+    """
+    Yields every matching record through a server-side cursor, `analytics_stream_chunk_size` rows
+    at a time, so memory stays flat however many rows match.
+    """
+    stmt = _records_query(session_id, final_status, start, end).execution_options(
+        yield_per=settings.analytics_stream_chunk_size,
+    )
+    async with (session_factory or AsyncSessionLocal)() as session:
+        result = await session.stream_scalars(stmt)
+        async for record in result:
+            yield _record_to_dict(record)
+
+def _upsert(dialect_name: str):
+    return postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+
+def _settled(dialect_name: str, lag: timedelta):
+    """
+    SQL: the record was inserted at least `lag` ago. Compared in the database against its own
+    clock, so it matches the server-default `inserted_at` whatever the server's time zone.
+    """
+    if dialect_name == "sqlite":
+        cutoff = func.datetime("now", f"-{lag.total_seconds()} seconds")
+    else:
+        cutoff = func.now() - lag
+    return or_(ConversationRecord.inserted_at.is_(None), ConversationRecord.inserted_at <= cutoff)
+
+def _latency_bucket(latency_ms: int) -> int:
+    return min(bisect_left(LATENCY_BUCKETS_MS, latency_ms), len(LATENCY_BUCKETS_MS) - 1)
+
+async def refresh_rollups(
+    session_factory: Optional[async_sessionmaker] = None,
+    batch_size: Optional[int] = None,
+    safety_lag_seconds: Optional[float] = None,
+) -> int:
+    """
+    Folds conversation records newer than the checkpoint into the rollup tables, one batch per
+    transaction. Concurrent refreshers are safe: a batch only commits if the checkpoint it
+    started from is unchanged. Returns how many records were folded in.
+
+    Ids are not committed in order when several workers insert at once, so only records
+    inserted at least `safety_lag_seconds` ago (by the database clock) are folded, and the
+    batch stops at the first younger one. An insert that allocated a lower id has committed
+    by then, and is not skipped by the checkpoint moving past it.
+    """
+    batch_size = batch_size or settings.analytics_rollup_batch_size
+    lag = timedelta(seconds=safety_lag_seconds if safety_lag_seconds is not None else settings.analytics_rollup_safety_lag_seconds)
+    folded = 0
+    while True:
+        async with (session_factory or AsyncSessionLocal)() as session:
+            dialect = session.bind.dialect.name
+            last_id = await session.scalar(select(RollupCheckpoint.last_id).where(RollupCheckpoint.name == "conversations"))
+            if last_id is None:
+                await session.execute(_upsert(dialect)(RollupCheckpoint).values(name="conversations", last_id=0).on_conflict_do_nothing())
+                last_id = 0
+            rows = (await session.execute(
+                select(
+                    ConversationRecord.id,
+                    ConversationRecord.created_at,
+                    ConversationRecord.final_status,
+                    ConversationRecord.intent,
+                    ConversationRecord.latency_ms,
+                    _settled(dialect, lag).label("settled"),
+                ).where(ConversationRecord.id > last_id).order_by(ConversationRecord.id).limit(batch_size)
+            )).all()
+            settled = next((i for i, r in enumerate(rows) if not r.settled), len(rows))
+            rows = rows[:settled]
+            if not rows:
+                await session.commit()
+                return folded
+
+            counts = Counter((r.created_at.date(), r.final_status or "UNKNOWN", r.intent or "UNKNOWN") for r in rows)
+            latencies = Counter((r.created_at.date(), _latency_bucket(r.latency_ms)) for r in rows if r.latency_ms is not None)
+            claimed = await session.execute(
+                update(RollupCheckpoint)
+                .where(RollupCheckpoint.name == "conversations", RollupCheckpoint.last_id == last_id)
+                .values(last_id=rows[-1].id)
+            )
+            if claimed.rowcount != 1:
+                await session.rollback()  # Another refresher took this batch.
+                continue
+
+            upsert = _upsert(dialect)
+            for (day, status, intent), count in counts.items():
+                stmt = upsert(ConversationRollup).values(day=day, final_status=status, intent=intent, count=count)
+                await session.execute(stmt.on_conflict_do_update(
+                    index_elements=["day", "final_status", "intent"],
+                    set_={"count": ConversationRollup.count + stmt.excluded.count},
+                ))
+            for (day, bucket), count in latencies.items():
+                stmt = upsert(LatencyRollup).values(day=day, bucket=bucket, count=count)
+                await session.execute(stmt.on_conflict_do_update(
+                    index_elements=["day", "bucket"],
+                    set_={"count": LatencyRollup.count + stmt.excluded.count},
+                ))
+            await session.commit()
+            folded += len(rows)
+
+def _histogram_percentile(histogram: List[int], p: float) -> Optional[int]:
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = total * p / 100
+    seen = 0
+    for bucket, count in enumerate(histogram):
+        seen += count
+        if seen >= rank:
+            return LATENCY_BUCKETS_MS[bucket]
+    return LATENCY_BUCKETS_MS[-1]
+
+async def fetch_analytics_summary(
+    start_day: Optional[date] = None,
+    end_day: Optional[date] = None,
+    session_factory: Optional[async_sessionmaker] = None,
+) -> Dict:
+    """
+    Resolution and escalation rates, counts per day/final_status/intent and latency percentiles,
+    read from the rollup tables only. Days are inclusive.
+    """
+    counts_stmt = select(ConversationRollup)
+    latency_stmt = select(LatencyRollup.bucket, func.sum(LatencyRollup.count)).group_by(LatencyRollup.bucket)
+    if start_day:
+        counts_stmt = counts_stmt.where(ConversationRollup.day >= start_day)
+        latency_stmt = latency_stmt.where(LatencyRollup.day >= start_day)
+    if end_day:
+        counts_stmt = counts_stmt.where(ConversationRollup.day <= end_day)
+        latency_stmt = latency_stmt.where(LatencyRollup.day <= end_day)
+
+    async with (session_factory or AsyncSessionLocal)() as session:
+        rollups = (await session.execute(counts_stmt.order_by(ConversationRollup.day))).scalars().all()
+        latency_rows = (await session.execute(latency_stmt)).all()
+
+    by_status: Counter = Counter()
+    for row in rollups:
+        by_status[row.final_status] += row.count
+    finished = by_status["SATISFIED"] + by_status["ESCALATED"]
+    histogram = [0] * len(LATENCY_BUCKETS_MS)
+    for bucket, count in latency_rows:
+        histogram[bucket] = int(count)
+    return {
+        "turns": sum(by_status.values()),
+        "by_final_status": dict(by_status),
+        "satisfied_rate": by_status["SATISFIED"] / finished if finished else None,
+        "escalation_rate": by_status["ESCALATED"] / finished if finished else None,
+        "latency_ms": {f"p{p}": _histogram_percentile(histogram, p) for p in (50, 95, 99)},
+        "daily": [
+            {"day": row.day.isoformat(), "final_status": row.final_status, "intent": row.intent, "count": row.count}
+            for row in rollups
+        ],
+    }
+
+class RollupJob:
+    """Refreshes the rollups every `analytics_rollup_interval_seconds` in the background."""
+
+    def __init__(self, session_factory: Optional[async_sessionmaker] = None):
+        self.session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await refresh_rollups(self.session_factory)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Analytics rollup refresh failed: %s", exc)
+            await asyncio.sleep(settings.analytics_rollup_interval_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+_rollup_job: Optional[RollupJob] = None
+
+def start_rollup_job() -> RollupJob:
+    """Starts the periodic rollup refresh. Called once at app startup."""
+    global _rollup_job
+    if _rollup_job is None:
+        _rollup_job = RollupJob()
+        _rollup_job.start()
+    return _rollup_job
+
+async def stop_rollup_job() -> None:
+    global _rollup_job
+    if _rollup_job is not None:
+        await _rollup_job.stop()
+        _rollup_job = None
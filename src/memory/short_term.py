@@ -1,35 +1,85 @@
-import redis
-from typing import List
+import redis.asyncio as redis
+from typing import List, Optional
 from langchain_core.messages import BaseMessage
 from src.core.config import settings
-import json
+from src.core.telemetry import session_hash, tracer
+from src.memory.codec import decode_message, encode_message
 
-class RedisConversationHistory:
-    def __init__(self, session_id: str):
-        self.session_id = session_id
-        self.client = redis.Redis(
+HISTORY_KEY_PREFIX = "chat_history:"
+
+# Process-wide connection pool, created once at app startup (see `init_redis_pool`).
+_pool: Optional[redis.BlockingConnectionPool] = None
+
+def init_redis_pool(**overrides) -> redis.BlockingConnectionPool:
+    """
+    Creates the process-wide Redis connection pool. Safe to call more than once.
+    The pool blocks callers when every connection is busy, so the connection
+    count stays capped at `redis_max_connections` under load.
+    """
+    global _pool
+    if _pool is None:
+        pool_kwargs = dict(
             host=settings.redis_host,
             port=settings.redis_port,
             password=settings.redis_password,
-            decode_responses=True, # Decode responses to strings
+            max_connections=settings.redis_max_connections,
+            timeout=settings.redis_pool_timeout_seconds,
+            decode_responses=False, # History entries are binary-encoded messages
         )
+        pool_kwargs.update(overrides)
+        _pool = redis.BlockingConnectionPool(**pool_kwargs)
+    return _pool
+
+async def close_redis_pool() -> None:
+    """Disconnects every pooled connection. Called on app shutdown."""
+    global _pool
+    if _pool is not None:
+        await _pool.disconnect()
+        _pool = None
+
+def get_redis_client() -> redis.Redis:
+    """Returns a client bound to the shared pool; clients are cheap, connections are reused."""
+    return redis.Redis(connection_pool=init_redis_pool())
+
+class RedisConversationHistory:
+    def __init__(self, session_id: str, client: Optional[redis.Redis] = None, ttl_seconds: Optional[int] = None):
+        self.session_id = session_id
+        self.key = f"{HISTORY_KEY_PREFIX}{session_id}"
+        self.client = client if client is not None else get_redis_client()
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.redis_session_ttl_seconds
+
+    def _span_attributes(self):
+        return {"db.system": "redis", "session.hash": session_hash(self.session_id)}
+
+    async def get_history(self, window: Optional[int] = None) -> List[BaseMessage]:
+        """
+        Retrieves the most recent `window` messages from Redis and refreshes the session TTL.
+        """
+        window = window if window is not None else settings.redis_history_window
+        with tracer.start_as_current_span("redis.history.get", attributes=self._span_attributes()):
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.lrange(self.key, -window, -1)
+                pipe.expire(self.key, self.ttl_seconds)
+                history_items, _ = await pipe.execute()
+        return [decode_message(item) for item in history_items]
+
+    async def append_messages(self, messages: List[BaseMessage]):
+        """
+        Appends only the new messages of a turn, trimming the list to the configured maximum.
+        Each call costs the same regardless of how long the session already is.
+        """
+        if not messages:
+            return
+        items = [encode_message(msg) for msg in messages]
+        with tracer.start_as_current_span("redis.history.append", attributes=self._span_attributes()):
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.rpush(self.key, *items)
+                pipe.ltrim(self.key, -settings.redis_history_max_messages, -1)
+                pipe.expire(self.key, self.ttl_seconds)
+                await pipe.execute()
+
+async def get_history_for_session(session_id: str, client: Optional[redis.Redis] = None) -> List[BaseMessage]:
+    return await RedisConversationHistory(session_id, client).get_history()
 
-    async def get_history(self) -> List[BaseMessage]:
-        """Retrieves conversation history from Redis."""
-        history_json = await self.client.get(self.session_id)
-        if history_json:
-            history_dicts = json.loads(history_json)
-            return [BaseMessage(**msg) for msg in history_dicts]
-        return []
-
-    def save_history(self, history: List[BaseMessage]):
-        """Saves conversation history to Redis."""
-        # Convert BaseMessage objects to dicts for serialization
-        history_dicts = [msg.__dict__ for msg in history]
-        self.client.set(self.session_id, json.dumps(history_dicts))
-
-async def get_history_for_session(session_id: str) -> List[BaseMessage]:
-    return await RedisConversationHistory(session_id).get_history()
-
-def save_history_for_session(session_id: str, history: List[BaseMessage]):
-    RedisConversationHistory(session_id).save_history(history)
+async def append_messages_for_session(session_id: str, messages: List[BaseMessage], client: Optional[redis.Redis] = None):
+    await RedisConversationHistory(session_id, client).append_messages(messages)
@@ -1,32 +1,118 @@
+import hashlib
+import unicodedata
+from dataclasses import dataclass, field, replace
+from typing import List, Optional, Tuple
 from guardrails import Guard
 from pathlib import Path
+from src.core.config import settings
+from src.core.metrics import GaugeFunction, guardrail_rejections, guardrails_cache_lookups
+from src.core.telemetry import tracer
+from src.utils.cache import TTLCache
 
 CONFIG_PATH = Path(__file__).parent.parent / "guardrails_config.xml"
 
-guard = Guard.from_rail(str(CONFIG_PATH))
+_guard: Optional[Guard] = None
+_config_mtime_ns: int = CONFIG_PATH.stat().st_mtime_ns
+
+# (text, verdict) keyed by a hash of (section, normalized text). Repeated user messages
+# ("hi", "yes", a PO number) and templated node replies skip the guard entirely.
+_verdict_cache = TTLCache(
+    maxsize=settings.guardrails_cache_size,
+    ttl_seconds=settings.guardrails_cache_ttl_seconds,
+)
+
+GaugeFunction("guardrails_verdict_cache_size", "Verdicts held in the guardrails cache.", lambda: len(_verdict_cache))
+
+def _reload_if_config_changed() -> None:
+    """Drops the guard and every cached verdict when the rail config file is modified."""
+    global _guard, _config_mtime_ns
+    mtime_ns = CONFIG_PATH.stat().st_mtime_ns
+    if mtime_ns != _config_mtime_ns:
+        _config_mtime_ns = mtime_ns
+        _guard = None
+        _verdict_cache.clear()
+
+def get_guard() -> Guard:
+    """Returns the guard built from the rail config, building it on first use."""
+    global _guard
+    if _guard is None:
+        _guard = Guard.from_rail(str(CONFIG_PATH))
+    return _guard
+
+def _normalize(text: str) -> str:
+    # Cache key only: canonicalizes what cannot change the verdict.
+    return unicodedata.normalize("NFC", text).strip()
+
+def _cache_key(text: str, section: str) -> bytes:
+    return hashlib.blake2b(f"{section}\0{text}".encode(), digest_size=16).digest()
+
+@dataclass
+class GuardrailsVerdict:
+    """Everything the API needs from one guardrails pass over a piece of text."""
+    valid: bool
+    errors: List = field(default_factory=list)
+    text: str = ""  # The input text, redacted when the rail config redacts PII
+
+def evaluate_guardrails(text: str, section: str = "input", use_cache: bool = True) -> GuardrailsVerdict:
+    """Run the validators for `section` exactly once and return validity, errors and redacted text."""
+    with tracer.start_as_current_span("guardrails.evaluate", attributes={"guardrails.section": section}) as span:
+        verdict, cache_hit = _evaluate(text, section, use_cache)
+        span.set_attribute("guardrails.cache_hit", cache_hit)
+        span.set_attribute("guardrails.valid", verdict.valid)
+        if not verdict.valid:
+            guardrail_rejections.labels(section).inc()
+        return verdict
+
+def _evaluate(text: str, section: str, use_cache: bool) -> Tuple[GuardrailsVerdict, bool]:
+    _reload_if_config_changed()
+    # Only the cache key is normalized; the guard sees, and the verdict returns, the text as sent.
+    key = _cache_key(_normalize(text), section)
+    if use_cache:
+        cached = _verdict_cache.get(key)
+        verdict = _reuse(cached, text) if cached is not None else None
+        guardrails_cache_lookups.labels(section, "miss" if verdict is None else "hit").inc()
+        if verdict is not None:
+            return verdict, True
+
+    result = get_guard().validate(text, section=section)
+    redacted = getattr(result, "redacted_output", None)
+    verdict = GuardrailsVerdict(
+        valid=bool(result.valid),  # type: ignore[attr-defined]
+        errors=list(getattr(result, "errors", None) or []),
+        text=redacted or text,
+    )
+    if use_cache:
+        _verdict_cache.set(key, (text, verdict))
+    return verdict, False
+
+def _reuse(cached: Tuple[str, GuardrailsVerdict], text: str) -> Optional[GuardrailsVerdict]:
+    """
+    The cached verdict for `text`, which may differ from the cached text in surrounding
+    whitespace or Unicode form. A redaction of the other spelling is not reused.
+    """
+    source, verdict = cached
+    if source == text:
+        return verdict
+    if verdict.text == source:
+        return replace(verdict, text=text)
+    return None
 
 def validate_input(user_input: str) -> bool:
     """Validate user input using guardrails config. Returns True if valid, False otherwise."""
-    result = guard.parse(user_input, section="input")
-    return result.valid  # type: ignore[attr-defined]
+    return evaluate_guardrails(user_input, section="input").valid
 
 def validate_output(llm_output: str) -> bool:
     """Validate LLM output using guardrails config. Returns True if valid, False otherwise."""
-    result = guard.validate(llm_output, section="output")
-    return result.valid  # type: ignore[attr-defined]
+    return evaluate_guardrails(llm_output, section="output").valid
 
 def get_guardrails_errors(text: str, section: str = "input") -> list:
-    result = guard.validate(text, section=section)
-    return result.errors  # type: ignore[attr-defined]
+    return evaluate_guardrails(text, section=section).errors
 
 def redact_pii(text: str) -> str:
     """Redact PII in the output using guardrails if enabled in config."""
-    result = guard.validate(text, section="output")
-    if hasattr(result, 'redacted_output') and result.redacted_output:  # type: ignore[attr-defined]
-        return result.redacted_output  # type: ignore[attr-defined]
-    return text
+    return evaluate_guardrails(text, section="output").text
 
 def check_po_number_format(po_number: str) -> bool:
     """Custom regex: PO number must be 10 digits."""
     import re
-    return bool(re.fullmatch(r"\d{10}", po_number)) 
\ No newline at end of file
+    return bool(re.fullmatch(r"\d{10}", po_number))
@@ -0,0 +1,8 @@
+import os
+
+# `src.core.llm` builds the client at import time; point it at a provider that
+# can be constructed offline so the graph modules import. Tests replace the
+# `llm` object itself wherever a node would actually call it.
+os.environ.setdefault("LLM_PROVIDER", "openai")
+os.environ.setdefault("LLM_API_KEY", "test-key")
+os.environ.setdefault("LLM_MODEL_NAME", "gpt-4o-mini")
@@ -1,5 +1,9 @@
+import asyncio
+
 import pytest
+from langgraph.graph import StateGraph, END
 from src.agents.nodes import (
+    call_sap_api_node,
     greeting_node,
     ask_po_invoice_details_node,
     ask_non_po_invoice_details_node,
@@ -114,3 +118,22 @@ def test_end_conversation_node():
     initial_state["user_query"] = "yes"
     updated_state = end_conversation_node(initial_state)
     assert "Thank you for using the invoice agent. Goodbye!" in (updated_state.get("final_response") or "")
+
+def test_call_sap_api_node_streams_status_rows():
+    """
+    Tests that, when the graph is streamed, each status table line is sent as a custom event.
+    """
+    graph = StateGraph(AgentState)
+    graph.add_node("call_sap_api", call_sap_api_node)
+    graph.set_entry_point("call_sap_api")
+    graph.add_edge("call_sap_api", END)
+    state = get_default_state()
+    state["json_payload"] = {"type": "PO", "invoices": [{"po_number": "123", "invoice_number": "INV456"}]}
+
+    async def scenario():
+        return [chunk async for chunk in graph.compile().astream(state, stream_mode="custom")]
+
+    events = asyncio.run(scenario())
+    assert [event["type"] for event in events] == ["status_header", "status_row"]
+    assert "| Sr# | PO Number | Invoice Number | Status |" in events[0]["text"]
+    assert events[1]["index"] == 0 and events[1]["text"].startswith("| 1 | 123 | INV456 | PAID")
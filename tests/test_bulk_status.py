@@ -0,0 +1,116 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from src.agents.tools import bulk_status
+from src.agents.tools.bulk_status import BulkUploadError, bulk_invoice_statuses, iter_lines, open_upload, validate_row
+from src.agents.tools.sap_api import SAPUnavailableError
+from src.main import app
+
+async def body(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+def test_lines_are_split_across_chunks_and_overlong_lines_dropped():
+    lines = asyncio.run(collect(iter_lines(body(b"a,b\r\nc", b"d\n" + b"x" * 10, b"y" * 10 + b"\nlast"), max_line_bytes=8)))
+    assert lines == [(1, "a,b"), (2, "cd"), (3, None), (4, "last")]
+
+@pytest.mark.parametrize("record, expected", [
+    ({"po_number": "4500012345", "invoice_number": "INV1"}, ("PO", {"po_number": "4500012345", "invoice_number": "INV1"})),
+    ({"type": "non-po", "acr_number": "ACR1", "invoice_document_date": "2024-03-01"},
+     ("NON_PO", {"acr_number": "ACR1", "invoice_number": None, "invoice_document_date": "2024-03-01"})),
+])
+def test_valid_rows(record, expected):
+    assert validate_row(record) == expected
+
+@pytest.mark.parametrize("record", [
+    {"type": "PO", "po_number": "123", "invoice_number": "INV1"},
+    {"type": "PO", "po_number": "4500012345", "invoice_number": ""},
+    {"type": "NON_PO", "invoice_document_date": "2024-03-01"},
+    {"type": "NON_PO", "acr_number": "ACR1", "invoice_document_date": "01/03/2024"},
+    {"type": "CREDIT_NOTE", "invoice_number": "INV1"},
+])
+def test_invalid_rows(record):
+    with pytest.raises(ValueError):
+        validate_row(record)
+
+def test_csv_header_is_checked_before_streaming():
+    with pytest.raises(BulkUploadError):
+        asyncio.run(open_upload(body(b"name,amount\nfoo,1\n"), "csv"))
+
+def test_rows_are_looked_up_in_bounded_chunks(monkeypatch):
+    """
+    Tests that valid rows are looked up per type in SAP-sized chunks with a bounded number in
+    flight, that a failed chunk only affects its own rows, and that every row is answered once.
+    """
+    monkeypatch.setattr(bulk_status.settings, "sap_batch_size", 2)
+    monkeypatch.setattr(bulk_status.settings, "bulk_status_max_chunks_in_flight", 2)
+    active, peak, calls = 0, 0, []
+
+    async def lookup(invoice_type, invoices):
+        nonlocal active, peak
+        calls.append((invoice_type, len(invoices)))
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        if invoices[0]["invoice_number"] == "INV4":
+            raise SAPUnavailableError("timeout")
+        return [{"status_code": "PAID", "status_description": "Paid."} for _ in invoices]
+
+    upload = "\n".join(
+        ["type,po_number,acr_number,invoice_number,invoice_document_date"]
+        + [f"PO,45000000{i:02d},,INV{i}," for i in range(7)]
+        + ["NON_PO,,ACR1,,2024-03-01", "PO,bad,,INV9,"]
+    ).encode()
+
+    async def scenario():
+        records = await open_upload(body(upload), "csv")
+        return await collect(bulk_invoice_statuses(records, lookup=lookup))
+
+    rows = asyncio.run(scenario())
+    by_line = {row["line"]: row for row in rows}
+    assert sorted(by_line) == list(range(2, 11)) and len(rows) == 9
+    assert peak == 2
+    assert sorted(calls) == [("NON_PO", 1), ("PO", 1), ("PO", 2), ("PO", 2), ("PO", 2)]
+    assert by_line[2]["status_code"] == "PAID" and by_line[2]["po_number"] == "4500000000"
+    assert by_line[6]["status_code"] == by_line[7]["status_code"] == "SAP_UNAVAILABLE"
+    assert by_line[9]["type"] == "NON_PO" and by_line[9]["acr_number"] == "ACR1"
+    assert by_line[10]["status_code"] == "INVALID" and "10 digits" in by_line[10]["status_description"]
+
+def test_rows_beyond_the_limit_are_not_looked_up(monkeypatch):
+    monkeypatch.setattr(bulk_status.settings, "bulk_status_max_rows", 2)
+    upload = b"".join(json.dumps({"po_number": "4500012345", "invoice_number": f"INV{i}"}).encode() + b"\n" for i in range(5))
+
+    async def scenario():
+        return await collect(bulk_invoice_statuses(await open_upload(body(upload), "ndjson")))
+
+    rows = asyncio.run(scenario())
+    assert [row["status_code"] for row in rows] == ["INVALID", "PAID", "PAID"]
+    assert rows[0]["line"] == 3 and "first 2 rows" in rows[0]["status_description"]
+
+def test_bulk_endpoint_streams_csv_results():
+    upload = b'{"type": "NON_PO", "acr_number": "ACR1", "invoice_document_date": "2024-03-01"}\nnot json\n'
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            unsupported = await client.post("/invoices/status:bulk", content=upload, headers={"content-type": "text/plain"})
+            response = await client.post(
+                "/invoices/status:bulk", params={"format": "csv"}, content=upload,
+                headers={"content-type": "application/x-ndjson"},
+            )
+        return unsupported, response
+
+    unsupported, response = asyncio.run(scenario())
+    assert unsupported.status_code == 415
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/csv")
+    lines = response.text.splitlines()
+    assert lines[0] == "line,type,po_number,acr_number,invoice_number,invoice_document_date,status_code,status_description"
+    assert lines[1] == "2,,,,,,INVALID,The line is not valid JSON"
+    assert lines[2].startswith("1,NON_PO,,ACR1,,2024-03-01,PENDING_APPROVAL,")
@@ -0,0 +1,144 @@
+import asyncio
+
+import fakeredis
+import pytest
+from fakeredis.aioredis import FakeRedis
+from langchain_core.messages import AIMessage
+
+from src.agents import nodes
+from src.agents.graph import workflow
+from src.agents.tools.ticket_outbox import TicketOutbox
+from src.memory.checkpoint import RedisCheckpointSaver
+
+class FailingLLM:
+    async def ainvoke(self, prompt, **kwargs):
+        raise AssertionError("the LLM should not be needed for these turns")
+
+@pytest.fixture
+def checkpointed_app(monkeypatch):
+    monkeypatch.setattr(nodes, "llm", FailingLLM())
+    server = fakeredis.FakeServer()
+    outbox = TicketOutbox(client=FakeRedis(server=server))
+    monkeypatch.setattr(nodes, "get_ticket_outbox", lambda: outbox)
+    saver = RedisCheckpointSaver(client=FakeRedis(server=server))
+    return workflow.compile(checkpointer=saver)
+
+def run_turns(app, session_id, messages):
+    async def scenario():
+        config = {"configurable": {"thread_id": session_id}}
+        results = []
+        for message in messages:
+            results.append(await app.ainvoke(
+                {"user_query": message, "conversation_history": [], "final_response": None, "service_now_ticket": None},
+                config,
+            ))
+        return results
+    return asyncio.run(scenario())
+
+def test_po_flow_resumes_at_pending_nodes(checkpointed_app):
+    """
+    Tests that detail and satisfaction answers resume mid-flow instead of restarting at intent.
+    """
+    asked, status, goodbye = run_turns(checkpointed_app, "s1", [
+        "I want the status of my PO invoice",
+        "4500012345, 9000123",
+        "yes",
+    ])
+    assert asked["awaiting_input"] == "po_details"
+    assert "Please provide the PO Number" in asked["final_response"]
+
+    assert status["po_number"] == "4500012345"
+    assert "| 1 | 4500012345 | 9000123 | PAID" in status["final_response"]
+    assert status["final_response"].endswith("Are you satisfied with the information provided? (Yes/No)")
+    assert status["awaiting_input"] == "satisfaction"
+
+    assert goodbye["final_response"] == "Thank you for using the invoice agent. Goodbye!"
+    assert goodbye["awaiting_input"] is None
+    assert goodbye["invoice_type"] == "PO"  # slots survive between turns
+
+def test_not_satisfied_answer_creates_ticket_once(checkpointed_app):
+    """
+    Tests that a "no" resumes into ticket creation and the next message starts a new request.
+    """
+    status, ticket, fresh = run_turns(checkpointed_app, "s2", [
+        "PO 4500012345 invoice 9000123",
+        "no",
+        "hi",
+    ])
+    assert status["awaiting_input"] == "satisfaction"
+    assert ticket["service_now_ticket"].startswith("TKT-")  # provisional until the outbox worker runs
+    assert fresh["invoice_type"] == "GREETING"
+    assert fresh["service_now_ticket"] is None
+
+def test_sessions_are_isolated(checkpointed_app):
+    run_turns(checkpointed_app, "a", ["I want the status of my PO invoice"])
+    (fresh,) = run_turns(checkpointed_app, "b", ["hello"])
+    assert fresh["invoice_type"] == "GREETING"
+    assert fresh.get("awaiting_input") is None
+
+def test_pending_detail_question_gives_way_to_a_new_request(checkpointed_app):
+    """
+    Tests that a session waiting for PO details can switch to a Non-PO request, or greet, instead
+    of every message being read as PO details.
+    """
+    asked, switched = run_turns(checkpointed_app, "s3", [
+        "I want the status of my PO invoice",
+        "ACR 12345, 2023-10-26",
+    ])
+    assert asked["awaiting_input"] == "po_details"
+    assert switched["invoice_type"] == "NON_PO"
+    assert switched["json_payload"]["invoices"][0]["acr_number"] == "12345"
+    assert switched["awaiting_input"] == "satisfaction"
+
+    asked, greeted = run_turns(checkpointed_app, "s4", ["I want the status of my PO invoice", "hi"])
+    assert greeted["invoice_type"] == "GREETING"
+    assert greeted["awaiting_input"] is None
+
+class UnreadableLLM:
+    async def ainvoke(self, prompt, **kwargs):
+        return AIMessage(content="I could not find any invoice details.")
+
+def test_unreadable_details_stop_being_asked_for(checkpointed_app, monkeypatch):
+    """
+    Tests that after `detail_max_attempts` unreadable answers the pending question is dropped.
+    """
+    monkeypatch.setattr(nodes, "llm", UnreadableLLM())
+    monkeypatch.setattr(nodes.settings, "detail_max_attempts", 2)
+    _, retry, given_up = run_turns(checkpointed_app, "s5", [
+        "I want the status of my PO invoice",
+        "it is the one from last week",
+        "the usual one",
+    ])
+    assert retry["awaiting_input"] == "po_details" and retry["detail_attempts"] == 1
+    assert given_up["awaiting_input"] is None and given_up.get("api_response") is None
+    assert "start over" in given_up["final_response"]
+
+def test_new_request_while_waiting_for_satisfaction_is_not_a_no(checkpointed_app, monkeypatch):
+    """
+    Tests that only an explicit yes or no answers the satisfaction question; a new request is
+    looked up instead of creating a ticket.
+    """
+    monkeypatch.setattr(nodes, "llm", UnreadableLLM())  # "yesterday" is classified as UNKNOWN
+    status, new_request, yesterday = run_turns(checkpointed_app, "s6", [
+        "PO 4500012345 invoice 9000123",
+        "PO 4500099999 invoice 9000555",
+        "yesterday",
+    ])
+    assert status["awaiting_input"] == "satisfaction"
+    assert new_request["service_now_ticket"] is None
+    assert "| 1 | 4500099999 | 9000555 | PAID" in new_request["final_response"]
+    assert new_request["awaiting_input"] == "satisfaction"
+    assert yesterday["service_now_ticket"] is None and yesterday.get("is_satisfied") is None
+    assert yesterday["awaiting_input"] != "satisfaction"
+
+@pytest.mark.parametrize("answer, expected", [
+    ("yes", "end_conversation"),
+    ("Yes, thanks!", "end_conversation"),
+    ("no", "collect_feedback_for_ticket"),
+    ("Nope.", "collect_feedback_for_ticket"),
+    ("yes, but not quite", "identify_intent"),
+    ("yesterday", "identify_intent"),
+    ("PO 4500099999 invoice 9000555", "identify_intent"),
+])
+def test_satisfaction_answer_is_matched_as_a_whole(answer, expected):
+    assert nodes.route_after_satisfaction_query({"user_query": answer}) == expected
@@ -0,0 +1,65 @@
+import asyncio
+
+import fakeredis
+from fakeredis.aioredis import FakeRedis
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.memory.context import SUMMARY_KEY_PREFIX, ConversationContextBuilder, count_tokens, render_recent_turns
+
+def make_history(turns):
+    history = []
+    for i in range(turns):
+        history += [HumanMessage(content=f"status of  invoice\nINV{i}?"), AIMessage(content=f"INV{i} is PAID.")]
+    return history
+
+def test_recent_turns_are_compact_lines_within_the_budget():
+    """
+    Tests that only the last turns are kept, as one "role: content" line each, and that the
+    oldest lines are dropped first when the token budget is exceeded.
+    """
+    history = make_history(10)
+    lines, omitted = render_recent_turns(history, max_turns=3, max_tokens=1000)
+    assert lines[0] == "user: status of invoice INV7?"
+    assert lines[-1] == "assistant: INV9 is PAID."
+    assert (len(lines), omitted) == (6, 14)
+
+    budget = sum(count_tokens(line) + 1 for line in lines[-2:])
+    lines, omitted = render_recent_turns(history, max_turns=3, max_tokens=budget)
+    assert lines == ["user: status of invoice INV9?", "assistant: INV9 is PAID."]
+    assert omitted == 18
+
+def test_builder_without_summary_renders_recent_turns_only():
+    builder = ConversationContextBuilder(max_turns=1, max_tokens=500)
+    text = asyncio.run(builder.build(make_history(3), session_id="s1"))
+    assert text == "user: status of invoice INV2?\nassistant: INV2 is PAID."
+
+def test_summary_is_refreshed_in_the_background_every_few_turns():
+    """
+    Tests that the first turn with omitted messages creates a summary, that later turns use it,
+    and that it is only refreshed again after `refresh_turns` turns.
+    """
+    calls = []
+
+    async def summarize(summary, lines):
+        calls.append((summary, len(lines)))
+        return f"summary {len(calls)}"
+
+    redis_client = FakeRedis(server=fakeredis.FakeServer())
+    builder = ConversationContextBuilder(max_turns=1, max_tokens=500, summarize=summarize, refresh_turns=2, client=redis_client)
+
+    async def turn(turns):
+        text = await builder.build(make_history(turns), session_id="s1")
+        await asyncio.gather(*builder._refreshes)
+        return text
+
+    async def scenario():
+        texts = [await turn(n) for n in (1, 2, 3, 4, 5)]
+        return texts, await redis_client.hgetall(f"{SUMMARY_KEY_PREFIX}s1")
+
+    texts, stored = asyncio.run(scenario())
+    assert texts[0] == "user: status of invoice INV0?\nassistant: INV0 is PAID."
+    assert texts[1].startswith("user: ")  # the first summary is written after the turn that needed it
+    assert texts[2].startswith("summary of earlier turns: summary 1\n")
+    assert texts[4].startswith("summary of earlier turns: summary 2\n")
+    assert calls == [("", 2), ("summary 1", 6)]
+    assert stored == {b"text": b"summary 2", b"turns": b"1"}
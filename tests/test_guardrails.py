@@ -0,0 +1,89 @@
+import pytest
+from types import SimpleNamespace
+
+from src.core.metrics import guardrails_cache_lookups
+from src.utils import guardrails
+from src.utils.guardrails import check_po_number_format, evaluate_guardrails
+
+class CountingGuard:
+    def __init__(self, valid=True, redacted_output=None):
+        self.calls = 0
+        self.valid = valid
+        self.redacted_output = redacted_output
+
+    def validate(self, text, section="input"):
+        self.calls += 1
+        errors = [] if self.valid else [f"{section} rejected"]
+        return SimpleNamespace(valid=self.valid, errors=errors, redacted_output=self.redacted_output)
+
+@pytest.fixture(autouse=True)
+def empty_verdict_cache():
+    guardrails._verdict_cache.clear()
+    yield
+    guardrails._verdict_cache.clear()
+
+def test_evaluate_guardrails_single_pass(monkeypatch):
+    """
+    Tests that validity, errors and redacted text all come from one guard pass.
+    """
+    guard = CountingGuard(valid=True, redacted_output="Contact <EMAIL>")
+    monkeypatch.setattr(guardrails, "_guard", guard)
+    verdict = evaluate_guardrails("Contact ap@example.com", section="output")
+    assert verdict.valid
+    assert verdict.errors == []
+    assert verdict.text == "Contact <EMAIL>"
+    assert guard.calls == 1
+
+def test_evaluate_guardrails_reports_errors(monkeypatch):
+    """
+    Tests that a rejected text carries its errors and falls back to the original text.
+    """
+    monkeypatch.setattr(guardrails, "_guard", CountingGuard(valid=False))
+    verdict = evaluate_guardrails("bad input", section="input")
+    assert not verdict.valid
+    assert verdict.errors == ["input rejected"]
+    assert verdict.text == "bad input"
+
+def test_repeated_text_is_served_from_cache(monkeypatch):
+    """
+    Tests that the same section and normalized text only reach the guard once.
+    """
+    guard = CountingGuard(valid=True)
+    monkeypatch.setattr(guardrails, "_guard", guard)
+    hits = guardrails_cache_lookups.labels("input", "hit")
+    hits_before = hits.value
+    for text in ["yes", "yes ", " yes"]:
+        verdict = evaluate_guardrails(text, section="input")
+        assert verdict.valid and verdict.text == text  # normalized for the key only
+    evaluate_guardrails("yes", section="output")
+    assert guard.calls == 2
+    assert hits.value - hits_before == 2
+
+def test_redaction_is_not_reused_for_another_spelling(monkeypatch):
+    """
+    Tests that a cached redacted text is only returned for the exact text it was made from.
+    """
+    guard = CountingGuard(valid=True, redacted_output="Contact <EMAIL>")
+    monkeypatch.setattr(guardrails, "_guard", guard)
+    evaluate_guardrails("Contact ap@example.com", section="output")
+    assert evaluate_guardrails("Contact ap@example.com", section="output").text == "Contact <EMAIL>"
+    evaluate_guardrails("Contact ap@example.com\n", section="output")
+    assert guard.calls == 2
+
+def test_cache_is_invalidated_when_config_changes(monkeypatch):
+    """
+    Tests that modifying the rail config drops cached verdicts and rebuilds the guard.
+    """
+    first_guard = CountingGuard(valid=True)
+    monkeypatch.setattr(guardrails, "_guard", first_guard)
+    evaluate_guardrails("hi", section="input")
+
+    second_guard = CountingGuard(valid=False)
+    monkeypatch.setattr(guardrails, "_config_mtime_ns", guardrails._config_mtime_ns - 1)
+    monkeypatch.setattr(guardrails.Guard, "from_rail", lambda path: second_guard, raising=False)
+    assert not evaluate_guardrails("hi", section="input").valid
+    assert second_guard.calls == 1
+
+def test_check_po_number_format():
+    assert check_po_number_format("4500012345")
+    assert not check_po_number_format("45000123")
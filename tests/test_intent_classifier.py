@@ -0,0 +1,44 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.agents.intent_classifier import classify_by_rules, classify_intent
+from src.core.metrics import intent_classifications
+
+@pytest.mark.parametrize("user_query, expected", [
+    ("hi", "GREETING"),
+    ("Good morning!", "GREETING"),
+    ("PO 4500012345 invoice 9000123", "PO"),
+    ("status of my purchase order invoice", "PO"),
+    ("ACR 12345 dated 2023-10-26", "NON_PO"),
+    ("non-po invoice status please", "NON_PO"),
+    ("invoice without purchase order", "NON_PO"),
+    ("my invoices have no PO", "NON_PO"),
+    ("this invoice is not against a PO", "NON_PO"),
+    ("I want to check several invoices that have no PO", "NON_PO"),
+    ("no, PO 4500012345 invoice 9000123", "PO"),
+    ("12345, 2023-10-26\n12346, 2023-10-27", "NON_PO"),
+])
+def test_fast_path_resolves_easy_turns(user_query, expected):
+    prediction = classify_intent(user_query)
+    assert prediction is not None
+    assert prediction.intent == expected
+
+def test_detail_answer_uses_last_agent_question():
+    """
+    Tests that a bare number answer is classified from the question the agent asked.
+    """
+    history = [
+        HumanMessage(content="I need an invoice status"),
+        AIMessage(content="Please provide the PO Number and the Invoice Number. Also, let me know if you want to check the status of all invoices for the given PO."),
+    ]
+    assert classify_by_rules("4500012345, 9000123", history).intent == "PO"
+
+def test_unsure_turns_fall_back_to_llm():
+    """
+    Tests that ambiguous text returns None and is counted as an LLM fallback.
+    """
+    fast_path, fallback = intent_classifications.labels("fast_path"), intent_classifications.labels("llm_fallback")
+    before = fast_path.value, fallback.value
+    assert classify_intent("can you help me with something") is None
+    assert classify_intent("hello") is not None
+    assert (fast_path.value - before[0], fallback.value - before[1]) == (1, 1)
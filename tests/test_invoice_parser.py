@@ -0,0 +1,50 @@
+import pytest
+
+from src.agents.invoice_parser import MAX_NON_PO_INVOICES, parse_non_po_details, parse_po_details
+
+@pytest.mark.parametrize("user_query, po_number, invoice_number", [
+    ("4500012345, 9000123", "4500012345", "9000123"),
+    ("4500012345 INV-77", "4500012345", "INV-77"),
+    ("PO 4500012345 invoice 9000123", "4500012345", "9000123"),
+    ("Invoice No: INV/2023/77 for PO number 4500012345", "4500012345", "INV/2023/77"),
+])
+def test_parse_po_details(user_query, po_number, invoice_number):
+    details = parse_po_details(user_query)
+    assert details == {"po_number": po_number, "invoice_number": invoice_number, "check_all_for_po": False}
+
+def test_parse_po_details_check_all():
+    details = parse_po_details("PO 4500012345 invoice 9000123, please check all the invoices")
+    assert details is not None and details["check_all_for_po"] is True
+
+@pytest.mark.parametrize("user_query", [
+    "my invoice from last week against our big order",
+    "PO 45000123 invoice 9000123",  # PO must be 10 digits
+    "4500012345",
+])
+def test_parse_po_details_falls_back(user_query):
+    assert parse_po_details(user_query) is None
+
+def test_parse_non_po_details_rows():
+    details = parse_non_po_details("12345, 2023-10-26\n12346, 2023-10-27\ninvoice INV-9, 2023-11-01")
+    assert details == {"invoices": [
+        {"acr_number": "12345", "invoice_number": None, "invoice_document_date": "2023-10-26"},
+        {"acr_number": "12346", "invoice_number": None, "invoice_document_date": "2023-10-27"},
+        {"acr_number": None, "invoice_number": "INV-9", "invoice_document_date": "2023-11-01"},
+    ]}
+
+def test_parse_non_po_details_fifty_rows():
+    user_query = ", ".join(f"ACR{i:05d}, 2024-01-{(i % 28) + 1:02d}" for i in range(MAX_NON_PO_INVOICES))
+    details = parse_non_po_details(user_query)
+    assert details is not None
+    assert len(details["invoices"]) == MAX_NON_PO_INVOICES
+    assert details["invoices"][-1]["acr_number"] == "ACR00049"
+
+@pytest.mark.parametrize("user_query", [
+    "the ACR I sent you yesterday",
+    "12345, 2023-02-30",  # not a calendar date
+    "12345 12346, 2023-10-26",
+    "12345",
+    ", ".join(f"{i}, 2024-01-01" for i in range(MAX_NON_PO_INVOICES + 1)),
+])
+def test_parse_non_po_details_falls_back(user_query):
+    assert parse_non_po_details(user_query) is None
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import re
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from src.agents.prompts import intent_identification_prompt, po_details_extraction_prompt
+from src.core.llm_batch import BatchingLLM, parse_batch_answers
+
+TEMPLATES = {
+    "intent_identification": intent_identification_prompt,
+    "po_details_extraction": po_details_extraction_prompt,
+}
+
+def intent_prompt(user_query):
+    return intent_identification_prompt.format(user_query=user_query, conversation_history=[])
+
+class BatchAwareLLM:
+    """Answers a batched prompt with one intent per request, echoing the query back."""
+
+    def __init__(self, malformed=False):
+        self.prompts = []
+        self.malformed = malformed
+
+    async def ainvoke(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        queries = re.findall(r'The user query is: "(.*)"', prompt)
+        if "### Request" not in prompt:
+            return AIMessage(content=f"single:{queries[0]}")
+        if self.malformed:
+            return AIMessage(content="PO")
+        usage = {"input_tokens": 300, "output_tokens": 30, "total_tokens": 330}
+        return AIMessage(content=json.dumps([f"batched:{query}" for query in queries]), usage_metadata=usage)
+
+def test_concurrent_calls_share_one_provider_request():
+    """
+    Tests that calls within the window become one request and each caller gets its own answer.
+    """
+    inner = BatchAwareLLM()
+    llm = BatchingLLM(inner, TEMPLATES, window_ms=20, max_batch_size=16)
+
+    async def scenario():
+        return await asyncio.gather(*[llm.ainvoke(intent_prompt(f"query {i}")) for i in range(3)])
+
+    responses = asyncio.run(scenario())
+    assert [r.content for r in responses] == ["batched:query 0", "batched:query 1", "batched:query 2"]
+    assert responses[0].usage_metadata["input_tokens"] == 100
+    assert len(inner.prompts) == 1
+    # The static instructions of the template are sent once, not once per call.
+    assert inner.prompts[0].count("Possible intents are") == 1
+
+def test_full_batch_is_sent_without_waiting_for_the_window():
+    inner = BatchAwareLLM()
+    llm = BatchingLLM(inner, TEMPLATES, window_ms=60_000, max_batch_size=2)
+
+    async def scenario():
+        return await asyncio.wait_for(
+            asyncio.gather(llm.ainvoke(intent_prompt("a")), llm.ainvoke(intent_prompt("b"))), timeout=5,
+        )
+
+    assert [r.content for r in asyncio.run(scenario())] == ["batched:a", "batched:b"]
+
+def test_lone_call_and_unknown_prompts_are_sent_unchanged():
+    inner = BatchAwareLLM()
+    llm = BatchingLLM(inner, TEMPLATES, window_ms=1)
+
+    async def scenario():
+        lone = await llm.ainvoke(intent_prompt("hello"))
+        other = await llm.ainvoke('Summarize: The user query is: "x"')
+        return lone, other
+
+    lone, other = asyncio.run(scenario())
+    assert lone.content == "single:hello"
+    assert other.content == "single:x"
+    assert inner.prompts[0] == intent_prompt("hello")
+
+def test_unparseable_batch_answer_falls_back_to_one_call_each():
+    inner = BatchAwareLLM(malformed=True)
+    llm = BatchingLLM(inner, TEMPLATES, window_ms=20)
+
+    async def scenario():
+        return await asyncio.gather(llm.ainvoke(intent_prompt("a")), llm.ainvoke(intent_prompt("b")))
+
+    assert [r.content for r in asyncio.run(scenario())] == ["single:a", "single:b"]
+    assert len(inner.prompts) == 3
+
+def test_provider_error_reaches_every_caller():
+    class FailingLLM:
+        async def ainvoke(self, prompt, **kwargs):
+            raise RuntimeError("provider down")
+
+    llm = BatchingLLM(FailingLLM(), TEMPLATES, window_ms=20)
+
+    async def scenario():
+        return await asyncio.gather(
+            llm.ainvoke(intent_prompt("a")), llm.ainvoke(intent_prompt("b")), return_exceptions=True,
+        )
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+@pytest.mark.parametrize("content, expected", [
+    ('["PO", "GREETING"]', ["PO", "GREETING"]),
+    ('```json\n[{"po_number": "1"}, {"po_number": "2"}]\n```', ['{"po_number": "1"}', '{"po_number": "2"}']),
+    ('["PO"]', None),
+    ("PO", None),
+])
+def test_parse_batch_answers(content, expected):
+    assert parse_batch_answers(content, 2) == expected
@@ -0,0 +1,67 @@
+import asyncio
+
+import fakeredis
+import pytest
+from fakeredis.aioredis import FakeRedis
+from langchain_core.messages import AIMessage
+
+from src.core import llm_cache
+from src.core.llm_cache import CachedLLM
+from src.core.metrics import llm_cache_lookups
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, prompt, **kwargs):
+        self.calls += 1
+        return AIMessage(content=f"answer {self.calls}")
+
+def test_repeated_prompt_is_served_from_memory():
+    """
+    Tests that prompts differing only in whitespace share one cached response.
+    """
+    inner = CountingLLM()
+    llm = CachedLLM(inner, model_name="test-model")
+    lookups = {result: llm_cache_lookups.labels("intent_identification", result) for result in ("hit", "miss", "bypass")}
+    before = {result: child.value for result, child in lookups.items()}
+
+    async def scenario():
+        first = await llm.ainvoke("Identify the intent:\n    hi", prompt_type="intent_identification")
+        second = await llm.ainvoke("Identify the intent: hi", prompt_type="intent_identification")
+        return first.content, second.content
+
+    assert asyncio.run(scenario()) == ("answer 1", "answer 1")
+    assert inner.calls == 1
+    assert {result: child.value - before[result] for result, child in lookups.items()} == {"hit": 1, "miss": 1, "bypass": 0}
+
+def test_bypass_flag_always_calls_the_model():
+    inner = CountingLLM()
+    llm = CachedLLM(inner, model_name="test-model")
+
+    async def scenario():
+        await llm.ainvoke("same prompt")
+        await llm.ainvoke("same prompt", bypass_cache=True)
+
+    asyncio.run(scenario())
+    assert inner.calls == 2
+
+def test_model_name_is_part_of_the_key():
+    inner = CountingLLM()
+    small, large = CachedLLM(inner, model_name="small"), CachedLLM(inner, model_name="large")
+    assert small._key("same prompt") != large._key("same prompt")
+
+def test_redis_backed_entries_are_shared_between_workers(monkeypatch):
+    """
+    Tests that a second process-level cache picks up a response stored by the first through Redis.
+    """
+    monkeypatch.setattr(llm_cache.settings, "llm_cache_redis_enabled", True)
+    redis_client = FakeRedis(server=fakeredis.FakeServer())
+    first_worker, second_worker = CountingLLM(), CountingLLM()
+
+    async def scenario():
+        await CachedLLM(first_worker, "test-model", redis_client).ainvoke("po prompt", prompt_type="po_details_extraction")
+        return await CachedLLM(second_worker, "test-model", redis_client).ainvoke("po prompt", prompt_type="po_details_extraction")
+
+    assert asyncio.run(scenario()).content == "answer 1"
+    assert second_worker.calls == 0
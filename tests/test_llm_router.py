@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from src.core import metrics
+from src.core.llm_router import TieredLLM, check_task_output
+
+class ScriptedLLM:
+    def __init__(self, content=None, error=None):
+        self.content = content
+        self.error = error
+        self.calls = []
+
+    async def ainvoke(self, prompt, prompt_type="default", **kwargs):
+        self.calls.append(prompt_type)
+        if self.error is not None:
+            raise self.error
+        return AIMessage(content=self.content)
+
+ROUTES = {"intent_identification": "small", "po_details_extraction": "small", "non_po_details_extraction": "large"}
+
+def make_router(small_content=None, small_error=None, large_content="PO"):
+    small, large = ScriptedLLM(small_content, small_error), ScriptedLLM(large_content)
+    return TieredLLM({"small": small, "large": large}, routes=ROUTES), small, large
+
+def test_valid_small_tier_answer_is_used():
+    router, small, large = make_router(small_content=" non_po\n")
+    response = asyncio.run(router.ainvoke("prompt", prompt_type="intent_identification"))
+    assert response.content == " non_po\n"
+    assert small.calls == ["intent_identification"] and large.calls == []
+
+@pytest.mark.parametrize("prompt_type, small_content, small_error, reason", [
+    ("intent_identification", "UNKNOWN", None, "low_confidence"),
+    ("intent_identification", "It is probably a PO invoice.", None, "invalid"),
+    ("po_details_extraction", '{"po_number": "4500012345", "invoice_number": null}', None, "schema"),
+    ("po_details_extraction", "not json", None, "schema"),
+    ("intent_identification", None, ConnectionError("ollama down"), "error"),
+])
+def test_failed_small_tier_answer_is_escalated(prompt_type, small_content, small_error, reason):
+    """
+    Tests that unusable or failed small-tier answers are retried on the large tier and counted.
+    """
+    router, small, large = make_router(small_content, small_error, large_content="large answer")
+    escalations = metrics.llm_escalations.labels(prompt_type, "small", reason)
+    before = escalations.value
+
+    response = asyncio.run(router.ainvoke("prompt", prompt_type=prompt_type))
+    assert response.content == "large answer"
+    assert small.calls == [prompt_type] and large.calls == [prompt_type]
+    assert escalations.value == before + 1
+
+def test_unrouted_and_large_tasks_go_straight_to_the_large_tier():
+    router, small, large = make_router(small_content="PO")
+    routed = metrics.llm_routed_calls.labels("non_po_details_extraction", "large")
+    before = routed.value
+
+    async def scenario():
+        await router.ainvoke("prompt", prompt_type="non_po_details_extraction")
+        await router.ainvoke("prompt", prompt_type="summary")
+
+    asyncio.run(scenario())
+    assert small.calls == []
+    assert large.calls == ["non_po_details_extraction", "summary"]
+    assert routed.value == before + 1
+
+def test_non_po_answer_needs_valid_invoices():
+    valid = '{"invoices": [{"acr_number": "ACR1", "invoice_number": null, "invoice_document_date": "2024-03-01"}]}'
+    assert check_task_output("non_po_details_extraction", valid) is None
+    assert check_task_output("non_po_details_extraction", '{"invoices": []}') == "schema"
+    assert check_task_output("non_po_details_extraction", '{"invoices": [{"acr_number": "ACR1"}]}') == "schema"
+    assert check_task_output("summary", "anything") is None
@@ -0,0 +1,54 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from src.agents import nodes
+from src.agents.graph import app as invoice_agent_app
+
+LLM_LATENCY = 0.05
+CONCURRENT_SESSIONS = 20
+
+class SlowBlockingLLM:
+    """Stub LLM whose async path blocks the thread, like the old sync `llm.invoke`."""
+
+    async def ainvoke(self, prompt, **kwargs):
+        time.sleep(LLM_LATENCY)
+        return AIMessage(content="GREETING")
+
+class SlowAsyncLLM:
+    """Stub LLM that yields to the event loop while the 'provider' responds."""
+
+    async def ainvoke(self, prompt, **kwargs):
+        await asyncio.sleep(LLM_LATENCY)
+        return AIMessage(content="GREETING")
+
+async def run_sessions(n: int) -> float:
+    started = time.perf_counter()
+    results = await asyncio.gather(*[
+        # Phrased so the intent fast path cannot resolve it and the stub LLM is called.
+        invoice_agent_app.ainvoke({"user_query": "can you help me out", "conversation_history": []})
+        for _ in range(n)
+    ])
+    elapsed = time.perf_counter() - started
+    for result in results:
+        assert "Hello! I am an invoice status chatbot." in result["final_response"]
+    return elapsed
+
+def test_concurrent_throughput_blocking_vs_async(monkeypatch):
+    """
+    Runs the same burst of sessions through the graph with a blocking and a
+    non-blocking stub LLM. Blocking calls serialize on the event loop, so the
+    burst takes ~n * latency; awaited calls overlap and take ~1 * latency.
+    """
+    monkeypatch.setattr(nodes, "llm", SlowBlockingLLM())
+    blocking_elapsed = asyncio.run(run_sessions(CONCURRENT_SESSIONS))
+
+    monkeypatch.setattr(nodes, "llm", SlowAsyncLLM())
+    async_elapsed = asyncio.run(run_sessions(CONCURRENT_SESSIONS))
+
+    blocking_throughput = CONCURRENT_SESSIONS / blocking_elapsed
+    async_throughput = CONCURRENT_SESSIONS / async_elapsed
+    assert blocking_elapsed >= CONCURRENT_SESSIONS * LLM_LATENCY
+    assert async_throughput / blocking_throughput > 4
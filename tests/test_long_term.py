@@ -0,0 +1,264 @@
+import asyncio
+import json
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event, func, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src.memory import long_term
+from src.memory.long_term import (
+    Base,
+    ConversationRecord,
+    ConversationRecordBuffer,
+    fetch_analytics_summary,
+    fetch_conversation_records,
+    refresh_rollups,
+    stream_conversation_records,
+)
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    """
+    A file-backed SQLite database with the long-term tables, plus a log of executed INSERTs.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'records.db'}")
+    inserts = []
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def log_insert(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT"):
+            inserts.append(statement)
+
+    async def create():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create())
+    yield async_sessionmaker(bind=engine, expire_on_commit=False), inserts
+    asyncio.run(engine.dispose())
+
+async def count_records(session_factory):
+    async with session_factory() as session:
+        return await session.scalar(select(func.count()).select_from(ConversationRecord))
+
+def test_buffer_writes_batches_with_one_insert(sqlite_db):
+    """
+    Tests that a full batch is written by the background flusher as one multi-row INSERT.
+    """
+    session_factory, inserts = sqlite_db
+
+    async def scenario():
+        buffer = ConversationRecordBuffer(session_factory, batch_size=5, flush_interval_ms=10000)
+        buffer.start()
+        for i in range(5):
+            await buffer.add(f"s{i}", "hello", "hi there", "ANSWERED")
+        for _ in range(100):
+            if buffer.depth == 0:
+                break
+            await asyncio.sleep(0.01)
+        written = await count_records(session_factory)
+        await buffer.stop()
+        return buffer.stats(), written
+
+    stats, written = asyncio.run(scenario())
+    assert written == 5
+    assert len(inserts) == 1
+    assert stats == {"depth": 0, "flushed": 5, "batches": 1, "failed_flushes": 0, "dropped": 0, "dead_lettered": 0}
+
+def test_buffer_flushes_on_interval_and_on_stop(sqlite_db):
+    """
+    Tests that a partial batch is written after the flush interval and the rest on shutdown.
+    """
+    session_factory, _ = sqlite_db
+
+    async def scenario():
+        buffer = ConversationRecordBuffer(session_factory, batch_size=100, flush_interval_ms=20)
+        buffer.start()
+        await buffer.add("s1", "hello", "hi there")
+        await asyncio.sleep(0.2)
+        after_interval = await count_records(session_factory)
+        await buffer.add("s1", "bye", "goodbye")
+        await buffer.stop()
+        return after_interval, await count_records(session_factory)
+
+    assert asyncio.run(scenario()) == (1, 2)
+
+def test_buffer_applies_backpressure_while_db_is_down(sqlite_db, monkeypatch):
+    """
+    Tests that a full buffer makes callers wait briefly and that records survive failed flushes.
+    """
+    session_factory, _ = sqlite_db
+    calls = {"fail": True}
+
+    def flaky_factory():
+        if calls["fail"]:
+            raise ConnectionError("database unavailable")
+        return session_factory()
+
+    async def scenario():
+        buffer = ConversationRecordBuffer(
+            flaky_factory, batch_size=2, flush_interval_ms=10, max_pending=2, add_timeout_ms=2000, max_flush_attempts=1000,
+        )
+        buffer.start()
+        await buffer.add("s1", "one", "1")
+        await buffer.add("s1", "two", "2")
+        blocked = asyncio.create_task(buffer.add("s1", "three", "3"))
+        await asyncio.sleep(0.1)
+        was_blocked = not blocked.done()
+        failed = buffer.failed_flushes
+        calls["fail"] = False
+        await asyncio.wait_for(blocked, timeout=1)
+        await buffer.stop()
+        return was_blocked, failed, await count_records(session_factory)
+
+    was_blocked, failed, written = asyncio.run(scenario())
+    assert was_blocked
+    assert failed > 0
+    assert written == 3
+
+def test_full_buffer_drops_records_instead_of_blocking(sqlite_db, tmp_path):
+    """
+    Tests that with the DB down a full buffer drops new records after the add timeout, that a
+    batch failing every flush is dead-lettered, and that stop() does not raise.
+    """
+    def down():
+        raise ConnectionError("database unavailable")
+
+    dead_letters = tmp_path / "dead.jsonl"
+
+    async def scenario():
+        buffer = ConversationRecordBuffer(
+            down, batch_size=2, flush_interval_ms=10000, max_pending=3, add_timeout_ms=10,
+            max_flush_attempts=2, dead_letter_path=str(dead_letters),
+        )
+        for i in range(4):
+            await asyncio.wait_for(buffer.add("s1", f"q{i}", "a"), timeout=1)
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                await buffer.flush()
+        await buffer.stop(timeout=1)
+        return buffer.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["dropped"] == 1
+    assert stats["dead_lettered"] == 3 and stats["depth"] == 0
+    assert [json.loads(line)["user_query"] for line in dead_letters.read_text().splitlines()] == ["q0", "q1", "q2"]
+
+def insert_records(session_factory, rows):
+    async def insert():
+        async with session_factory() as session:
+            session.add_all([ConversationRecord(user_query="q", agent_response="a", **row) for row in rows])
+            await session.commit()
+    asyncio.run(insert())
+
+def sample_rows():
+    # Two days of turns; every third one escalated, the rest satisfied. Timestamps collide in pairs.
+    day_one = datetime(2024, 5, 1, 9, 0)
+    return [
+        {
+            "session_id": f"s{i % 4}",
+            "final_status": "ESCALATED" if i % 3 == 0 else "SATISFIED",
+            "intent": "PO" if i % 2 else "NON_PO",
+            "latency_ms": 100 * (i + 1),
+            "created_at": day_one + timedelta(hours=i // 2 * 6),
+        }
+        for i in range(12)
+    ]
+
+def test_keyset_pages_cover_every_record_once(sqlite_db):
+    """
+    Tests that following next_cursor walks all records in (created_at, id) order, including ties.
+    """
+    session_factory, _ = sqlite_db
+    insert_records(session_factory, sample_rows())
+
+    async def walk():
+        ids, cursor = [], None
+        while True:
+            page, cursor = await fetch_conversation_records(cursor=cursor, limit=5, session_factory=session_factory)
+            ids.extend(record["id"] for record in page)
+            if cursor is None:
+                return ids
+
+    assert asyncio.run(walk()) == list(range(1, 13))
+
+def test_filters_and_ndjson_stream(sqlite_db):
+    """
+    Tests the final_status and time-range filters and that the stream yields the same rows.
+    """
+    session_factory, _ = sqlite_db
+    insert_records(session_factory, sample_rows())
+    filters = {"final_status": "ESCALATED", "start": datetime(2024, 5, 1, 12), "end": datetime(2024, 5, 2, 12)}
+
+    async def scenario():
+        page, cursor = await fetch_conversation_records(**filters, session_factory=session_factory)
+        streamed = [record async for record in stream_conversation_records(**filters, session_factory=session_factory)]
+        return page, cursor, streamed
+
+    page, cursor, streamed = asyncio.run(scenario())
+    assert [record["id"] for record in page] == [4, 7, 10]
+    assert cursor is None
+    assert streamed == page
+
+def test_rollups_only_process_new_records(sqlite_db):
+    """
+    Tests that refreshes fold in new ids only and the summary reads rates and percentiles from the rollups.
+    """
+    session_factory, _ = sqlite_db
+    rows = sample_rows()
+    insert_records(session_factory, rows[:8])
+
+    async def scenario():
+        first = await refresh_rollups(session_factory, batch_size=3, safety_lag_seconds=0)
+        again = await refresh_rollups(session_factory, safety_lag_seconds=0)
+        return first, again
+
+    assert asyncio.run(scenario()) == (8, 0)
+    insert_records(session_factory, rows[8:])
+
+    async def summarize():
+        folded = await refresh_rollups(session_factory, safety_lag_seconds=0)
+        return folded, await fetch_analytics_summary(session_factory=session_factory)
+
+    folded, summary = asyncio.run(summarize())
+    assert folded == 4
+    assert summary["turns"] == 12
+    assert summary["by_final_status"] == {"ESCALATED": 4, "SATISFIED": 8}
+    assert summary["escalation_rate"] == 4 / 12
+    assert summary["latency_ms"] == {"p50": 1000, "p95": 2500, "p99": 2500}
+    assert {row["day"] for row in summary["daily"]} == {"2024-05-01", "2024-05-02"}
+
+    async def one_day():
+        return await fetch_analytics_summary(start_day=date(2024, 5, 2), session_factory=session_factory)
+
+    assert asyncio.run(one_day())["turns"] == 6
+
+def test_rollups_wait_for_recently_inserted_records(sqlite_db):
+    """
+    Tests that a refresh stops at a record younger than the safety lag, so a lower id that commits
+    late is not skipped by the checkpoint, and folds it once the lag has passed.
+    """
+    session_factory, _ = sqlite_db
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    rows = sample_rows()[:3]
+    for row, inserted_at in zip(rows, [now - timedelta(hours=1), now - timedelta(seconds=30), now - timedelta(hours=1)]):
+        row["inserted_at"] = inserted_at
+    insert_records(session_factory, rows)
+
+    async def scenario():
+        first = await refresh_rollups(session_factory, safety_lag_seconds=60)
+        later = await refresh_rollups(session_factory, safety_lag_seconds=10)
+        return first, later
+
+    assert asyncio.run(scenario()) == (1, 2)
+
+def test_rollup_cutoff_is_compared_in_the_database_on_postgres():
+    """
+    Tests that on Postgres, where now() is timezone-aware, the safety-lag cutoff is computed and
+    compared in SQL against the server-default inserted_at instead of in Python.
+    """
+    compiled = long_term._settled("postgresql", timedelta(seconds=60)).compile(dialect=postgresql.dialect())
+    assert "conversation_records.inserted_at <= now() - " in str(compiled)
+    assert list(compiled.params.values()) == [timedelta(seconds=60)]
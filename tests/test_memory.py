@@ -0,0 +1,91 @@
+import asyncio
+
+import fakeredis
+import pytest
+from fakeredis.aioredis import FakeAsyncRedisConnection
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.memory import short_term
+from src.memory.codec import ZSTD, decode_message, encode_message
+from src.memory.short_term import (
+    RedisConversationHistory,
+    get_history_for_session,
+    get_redis_client,
+    append_messages_for_session,
+)
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    """
+    Installs a process-wide pool backed by an in-memory fake Redis server.
+    """
+    monkeypatch.setattr(short_term, "_pool", None)
+    pool = short_term.init_redis_pool(
+        connection_class=FakeAsyncRedisConnection,
+        server=fakeredis.FakeServer(),
+        max_connections=5,
+    )
+    yield pool
+    asyncio.run(short_term.close_redis_pool())
+
+def test_history_round_trip_sets_ttl(fake_pool):
+    """
+    Tests that a saved history can be read back and that the key carries the session TTL.
+    """
+    async def scenario():
+        history = [HumanMessage(content="hi"), AIMessage(content="Hello!")]
+        await append_messages_for_session("s1", history)
+        loaded = await get_history_for_session("s1")
+        ttl = await get_redis_client().ttl(RedisConversationHistory("s1").key)
+        return loaded, ttl
+
+    loaded, ttl = asyncio.run(scenario())
+    assert [m.content for m in loaded] == ["hi", "Hello!"]
+    assert 0 < ttl <= short_term.settings.redis_session_ttl_seconds
+
+def test_connection_count_stays_flat_under_load(fake_pool):
+    """
+    Tests that many concurrent turns reuse the shared pool instead of opening a connection each.
+    """
+    async def turn(i: int):
+        session_id = f"s{i % 10}"
+        await get_history_for_session(session_id)
+        await append_messages_for_session(session_id, [HumanMessage(content=f"message {i}")])
+
+    async def scenario():
+        await asyncio.gather(*[turn(i) for i in range(200)])
+        return len(fake_pool._available_connections) + len(fake_pool._in_use_connections)
+
+    assert 0 < asyncio.run(scenario()) <= 5
+
+def test_history_is_trimmed_and_read_as_a_bounded_window(fake_pool, monkeypatch):
+    """
+    Tests that appends trim the stored list and reads only return the tail window.
+    """
+    monkeypatch.setattr(short_term.settings, "redis_history_max_messages", 6)
+    monkeypatch.setattr(short_term.settings, "redis_history_window", 4)
+
+    async def scenario():
+        for turn in range(5):
+            await append_messages_for_session("s1", [
+                HumanMessage(content=f"q{turn}"),
+                AIMessage(content=f"a{turn}"),
+            ])
+        stored = await get_redis_client().llen(RedisConversationHistory("s1").key)
+        return stored, await get_history_for_session("s1")
+
+    stored, window = asyncio.run(scenario())
+    assert stored == 6
+    assert [m.content for m in window] == ["q3", "a3", "q4", "a4"]
+
+def test_message_codec_round_trips_message_types():
+    """
+    Tests that Human/AI messages keep their type and content, with and without compression.
+    """
+    table = "| Sr# | PO Number | Invoice Number | Status |\n" * 50
+    for message in [HumanMessage(content="hi"), AIMessage(content="Hello!"), AIMessage(content=table)]:
+        encoded = encode_message(message, compress_threshold=256)
+        decoded = decode_message(encoded)
+        assert type(decoded) is type(message)
+        assert decoded.content == message.content
+    assert encode_message(AIMessage(content=table), compress_threshold=256).startswith(ZSTD)
@@ -0,0 +1,99 @@
+import asyncio
+
+import fakeredis
+import pytest
+from fakeredis.aioredis import FakeRedis
+from langchain_core.messages import AIMessage
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from src.agents import nodes
+from src.agents.graph import workflow
+from src.agents.tools.ticket_outbox import TicketOutbox
+from src.core import telemetry
+from src.core.llm_cache import CachedLLM
+from src.memory.checkpoint import RedisCheckpointSaver
+
+@pytest.fixture(scope="module")
+def spans():
+    """
+    Installs the tracer provider once for the process, exporting into memory.
+    """
+    exporter = InMemorySpanExporter()
+    provider = telemetry.init_tracing(exporter=exporter)
+
+    def finished():
+        provider.force_flush()
+        collected = exporter.get_finished_spans()
+        exporter.clear()
+        return collected
+
+    finished()
+    return finished
+
+class TokenCountingLLM:
+    async def ainvoke(self, prompt, **kwargs):
+        return AIMessage(content="PO", usage_metadata={"input_tokens": 42, "output_tokens": 1, "total_tokens": 43})
+
+def test_graph_turn_emits_node_and_redis_spans(spans, monkeypatch):
+    """
+    Tests that each node run and each checkpoint read/write of a turn is a span tagged with the session hash.
+    """
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(nodes, "get_ticket_outbox", lambda: TicketOutbox(client=FakeRedis(server=server)))
+    app = workflow.compile(checkpointer=RedisCheckpointSaver(client=FakeRedis(server=server)))
+
+    async def scenario():
+        with telemetry.tracer.start_as_current_span("chat.turn"):
+            await app.ainvoke(
+                {"session_id": "s1", "user_query": "PO 4500012345 invoice 9000123", "conversation_history": []},
+                {"configurable": {"thread_id": "s1"}},
+            )
+
+    asyncio.run(scenario())
+    finished = spans()
+    names = [span.name for span in finished]
+    for node in ("identify_intent", "collect_and_validate_po_details", "call_sap_api", "ask_for_satisfaction"):
+        assert f"node.{node}" in names
+    assert "redis.checkpoint.put" in names
+    root = next(span for span in finished if span.name == "chat.turn")
+    sap_node = next(span for span in finished if span.name == "node.call_sap_api")
+    assert sap_node.context.trace_id == root.context.trace_id
+    assert sap_node.attributes["session.hash"] == telemetry.session_hash("s1")
+    assert "s1" not in sap_node.attributes.values()
+
+def test_llm_span_records_template_tokens_and_cache_hits(spans):
+    """
+    Tests that LLM spans carry the prompt template, token counts from the model and cache hits.
+    """
+    llm = CachedLLM(TokenCountingLLM(), model_name="test-model")
+
+    async def scenario():
+        await llm.ainvoke("Identify the intent: hi", prompt_type="intent_identification")
+        await llm.ainvoke("Identify the intent: hi", prompt_type="intent_identification")
+
+    asyncio.run(scenario())
+    miss, hit = [span for span in spans() if span.name == "llm.invoke"]
+    assert miss.attributes["llm.prompt_template"] == "intent_identification"
+    assert miss.attributes["llm.cache_hit"] is False
+    assert miss.attributes["llm.tokens.input"] == 42
+    assert hit.attributes["llm.cache_hit"] is True
+    assert "llm.tokens.input" not in hit.attributes
+
+def test_shutdown_flushes_and_closes_the_span_file(tmp_path, monkeypatch):
+    """
+    Tests that shutting tracing down writes the buffered spans and closes the file exporter's handle.
+    """
+    monkeypatch.setattr(telemetry, "_provider", None)
+    monkeypatch.setattr(telemetry.trace, "set_tracer_provider", lambda provider: None)  # keep the process-wide one
+    monkeypatch.setattr(telemetry.settings, "otel_exporter", "file")
+    monkeypatch.setattr(telemetry.settings, "otel_file_path", str(tmp_path / "spans.jsonl"))
+
+    provider = telemetry.init_tracing()
+    span_file = telemetry._span_file
+    with provider.get_tracer("test").start_as_current_span("chat.turn"):
+        pass
+    telemetry.shutdown_tracing()
+
+    assert span_file.closed and telemetry._span_file is None and telemetry._provider is None
+    assert '"name": "chat.turn"' in (tmp_path / "spans.jsonl").read_text()
+
@@ -0,0 +1,147 @@
+import asyncio
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from src.agents import nodes
+from src.agents.tools import ticket_outbox
+from src.agents.tools.ticket_outbox import TicketOutbox, ticket_idempotency_key
+from src.memory.short_term import get_history_for_session
+
+@pytest.fixture
+def servicenow_calls(monkeypatch):
+    """
+    Replaces the ServiceNow call with a recorder; set `failures` to make the first calls fail.
+    """
+    calls = {"tickets": [], "failures": 0}
+
+    async def fake_create(email, vendor_number, details, conversation, correlation_id=None):
+        if calls["failures"]:
+            calls["failures"] -= 1
+            raise RuntimeError("ServiceNow is down")
+        calls["tickets"].append(vendor_number)
+        return f"INC{len(calls['tickets']):07d}"
+
+    monkeypatch.setattr(ticket_outbox, "acreate_servicenow_ticket", fake_create)
+    monkeypatch.setattr(ticket_outbox.settings, "servicenow_outbox_retry_after_ms", 0)
+    return calls
+
+INVOICES = [{"po_number": "4500012345", "invoice_number": "INV1"}]
+
+def enqueue(outbox, session_id="s1", invoices=INVOICES):
+    return outbox.enqueue(session_id, "user@example.com", "V12345", "Not satisfied", "human: hi", invoices=invoices)
+
+def ticket_key(session_id="s1"):
+    return ticket_idempotency_key(session_id, "user@example.com", "V12345", INVOICES, "Not satisfied")
+
+def test_enqueue_is_immediate_and_idempotent(servicenow_calls):
+    """
+    Tests that enqueueing answers with a provisional reference and a repeated "No" is not queued twice.
+    """
+    async def scenario():
+        outbox = TicketOutbox(client=FakeRedis())
+        first = await enqueue(outbox)
+        second = await enqueue(outbox)
+        return first, second, await outbox.client.xlen(outbox.stream)
+
+    first, second, queued = asyncio.run(scenario())
+    assert first.reference.startswith("TKT-") and first.number is None
+    assert second.duplicate and second.reference == first.reference
+    assert queued == 1
+    assert servicenow_calls["tickets"] == []
+
+def test_different_escalations_in_one_session_get_their_own_tickets(servicenow_calls):
+    async def scenario():
+        outbox = TicketOutbox(client=FakeRedis())
+        first = await enqueue(outbox)
+        other = await enqueue(outbox, invoices=[{"acr_number": "ACR1", "invoice_document_date": "2024-03-01"}])
+        return first, other, await outbox.client.xlen(outbox.stream)
+
+    first, other, queued = asyncio.run(scenario())
+    assert not other.duplicate and other.reference != first.reference
+    assert queued == 2
+
+def test_worker_creates_ticket_and_writes_number_to_session(servicenow_calls):
+    """
+    Tests that a worker batch creates the ticket, acknowledges the job and posts the INC number to the session.
+    """
+    async def scenario():
+        client = FakeRedis()
+        outbox = TicketOutbox(client=client)
+        receipt = await enqueue(outbox)
+        await enqueue(outbox, session_id="s2")
+        processed = await outbox.process_batch("worker-0")
+        again = await enqueue(outbox)
+        history = await get_history_for_session("s1", client=client)
+        ticket = await outbox.get_ticket(ticket_key())
+        return receipt, processed, again, history, ticket, await client.xlen(outbox.stream)
+
+    receipt, processed, again, history, ticket, remaining = asyncio.run(scenario())
+    assert processed == 2
+    assert len(servicenow_calls["tickets"]) == 2
+    assert ticket["status"] == "created"
+    assert again.number == ticket["number"]
+    assert history[-1].content == f"Your ServiceNow ticket {receipt.reference} has been created as {ticket['number']}."
+    assert remaining == 0
+
+def test_failed_ticket_is_retried_once_idle(servicenow_calls):
+    """
+    Tests that a failed job stays pending and a later batch retries it, creating exactly one ticket.
+    """
+    servicenow_calls["failures"] = 1
+
+    async def scenario():
+        outbox = TicketOutbox(client=FakeRedis())
+        await enqueue(outbox)
+        await outbox.process_batch("worker-0")
+        assert servicenow_calls["tickets"] == []
+        await outbox.process_batch("worker-1")
+        await outbox.process_batch("worker-1")
+        return await outbox.get_ticket(ticket_key())
+
+    ticket = asyncio.run(scenario())
+    assert ticket["status"] == "created"
+    assert ticket["attempts"] == "1"
+    assert servicenow_calls["tickets"] == ["V12345"]
+
+def test_failed_ticket_is_queued_again_when_asked_again(servicenow_calls, monkeypatch):
+    """
+    Tests that asking again after a ticket failed for good re-queues it instead of reporting it as in progress.
+    """
+    monkeypatch.setattr(ticket_outbox.settings, "servicenow_outbox_max_attempts", 1)
+    servicenow_calls["failures"] = 1
+
+    async def scenario():
+        outbox = TicketOutbox(client=FakeRedis())
+        first = await enqueue(outbox)
+        await outbox.process_batch("worker-0")
+        failed = await outbox.get_ticket(ticket_key())
+        again = await enqueue(outbox)
+        await outbox.process_batch("worker-0")
+        return first, failed, again, await outbox.get_ticket(ticket_key())
+
+    first, failed, again, ticket = asyncio.run(scenario())
+    assert failed["status"] == "failed"
+    assert not again.duplicate and again.reference == first.reference
+    assert ticket["status"] == "created" and ticket["attempts"] == "0"
+    assert servicenow_calls["tickets"] == ["V12345"]
+
+def test_ticket_node_returns_provisional_reference(servicenow_calls, monkeypatch):
+    """
+    Tests that the graph node answers without waiting for ServiceNow and repeated "No" answers share one job.
+    """
+    outbox = TicketOutbox(client=FakeRedis())
+    monkeypatch.setattr(nodes, "get_ticket_outbox", lambda: outbox)
+    state = {"session_id": "s1", "email_id": "user@example.com", "vendor_number": "V12345", "conversation_history": []}
+
+    async def scenario():
+        first = await nodes.create_servicenow_ticket_node(dict(state))
+        second = await nodes.create_servicenow_ticket_node(dict(state))
+        return first, second, await outbox.client.xlen(outbox.stream)
+
+    first, second, queued = asyncio.run(scenario())
+    assert first["service_now_ticket"] == second["service_now_ticket"]
+    assert first["service_now_ticket"].startswith("TKT-")
+    assert "already being created" in second["final_response"]
+    assert queued == 1
+    assert servicenow_calls["tickets"] == []
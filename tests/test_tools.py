@@ -1,6 +1,18 @@
+import asyncio
+import time
+
+import httpx
 import pytest
-from src.agents.tools.sap_api import get_invoice_status_from_sap
-from src.agents.tools.servicenow_api import create_servicenow_ticket
+from src.agents import nodes
+from src.core import http, resilience
+from src.core.metrics import invoice_status_cache_lookups
+from src.core.resilience import CircuitBreaker, LatencyTracker, deadline_scope
+from src.agents.tools.invoice_status_cache import CachedInvoiceStatusLookup
+from src.agents.tools.mock_sap import create_mock_sap_app
+from src.agents.tools.mock_servicenow import create_mock_servicenow_app
+from src.agents.tools import sap_api
+from src.agents.tools.sap_api import SAPInvoiceStatusClient, SAPUnavailableError, aget_invoice_status_from_sap, get_invoice_status_from_sap
+from src.agents.tools.servicenow_api import acreate_servicenow_ticket, create_servicenow_ticket
 
 def test_sap_api_po_success():
     """
@@ -46,3 +58,300 @@ def test_servicenow_ticket_creation():
     )
     assert "INC" in ticket_number
     assert len(ticket_number) > 5
+
+def make_sap_client(latency_seconds=0.0, mock_options=None, **kwargs):
+    mock_sap = create_mock_sap_app(latency_seconds=latency_seconds, max_batch_size=10, **(mock_options or {}))
+    http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=mock_sap), base_url="http://sap.test")
+    return SAPInvoiceStatusClient(http_client, batch_size=10, **kwargs), mock_sap
+
+def test_sap_batched_lookup_keeps_order_and_reports_not_found():
+    """
+    Tests that a 50-invoice Non-PO lookup is chunked, keeps input order and marks missing invoices.
+    """
+    client, mock_sap = make_sap_client(max_concurrency=5)
+    invoices = [
+        {"acr_number": f"NF{i}" if i % 7 == 0 else f"ACR{i:03d}", "invoice_document_date": "2023-10-27"}
+        for i in range(50)
+    ]
+    rows = asyncio.run(client.get_invoice_statuses("NON_PO", invoices))
+    assert mock_sap.state.requests == 5
+    assert [row["acr_number"] for row in rows] == [invoice["acr_number"] for invoice in invoices]
+    assert rows[0]["status_code"] == "NOT_FOUND"
+    assert rows[1]["status_code"] == "PENDING_APPROVAL"
+
+def test_sap_batched_lookup_runs_chunks_concurrently():
+    """
+    Tests that 50 invoices take about one SAP round trip instead of one per chunk.
+    """
+    latency = 0.1
+    client, _ = make_sap_client(latency_seconds=latency, max_concurrency=5)
+    invoices = [{"po_number": "4500012345", "invoice_number": f"INV{i}"} for i in range(50)]
+    started = time.perf_counter()
+    rows = asyncio.run(client.get_invoice_statuses("PO", invoices))
+    assert len(rows) == 50
+    assert time.perf_counter() - started < 2.5 * latency
+
+@pytest.fixture
+def fake_integrations(monkeypatch):
+    """
+    Points the shared integration clients at in-process fake SAP and ServiceNow apps.
+    """
+    monkeypatch.setattr(http.settings, "sap_api_url", "http://sap.test")
+    monkeypatch.setattr(http.settings, "servicenow_instance_url", "http://servicenow.test")
+    monkeypatch.setattr(http, "_clients", None)
+    mock_sap, mock_servicenow = create_mock_sap_app(), create_mock_servicenow_app()
+    clients = http.init_http_clients(transports={
+        "sap": httpx.ASGITransport(app=mock_sap),
+        "servicenow": httpx.ASGITransport(app=mock_servicenow),
+    })
+    yield clients, mock_sap, mock_servicenow
+    asyncio.run(http.close_http_clients())
+
+def test_integrations_share_one_pooled_client(fake_integrations):
+    """
+    Tests that SAP and ServiceNow calls go through the process-wide clients created at startup.
+    """
+    clients, mock_sap, mock_servicenow = fake_integrations
+
+    async def scenario():
+        status = await aget_invoice_status_from_sap({"type": "PO", "invoices": [{"po_number": "4500012345", "invoice_number": "INV1"}]})
+        ticket = await acreate_servicenow_ticket("test@example.com", "V987", "Test details", "User: Hello")
+        return status, ticket
+
+    status, ticket = asyncio.run(scenario())
+    assert http.get_http_clients() is clients
+    assert status["invoice_details"][0]["status_code"] == "PAID"
+    assert mock_sap.state.requests == 1
+    assert ticket == "INC0012345"
+    assert mock_servicenow.state.incidents[0]["u_vendor_number"] == "V987"
+
+def test_servicenow_ticket_with_correlation_id_is_created_once(fake_integrations):
+    """
+    Tests that a retried create with the same correlation id returns the existing incident.
+    """
+    _, _, mock_servicenow = fake_integrations
+
+    async def scenario():
+        first = await acreate_servicenow_ticket("test@example.com", "V987", "Test details", "User: Hello", correlation_id="job-1")
+        retried = await acreate_servicenow_ticket("test@example.com", "V987", "Test details", "User: Hello", correlation_id="job-1")
+        return first, retried
+
+    first, retried = asyncio.run(scenario())
+    assert first == retried
+    assert len(mock_servicenow.state.incidents) == 1
+
+def test_status_cache_fetches_only_misses_and_coalesces():
+    """
+    Tests that cached rows skip SAP, concurrent lookups share one request and TTLs follow status_code.
+    """
+    client, mock_sap = make_sap_client(latency_seconds=0.05, max_concurrency=5)
+    lookup = CachedInvoiceStatusLookup(client)
+    first = [{"po_number": "4500012345", "invoice_number": f"INV{i}"} for i in range(3)]
+    second = first[1:] + [{"po_number": "4500012345", "invoice_number": "INV9"}]
+    lookups = {result: invoice_status_cache_lookups.labels("PO", result) for result in ("hit", "miss", "coalesced")}
+    before = {result: child.value for result, child in lookups.items()}
+
+    async def scenario():
+        # Two sessions ask for the same invoices at the same time.
+        await asyncio.gather(lookup.get_invoice_statuses("PO", first), lookup.get_invoice_statuses("PO", first))
+        return await lookup.get_invoice_statuses("PO", second)
+
+    rows = asyncio.run(scenario())
+    assert [row["invoice_number"] for row in rows] == ["INV1", "INV2", "INV9"]
+    assert mock_sap.state.requests == 2  # one shared batch, then only INV9
+    assert {result: child.value - before[result] for result, child in lookups.items()} == {"hit": 2, "miss": 4, "coalesced": 3}
+    assert lookup._ttl({"status_code": "PAID"}) > lookup._ttl({"status_code": "PENDING_APPROVAL"})
+
+def test_status_cache_cancelled_caller_does_not_fail_coalesced_waiters():
+    """
+    Tests that cancelling the session that started a SAP lookup leaves the sessions waiting on it served.
+    """
+    client, mock_sap = make_sap_client(latency_seconds=0.05, max_concurrency=5)
+    lookup = CachedInvoiceStatusLookup(client)
+    invoices = one_invoice()
+
+    async def scenario():
+        owner = asyncio.ensure_future(lookup.get_invoice_statuses("PO", invoices))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(lookup.get_invoice_statuses("PO", invoices))
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        rows = await waiter
+        return owner, rows, await lookup.get_invoice_statuses("PO", invoices)
+
+    owner, rows, cached = asyncio.run(scenario())
+    assert owner.cancelled()
+    assert rows[0]["status_code"] == cached[0]["status_code"] == "PAID"
+    assert mock_sap.state.requests == 1
+    assert lookup._in_flight == {}
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(sap_api.settings, "sap_retry_backoff_seconds", 0.001)
+
+def one_invoice(i=0):
+    return [{"po_number": "4500012345", "invoice_number": f"INV{i}"}]
+
+def test_sap_retries_recover_from_transient_errors(fast_retries):
+    """
+    Tests that jittered retries turn a 20% SAP error rate into successful lookups.
+    """
+    client, mock_sap = make_sap_client(
+        mock_options={"error_rate": 0.2, "seed": 7},
+        breaker=CircuitBreaker(failure_threshold=1.0),
+    )
+
+    async def scenario():
+        return [await client.get_invoice_statuses("PO", one_invoice(i)) for i in range(20)]
+
+    results = asyncio.run(scenario())
+    assert all(rows[0]["status_code"] == "PAID" for rows in results)
+    assert mock_sap.state.requests > 20
+
+def test_sap_circuit_breaker_fails_fast_when_sap_is_down(fast_retries):
+    """
+    Tests that the breaker opens after repeated failures and then rejects calls without touching SAP.
+    """
+    breaker = CircuitBreaker(failure_threshold=0.5, window=6, min_calls=6, reset_timeout=60)
+    client, mock_sap = make_sap_client(mock_options={"error_rate": 1.0}, breaker=breaker)
+
+    async def lookup():
+        with pytest.raises(SAPUnavailableError):
+            await client.get_invoice_statuses("PO", one_invoice())
+
+    async def scenario():
+        for _ in range(5):
+            await lookup()
+
+    asyncio.run(scenario())
+    assert breaker.state == "open"
+    assert mock_sap.state.requests == 6
+    assert breaker.rejected == 3
+
+@pytest.mark.parametrize("body", [b"<html>Gateway maintenance</html>", b'["PAID"]', b'{"invoice_details": "PAID"}'])
+def test_sap_unreadable_response_is_an_outage(fast_retries, monkeypatch, body):
+    """
+    Tests that a non-JSON or non-object SAP body is retried, counted as a breaker failure and
+    reported as SAPUnavailableError instead of escaping as a parse error.
+    """
+    monkeypatch.setattr(sap_api.settings, "sap_max_retries", 1)
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, content=body, headers={"content-type": "application/json"})
+
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://sap.test")
+    breaker = CircuitBreaker(failure_threshold=0.5, window=2, min_calls=2, reset_timeout=60)
+    client = SAPInvoiceStatusClient(http_client, breaker=breaker)
+
+    async def scenario():
+        await client.get_invoice_statuses("PO", one_invoice())
+
+    with pytest.raises(SAPUnavailableError):
+        asyncio.run(scenario())
+    assert len(requests) == 2
+    assert breaker.state == "open"
+
+def test_sap_circuit_breaker_closes_after_successful_probe():
+    """
+    Tests that once the cool-down ends a single probe goes through and its success closes the breaker.
+    """
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=0.5, window=2, min_calls=2, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    now[0] = 11.0
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+def test_sap_hedges_slow_requests():
+    """
+    Tests that a request slower than the tracked p95 gets a hedged duplicate.
+    """
+    client, mock_sap = make_sap_client(mock_options={"slow_latency_seconds": 0.2})
+    client.latency = LatencyTracker(min_samples=5)
+
+    async def scenario():
+        for i in range(5):
+            await client.get_invoice_statuses("PO", one_invoice(i))
+        mock_sap.state.slow_rate = 1.0
+        return await client.get_invoice_statuses("PO", one_invoice(99))
+
+    rows = asyncio.run(scenario())
+    assert rows[0]["status_code"] == "PAID"
+    assert mock_sap.state.requests == 7  # five warm-up calls, the slow call and its hedge
+
+def test_sap_hedge_needs_a_free_concurrency_slot():
+    """
+    Tests that no hedge is sent while every SAP concurrency slot is taken.
+    """
+    client, mock_sap = make_sap_client(mock_options={"slow_latency_seconds": 0.2}, max_concurrency=1)
+    client.latency = LatencyTracker(min_samples=5)
+
+    async def scenario():
+        for i in range(5):
+            await client.get_invoice_statuses("PO", one_invoice(i))
+        mock_sap.state.slow_rate = 1.0
+        return await client.get_invoice_statuses("PO", one_invoice(99))
+
+    rows = asyncio.run(scenario())
+    assert rows[0]["status_code"] == "PAID"
+    assert mock_sap.state.requests == 6
+
+def test_cancelled_hedged_call_cancels_both_attempts():
+    """
+    Tests that cancelling the caller while the primary and the hedge race cancels both and frees the slot.
+    """
+    cancelled = []
+    slot = asyncio.Semaphore(1)
+
+    async def attempt():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def scenario():
+        call = asyncio.ensure_future(resilience._hedged(attempt, 0.01, slot))
+        await asyncio.sleep(0.05)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        await asyncio.sleep(0)
+        return slot.locked()
+
+    assert asyncio.run(scenario()) is False
+    assert cancelled == [True, True]
+
+def test_sap_lookup_respects_request_deadline():
+    """
+    Tests that a hanging SAP call is abandoned when the request deadline passes.
+    """
+    client, _ = make_sap_client(mock_options={"slow_rate": 1.0, "slow_latency_seconds": 5.0})
+
+    async def scenario():
+        with deadline_scope(0.1):
+            await client.get_invoice_statuses("PO", one_invoice())
+
+    started = time.perf_counter()
+    with pytest.raises(SAPUnavailableError):
+        asyncio.run(scenario())
+    assert time.perf_counter() - started < 1.0
+
+def test_sap_outage_gives_try_later_message(monkeypatch):
+    """
+    Tests that the graph nodes turn an SAP outage into a "try again later" answer.
+    """
+    async def unavailable(payload, on_row=None):
+        raise SAPUnavailableError("circuit open")
+
+    monkeypatch.setattr(nodes, "aget_invoice_status_from_sap", unavailable)
+    state = asyncio.run(nodes.call_sap_api_node({"json_payload": {"type": "PO", "invoices": one_invoice()}}))
+    assert state["api_response"] is None
+    state = nodes.handle_invoice_not_found_node(state)
+    assert "try again in a few minutes" in state["final_response"]
@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src import main
+from src.core import traffic
+from src.core.telemetry import session_hash
+from src.schemas.api import ChatRequest, ChatResponse
+
+def test_chat_turn_is_recorded_redacted_with_dependency_responses(tmp_path, monkeypatch):
+    """
+    Tests that the recorder middleware writes one redacted line per /chat request,
+    with the LLM and SAP responses of the turn, and passes the reply through unchanged.
+    """
+    recorder = traffic.TrafficRecorder(path=str(tmp_path / "traffic.jsonl"))
+    monkeypatch.setattr(main, "get_traffic_recorder", lambda: recorder)
+    monkeypatch.setattr(main, "redact_pii", lambda text: text.replace("jane@example.com", "<EMAIL>"))
+    app = FastAPI()
+    app.middleware("http")(main.record_chat_traffic)
+
+    @app.post("/chat")
+    async def chat(request: ChatRequest):
+        traffic.record_dependency("llm", "intent_identification", "PO for jane@example.com", 0.02)
+        traffic.record_dependency(
+            "sap", "invoice_status", [{"invoice_number": "INV1", "status_code": "PAID", "contact": "jane@example.com"}], 0.01,
+        )
+        return ChatResponse(response_message="Mail sent to jane@example.com", session_id=request.session_id)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    client = TestClient(app)
+    response = client.post("/chat", json={"session_id": "session-1", "message": "I am jane@example.com"})
+    assert response.status_code == 200
+    assert response.json()["response_message"] == "Mail sent to jane@example.com"
+    client.get("/health")
+    assert asyncio.run(recorder.flush()) == 1
+
+    lines = (tmp_path / "traffic.jsonl").read_text().splitlines()
+    assert len(lines) == 1
+    entry = json.loads(lines[0])
+    assert entry["session"] == session_hash("session-1")
+    assert entry["message"] == "I am <EMAIL>"
+    assert entry["response"] == "Mail sent to <EMAIL>"
+    assert entry["status"] == 200
+    assert [(call["kind"], call["operation"]) for call in entry["dependencies"]] == [
+        ("llm", "intent_identification"), ("sap", "invoice_status"),
+    ]
+    assert entry["dependencies"][0]["response"] == "PO for <EMAIL>"
+    assert entry["dependencies"][1]["response"] == [{"invoice_number": "INV1", "status_code": "PAID", "contact": "<EMAIL>"}]
+    assert entry["dependencies"][1]["duration_ms"] == 10.0
+    assert "jane@example.com" not in lines[0]
+
+def test_non_object_chat_body_is_rejected_not_crashed(tmp_path, monkeypatch):
+    """
+    Tests that with recording on, a JSON body that is not an object still gets the 422 from validation.
+    """
+    recorder = traffic.TrafficRecorder(path=str(tmp_path / "traffic.jsonl"))
+    monkeypatch.setattr(main, "get_traffic_recorder", lambda: recorder)
+    monkeypatch.setattr(main, "redact_pii", lambda text: text)
+    app = FastAPI()
+    app.middleware("http")(main.record_chat_traffic)
+
+    @app.post("/chat")
+    async def chat(request: ChatRequest):
+        return ChatResponse(response_message="ok", session_id=request.session_id)
+
+    client = TestClient(app)
+    for body in ([], "hi"):
+        assert client.post("/chat", json=body).status_code == 422
+    assert recorder.stats()["pending"] == 2
+
+def test_recorder_drops_instead_of_waiting_when_full(tmp_path):
+    """
+    Tests that dependency responses are only collected inside a capture and that
+    a full recorder drops turns rather than holding up the request.
+    """
+    traffic.record_dependency("llm", "intent_identification", "GREETING", 0.01)  # no capture: ignored
+    with traffic.capture_dependencies() as calls:
+        traffic.record_dependency("llm", "intent_identification", "GREETING", 0.01)
+    assert len(calls) == 1
+
+    recorder = traffic.TrafficRecorder(path=str(tmp_path / "traffic.jsonl"), max_pending=2)
+    for i in range(3):
+        recorder.record({"message": f"turn {i}"})
+    assert recorder.stats() == {"pending": 2, "written": 0, "dropped": 1}
+    asyncio.run(recorder.stop())
+    assert recorder.stats() == {"pending": 0, "written": 2, "dropped": 1}
+    assert len((tmp_path / "traffic.jsonl").read_text().splitlines()) == 2